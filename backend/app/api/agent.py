@@ -1,11 +1,27 @@
 import os
 import json
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Request
-from pydantic import BaseModel
-from typing import Optional, Any, Dict
-from app.auth import verify_jwt, supabase
-from .skills import skill_manager
+import re
+import math
+import base64
+import asyncio
+from datetime import datetime, date, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Any, Dict, List
+from app.auth import verify_jwt
+from app.storage import get_storage
+from app.ratelimit import SingleFlight, user_limiter, prefetch_limiter
+from app.idempotency import idempotency_store
+from app.state import offload
+from app.dialogue import dialogue_store, resolve_follow_up, summarize_state
+from app.batch import BatchPlan, BATCH_MAX
+from app.prefetch import PREFETCH_MIN_CHARS, prefetch_cache
+from app.routing import model_router, speculative_router
+from app.transfer import export_tasks, import_tasks
+from app.reminders import reminder_scheduler
+from .skills import skill_manager, normalize_utterance
 
 router = APIRouter(prefix="/agent", tags=["agent"])
 
@@ -22,36 +38,364 @@ class AgentResponse(BaseModel):
     action: str
     result: Dict[str, Any]
     message: str
+    history_cursor: Optional[str] = None
+    # Set when a daily token budget is spent and the reply came from keyword logic
+    budget_exhausted: bool = False
 
-def save_interaction(interaction_data: Dict[str, Any]):
+class PrefetchRequest(BaseModel):
+    utterance: str = Field(..., max_length=500)
+
+class BatchDispatchRequest(BaseModel):
+    utterances: List[str] = Field(..., min_length=1, max_length=BATCH_MAX)
+    lang: Optional[str] = "en"
+    voice: Optional[bool] = False
+
+class BatchItemResult(BaseModel):
+    index: int
+    utterance: str
+    action: str
+    result: Dict[str, Any]
+    message: str
+
+class BatchDispatchResponse(BaseModel):
+    results: List[BatchItemResult]
+    history_cursor: Optional[str] = None
+
+async def save_interaction(interaction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Persist a turn and return the stored row (id, created_at) so callers can hand out a history cursor."""
+    try:
+        # created_at drives history ordering and cursors; the database default is the source of truth
+        interaction_data.pop("timestamp", None)
+        return await get_storage().insert_interaction(interaction_data)
+    except Exception as e:
+        print(f"Error saving history: {e}")
+        return None
+
+async def save_interactions(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     try:
-        from app.auth import supabase_admin
-        # Ensure timestamp is set
-        if "timestamp" not in interaction_data:
-            interaction_data["timestamp"] = datetime.now().isoformat()
-            
-        supabase_admin.table("interactions").insert(interaction_data).execute()
+        return await get_storage().insert_interactions(rows)
     except Exception as e:
         print(f"Error saving history: {e}")
+        return []
+
+def tool_text(tool_res: Any) -> str:
+    """Plain text of an MCP tool result (FastMCP returns content blocks, newer versions with structured output)."""
+    if isinstance(tool_res, tuple):
+        tool_res = tool_res[0]
+    if isinstance(tool_res, str):
+        return tool_res
+    return "\n".join(getattr(block, "text", "") for block in tool_res)
+
+async def enforce_user_rate_limit(user_id: str):
+    allowed, retry_after = await user_limiter.acquire_async(user_id)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many commands at once. Please retry shortly.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+# Identical (user, utterance) dispatches already running are joined rather than repeated
+dispatch_flight = SingleFlight()
 
 @router.post("/dispatch", response_model=AgentResponse)
 async def dispatch_agent(
     request: AgentRequest,
-    user: dict = Depends(verify_jwt)
+    response: Response,
+    user: dict = Depends(verify_jwt),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     print(f"-------- DISPATCH AGENT CALL --------")
     utterance = request.utterance.strip()
     print(f"User: {user['user_id']} | Utterance: {utterance}")
     user_id = user["user_id"]
-    
+
+    async def run():
+        return (await dispatch_utterance(utterance, user_id)).model_dump()
+
+    payload = {"path": "dispatch", "utterance": utterance, "lang": request.lang, "voice": request.voice}
+    result, replayed = await idempotency_store.run(user_id, idempotency_key, payload, run)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def dispatch_utterance(utterance: str, user_id: str) -> AgentResponse:
+    """Rate-limited, coalesced dispatch of one utterance; shared by the HTTP and voice routes."""
+    flight_key = (user_id, normalize_utterance(utterance))
+    if dispatch_flight.in_flight(flight_key):
+        print(f"Coalescing duplicate dispatch for {user_id}")
+    else:
+        await enforce_user_rate_limit(user_id)
+    return await dispatch_flight.do(flight_key, lambda: _run_dispatch(utterance, user_id))
+
+@router.post("/prefetch", status_code=202)
+async def prefetch_agent(request: PrefetchRequest, user: dict = Depends(verify_jwt)):
+    """
+    Debounced draft of what the user is typing. Starts translation and intent extraction
+    in the background so a matching /dispatch can skip them; never mutates anything.
+    """
+    return {"status": await start_prefetch(request.utterance.strip(), user["user_id"])}
+
+@router.get("/prefetch/stats")
+async def prefetch_stats(user: dict = Depends(verify_jwt)):
+    """Speculation counters and dispatch hit rate for this worker."""
+    return prefetch_cache.report()
+
+@router.get("/models/stats")
+async def model_stats(user: dict = Depends(verify_jwt)):
+    """Per-model calls, tokens and latency on this worker, plus today's token budgets (real and speculative)."""
+    return {
+        "models": model_router.stats.report(),
+        "budget": model_router.budget.usage(user["user_id"]),
+        "prefetch_budget": speculative_router.budget.usage(user["user_id"])
+    }
+
+@router.post("/dispatch/batch", response_model=BatchDispatchResponse)
+async def dispatch_agent_batch(
+    request: BatchDispatchRequest,
+    response: Response,
+    user: dict = Depends(verify_jwt),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Replay utterances queued while offline, in order: one batched classification,
+    then one bulk write per operation type and one history insert.
+    """
+    user_id = user["user_id"]
+    utterances = [u.strip() for u in request.utterances]
+    print(f"-------- BATCH DISPATCH: {len(utterances)} utterances for {user_id} --------")
+
+    async def run():
+        # One token: the whole batch costs a single LLM call
+        await enforce_user_rate_limit(user_id)
+        return (await _run_dispatch_batch(utterances, user_id)).model_dump()
+
+    payload = {"path": "dispatch/batch", "utterances": utterances, "lang": request.lang, "voice": request.voice}
+    result, replayed = await idempotency_store.run(user_id, idempotency_key, payload, run)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+# Intents that read or change existing tasks, so the batch needs the user's task list
+BATCH_TASK_INTENTS = {"complete_task", "delete_task", "manage_timer", "list_tasks", "greeting", "search_tasks"}
+
+async def _run_dispatch_batch(utterances: List[str], user_id: str) -> BatchDispatchResponse:
+    from app.mcp_server import mcp, format_task_list, format_search_results
+
+    classified = await asyncio.to_thread(skill_manager.execute_skill, "intent_extractor_batch", {"utterances": utterances, "user_id": user_id})
+    print(f"Batch classified via {classified['source']}")
+
+    # 1. Resolve intents in order, carrying the dialogue state from item to item
+    pending = initial_pending = await dialogue_store.get_async(user_id)
+    resolved = []
+    for utterance, extraction in zip(utterances, classified["results"]):
+        is_urdu = extraction.get("detected_lang") == "ur"
+        intent_res = None
+        # Urdu answers need the translation the batched extraction already did
+        if pending and not is_urdu:
+            intent_res = follow_up_intent(pending, resolve_follow_up(pending, utterance))
+        if intent_res is None:
+            intent_res = merge_pending_slots(pending, extraction) if pending else extraction
+        intent = intent_res.get("intent")
+        slots = intent_res.get("slots") or {}
+
+        asks_for_item = intent == "clarify_add_task" or (intent in ("add_task", "create") and is_generic_item(slots.get("item")))
+        if asks_for_item:
+            pending = {"intent": "add_task", "missing": "item", "slots": {
+                "priority": slots.get("priority") or "medium",
+                "recurrence": slots.get("recurrence") or "none",
+                "due_date": slots.get("due_date")
+            }}
+        else:
+            pending = None
+        resolved.append((utterance, "clarify_add_task" if asks_for_item else intent, slots, is_urdu))
+
+    # 2. Apply in order against an in-memory view, then write the net effect
+    storage = get_storage()
+    needs_tasks = any(intent in BATCH_TASK_INTENTS for _, intent, _, _ in resolved)
+    # Oldest first, so among copies of one title the newer one wins
+    tasks = (await storage.list_tasks(user_id, newest_first=True))[::-1] if needs_tasks else []
+    plan = BatchPlan(tasks, user_id)
+    items = []
+    # Write steps each item depends on, to flag the items whose writes did not land
+    writes: Dict[int, set] = {}
+    # Timer RPCs run after the commit, so they see the batch's own changes
+    timers = []
+    for index, (utterance, intent, slots, is_urdu) in enumerate(resolved):
+        action, result = "clarify", {}
+        if intent in ("complete_task", "delete_task", "manage_timer"):
+            item = slots.get("item", "something")
+            matches = plan.matches(item)
+            if len(matches) > 1:
+                # Never guess between different tasks: ask which one was meant
+                action = "clarify_task"
+                result = {"task": item, "matches": [t["title"] for t in matches],
+                          "response": f"Several objectives match '{item}'. Which one did you mean?"}
+                items.append({"index": index, "utterance": utterance, "action": action, "result": result,
+                              "message": compose_message(action, result, is_urdu)})
+                continue
+        if intent in ("add_task", "create"):
+            item = slots.get("item")
+            priority = slots.get("priority") or "medium"
+            recurrence = slots.get("recurrence") or "none"
+            plan.add(item, priority, recurrence, slots.get("due_date"))
+            writes[index] = {"insert"}
+            action = "create"
+            result = {"task": item, "priority": priority, "recurrence": recurrence, "response": f"Objective '{item}' deployed."}
+        elif intent == "clarify_add_task":
+            action = "clarify_add_task"
+            result = {
+                "missing": "task_details",
+                "priority": slots.get("priority") or "medium",
+                "recurrence": slots.get("recurrence") or "none"
+            }
+        elif intent in ("list_tasks", "greeting"):
+            tasks = plan.visible()
+            action = "list" if intent == "list_tasks" else "greeting"
+            result = {"response": format_task_list(tasks) if tasks else "No current objectives in the archives."}
+        elif intent == "search_tasks":
+            query = (slots.get("query") or slots.get("item") or "").strip()
+            action = "search"
+            if plan.changed and query:
+                found = plan.search(query)
+                result = {"query": query, "response": format_search_results(query, found, len(found))}
+            else:
+                tool_res = await mcp.call_tool("search_todos", {"user_id": user_id, "query": query})
+                result = {"query": query, "response": tool_text(tool_res)}
+        elif intent in ("complete_task", "delete_task"):
+            item = slots.get("item", "something")
+            task = plan.find(item)
+            action = "update" if intent == "complete_task" else "delete"
+            if not task:
+                result = {"task": item, "response": f"Objective {item} not found in the archives."}
+            elif intent == "complete_task" and task["status"] == "completed":
+                # Replayed queues often repeat a completion; do not respawn twice
+                result = {"task": task["title"], "response": f"Objective '{task['title']}' was already completed."}
+            elif intent == "complete_task":
+                writes[index] = {"complete" if "id" in task else "insert"}
+                respawned = plan.complete(task)
+                if respawned:
+                    writes[index].add("insert")
+                result = {"task": task["title"], "response": f"Objective '{task['title']}' is marked as completed."}
+                if respawned:
+                    result["response"] += f" A new instance has been respawned for {respawned['due_date'][:10]}."
+            else:
+                if "id" in task:
+                    writes[index] = {"delete"}
+                plan.delete(task)
+                result = {"task": task["title"], "response": f"Objective '{task['title']}' eliminated from the archives."}
+        elif intent == "manage_timer":
+            item = slots.get("item", "something")
+            task = plan.find(item)
+            action_timer = slots.get("timer_action", "start")
+            action = "timer"
+            result = {"task": task["title"] if task else item, "timer_action": action_timer}
+            if not task:
+                result["response"] = f"Objective {item} not found in the archives."
+            elif "id" not in task:
+                # Created earlier in this batch: bulk inserts return no ids for the clock RPC
+                action = "clarify_timer"
+                result["response"] = f"Objective '{task['title']}' is not saved yet. Start its clock once it is on your list."
+            else:
+                timers.append((index, task["id"], action_timer))
+        items.append({"index": index, "utterance": utterance, "action": action, "result": result,
+                      "message": compose_message(action, result, is_urdu)})
+
+    counts = await plan.commit(storage)
+    print(f"Batch applied: {counts}")
+    by_index = {entry["index"]: entry for entry in items}
+    for index, task_id, action_timer in timers:
+        tool_res = await mcp.call_tool("manage_timer", {"task_id": task_id, "user_id": user_id, "action": action_timer})
+        by_index[index]["result"]["response"] = tool_text(tool_res)
+    failed = set(counts["failed"])
+    for entry in items:
+        if writes.get(entry["index"], set()) & failed:
+            entry["action"] = "save_failed"
+            entry["result"]["response"] = f"Objective '{entry['result'].get('task')}' could not be saved. Please try again."
+            entry["message"] = compose_message("save_failed", entry["result"], resolved[entry["index"]][3])
+
+    if pending:
+        await dialogue_store.set_async(user_id, pending["intent"], pending["slots"], missing=pending["missing"])
+    elif initial_pending:
+        await dialogue_store.clear_async(user_id)
+
+    # 3. History for the whole batch in one insert
+    saved = await save_interactions([
+        {"user_id": user_id, "utterance": i["utterance"], "action": i["action"], "agent_response": i["message"]}
+        for i in items
+    ])
+    return BatchDispatchResponse(
+        results=[BatchItemResult(**i) for i in items],
+        history_cursor=encode_history_cursor(saved[-1]) if saved else None
+    )
+
+def follow_up_intent(pending: Dict[str, Any], follow_up: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Intent settled locally from the pending dialogue state, or None when extraction is needed."""
+    if follow_up["kind"] == "fill":
+        return {"intent": follow_up["intent"], "slots": follow_up["slots"]}
+    if follow_up["kind"] == "reprompt":
+        return {"intent": "clarify_add_task", "slots": pending["slots"]}
+    if follow_up["kind"] == "cancel":
+        return {"intent": "greeting", "slots": {}}
+    return None
+
+def merge_pending_slots(pending: Dict[str, Any], intent_res: Dict[str, Any]) -> Dict[str, Any]:
+    if intent_res.get("intent") in ("add_task", "create"):
+        # Slots gathered in earlier turns fill whatever the follow-up did not restate
+        new_slots = {k: v for k, v in (intent_res.get("slots") or {}).items() if v}
+        intent_res["slots"] = {**pending["slots"], **new_slots}
+    return intent_res
+
+def is_generic_item(item: Optional[str]) -> bool:
+    return not item or item.lower() in ["something", "task", "todo", "it", ""]
+
+async def understand_utterance(utterance: str, user_id: str, pending: Optional[Dict[str, Any]],
+                               speculative: bool = False) -> Dict[str, Any]:
+    """Translation and intent extraction, shared by dispatch and speculative prefetch."""
+    # Skills block on LLM HTTP calls, so run them off the event loop
     # 1. Translation / Language Detection
-    trans_res = skill_manager.execute_skill("translator_urdu", {"utterance": utterance})
+    trans_res = await asyncio.to_thread(skill_manager.execute_skill, "translator_urdu", {"utterance": utterance, "user_id": user_id, "speculative": speculative})
     working_utterance = trans_res.get("utterance_en", utterance)
+    print(f"Working Utterance (EN): {working_utterance} | Is Urdu: {trans_res.get('detected_lang') == 'ur'}")
+
+    # 2. Intent Extraction, resolving against a pending follow-up question first
+    intent_res = None
+    extractor_inputs = {"utterance": working_utterance, "user_id": user_id, "speculative": speculative}
+    if pending:
+        follow_up = resolve_follow_up(pending, working_utterance)
+        print(f"Pending dialogue: {pending} -> {follow_up['kind']}")
+        intent_res = follow_up_intent(pending, follow_up)
+        if follow_up["kind"] == "llm":
+            extractor_inputs["context"] = summarize_state(pending)
+
+    if intent_res is None:
+        intent_res = await asyncio.to_thread(skill_manager.execute_skill, "intent_extractor", extractor_inputs)
+        if "context" in extractor_inputs:
+            intent_res = merge_pending_slots(pending, intent_res)
+    return {"translation": trans_res, "intent": intent_res}
+
+async def start_prefetch(utterance: str, user_id: str) -> str:
+    """Begin understanding a draft before it is sent; dispatch picks the result up if the text matches."""
+    if len(normalize_utterance(utterance)) < PREFETCH_MIN_CHARS:
+        return "skipped"
+    pending = await dialogue_store.get_async(user_id)
+    status = prefetch_cache.peek(user_id, utterance, pending)
+    if status:
+        return status
+    allowed, _ = await prefetch_limiter.acquire_async(user_id)
+    if not allowed:
+        return "throttled"
+    return prefetch_cache.start(user_id, utterance, pending, lambda: understand_utterance(utterance, user_id, pending, speculative=True))
+
+async def _run_dispatch(utterance: str, user_id: str) -> AgentResponse:
+    pending = await dialogue_store.get_async(user_id)
+    understood = await prefetch_cache.claim(user_id, utterance, pending)
+    if understood is None:
+        understood = await understand_utterance(utterance, user_id, pending)
+    else:
+        print(f"Prefetch hit for {user_id}")
+    trans_res, intent_res = understood["translation"], understood["intent"]
     is_urdu = trans_res.get("detected_lang") == "ur"
-    print(f"Working Utterance (EN): {working_utterance} | Is Urdu: {is_urdu}")
-    
-    # 2. Intent Extraction
-    intent_res = skill_manager.execute_skill("intent_extractor", {"utterance": working_utterance})
     intent = intent_res.get("intent")
     slots = intent_res.get("slots", {})
     print(f"Detected Intent: {intent} | Slots: {slots}")
@@ -68,7 +412,7 @@ async def dispatch_agent(
         recurrence = slots.get("recurrence") or "none"
         
         # Check if item is missing or too generic
-        if not item or item.lower() in ["something", "task", "todo", "it", ""]:
+        if is_generic_item(item):
             action = "clarify_add_task"
             result = {"missing": "task_details", "priority": priority, "recurrence": recurrence}
         else:
@@ -82,10 +426,26 @@ async def dispatch_agent(
             })
             action = "create"
             result = {"task": item, "priority": priority, "recurrence": recurrence, "response": tool_res}
+    elif intent == "clarify_add_task":
+        action = "clarify_add_task"
+        result = {
+            "missing": "task_details",
+            "priority": slots.get("priority") or "medium",
+            "recurrence": slots.get("recurrence") or "none"
+        }
     elif intent == "list_tasks":
         tool_res = await mcp.call_tool("list_todos", {"user_id": user_id})
         action = "list"
         result = {"items": [], "response": tool_res} 
+    elif intent == "search_tasks":
+        query = slots.get("query") or slots.get("item") or ""
+        tool_res = await mcp.call_tool("search_todos", {
+            "user_id": user_id,
+            "query": query,
+            "status": slots.get("status") if slots.get("status") in ("pending", "completed") else None
+        })
+        action = "search"
+        result = {"query": query, "response": tool_text(tool_res)}
     elif intent == "complete_task":
         item = slots.get("item", "something")
         tool_res = await mcp.call_tool("complete_todo", {"task_id": item, "user_id": user_id})
@@ -111,72 +471,206 @@ async def dispatch_agent(
         action = "clarify"
         result = {}
 
+    # Remember what we are waiting for, so the answer is resolved without a cold extraction
+    if action == "clarify_add_task":
+        await dialogue_store.set_async(user_id, "add_task", {
+            "priority": result.get("priority"),
+            "recurrence": result.get("recurrence"),
+            "due_date": slots.get("due_date")
+        }, missing="item")
+    elif pending:
+        await dialogue_store.clear_async(user_id)
+
     # 4. Agent Response Selection (Multilingual)
+    message = compose_message(action, result, is_urdu)
+
+    # 5. Save History
+    saved = await save_interaction({
+        "user_id": user_id,
+        "utterance": utterance,
+        "action": action,
+        "agent_response": message
+    })
+
+    budget = model_router.budget
+    return AgentResponse(
+        action=action,
+        result=result,
+        message=message,
+        history_cursor=encode_history_cursor(saved) if saved else None,
+        budget_exhausted=await offload(budget.backend, budget.exhausted, user_id)
+    )
+
+def compose_message(action: str, result: Dict[str, Any], is_urdu: bool) -> str:
+    """Agent reply for an action (Multilingual)."""
     if is_urdu:
         if action == "create":
-            message = f"اوکے جی، میں نے '{result.get('task')}' آپ کی لسٹ میں شامل کر دیا ہے۔ 🚀"
+            return f"اوکے جی، میں نے '{result.get('task')}' آپ کی لسٹ میں شامل کر دیا ہے۔ 🚀"
         elif action == "update":
-            message = f"زبردست! '{result.get('task')}' مکمل ہو گیا ہے۔ ✅"
+            return f"زبردست! '{result.get('task')}' مکمل ہو گیا ہے۔ ✅"
         elif action == "delete":
-            message = f"اوکے، میں نے '{result.get('task')}' آپ کی لسٹ سے حذف کر دیا ہے۔ 🗑️"
+            return f"اوکے، میں نے '{result.get('task')}' آپ کی لسٹ سے حذف کر دیا ہے۔ 🗑️"
         elif action == "timer":
-            message = f"اوکے، '{result.get('task')}' کے لیے کلاک {result.get('timer_action') == 'start' and 'شروع' or 'بند'} ہو گیا ہے۔ ⏱️"
+            return f"اوکے، '{result.get('task')}' کے لیے کلاک {result.get('timer_action') == 'start' and 'شروع' or 'بند'} ہو گیا ہے۔ ⏱️"
         elif action == "list":
-            message = "Accessing the archives... یہ رہی آپ کی موجودہ لسٹ۔ 📋"
+            return "Accessing the archives... یہ رہی آپ کی موجودہ لسٹ۔ 📋"
+        elif action == "search":
+            return f"یہ رہے آپ کی تلاش کے نتائج۔ 🔍\n{result.get('response')}"
         elif action == "greeting":
-            message = "السلام علیکم! میں آپ کی خدمت میں حاضر ہوں۔ یہ رہے آپ کے اہداف۔ 🫡"
+            return "السلام علیکم! میں آپ کی خدمت میں حاضر ہوں۔ یہ رہے آپ کے اہداف۔ 🫡"
         elif action == "clarify_add_task":
-            message = "کون سا کام آپ شامل کرنا چاہتے ہیں؟ براہ کرم تفصیل بتائیں۔ 📝"
+            return "کون سا کام آپ شامل کرنا چاہتے ہیں؟ براہ کرم تفصیل بتائیں۔ 📝"
+        elif action == "clarify_task":
+            return f"'{result.get('task')}' سے کئی اہداف ملتے ہیں: {'، '.join(result.get('matches', []))}۔ آپ کا مطلب کون سا ہے؟ 🤔"
+        elif action == "clarify_timer":
+            return f"'{result.get('task')}' ابھی محفوظ نہیں ہوا۔ لسٹ میں آنے کے بعد اس کا کلاک شروع کریں۔ ⏳"
+        elif action == "save_failed":
+            return f"معذرت، '{result.get('task')}' محفوظ نہیں ہو سکا۔ براہ کرم دوبارہ کوشش کریں۔ ⚠️"
         else:
-            message = "معذرت، میں سمجھ نہیں سکا۔ کیا آپ دوبارہ بتا سکتے ہیں؟ 🧠"
+            return "معذرت، میں سمجھ نہیں سکا۔ کیا آپ دوبارہ بتا سکتے ہیں؟ 🧠"
     else:
         if action == "create":
-            message = f"Got it! I've added '{result.get('task')}' to your list. Mission started!"
+            return f"Got it! I've added '{result.get('task')}' to your list. Mission started!"
         elif action == "update":
-            message = f"Mission accomplished! '{result.get('task')}' is now marked as completed."
+            return f"Mission accomplished! '{result.get('task')}' is now marked as completed."
         elif action == "delete":
-            message = f"Target eliminated! '{result.get('task')}' has been removed from your objectives."
+            return f"Target eliminated! '{result.get('task')}' has been removed from your objectives."
         elif action == "timer":
-            message = f"Mission clock {result.get('timer_action')}ed for '{result.get('task')}'."
+            return f"Mission clock {result.get('timer_action')}ed for '{result.get('task')}'."
         elif action == "list":
-            message = "Accessing the archives... Here are your current objectives."
+            return "Accessing the archives... Here are your current objectives."
+        elif action == "search":
+            return f"Scanning the archives... 🔍\n{result.get('response')}"
         elif action == "greeting":
-            message = "Greetings, Commander! Ready to tackle your objectives. Here's your mission briefing."
+            return "Greetings, Commander! Ready to tackle your objectives. Here's your mission briefing."
         elif action == "clarify_add_task":
-            message = "Roger that! What task would you like to add to your mission objectives? Please provide the details."
+            return "Roger that! What task would you like to add to your mission objectives? Please provide the details."
+        elif action == "clarify_task":
+            return f"Several objectives match '{result.get('task')}': {', '.join(result.get('matches', []))}. Which one did you mean?"
+        elif action == "clarify_timer":
+            return f"'{result.get('task')}' is not saved yet. Start its clock once it shows up in your objectives."
+        elif action == "save_failed":
+            return f"Transmission failed: '{result.get('task')}' could not be saved. Please try again."
         else:
-            message = "I'm not quite sure how to handle that objective. Could you rephrase it for AI Agentixz USA?"
+            return "I'm not quite sure how to handle that objective. Could you rephrase it for AI Agentixz USA?"
 
-    # 5. Save History
-    save_interaction({
-        "user_id": user_id,
-        "utterance": utterance,
-        "action": action,
-        "agent_response": message,
-        "timestamp": datetime.now().isoformat()
-    })
+@router.get("/tasks")
+async def get_tasks(tag: Optional[List[str]] = Query(None), user_data: dict = Depends(verify_jwt)):
+    """
+    Get raw task list for UI rendering. Repeat `tag` to keep only tasks carrying all of them.
+    """
+    try:
+        user_id = user_data["user_id"]
+        return await get_storage().list_tasks(user_id, limit=20, newest_first=True, tags=tag)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    return AgentResponse(
-        action=action,
-        result=result,
-        message=message
+@router.get("/tasks/tags")
+async def get_tag_facets(tag: Optional[List[str]] = Query(None), user_data: dict = Depends(verify_jwt)):
+    """
+    Task counts per tag and status for tag boards, from one aggregate query.
+    With `tag`, counts only tasks carrying all of those tags (drill-down).
+    """
+    try:
+        rows = await get_storage().tag_facets(user_data["user_id"], tags=tag)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"tags": rows, "filter": tag or []}
+
+@router.post("/tasks/import")
+async def import_task_file(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    dry_run: bool = False,
+    user_data: dict = Depends(verify_jwt)
+):
+    """
+    Stream a CSV or JSON-lines file of tasks into the user's list (format from `format`,
+    else the Content-Type). Rows are validated and inserted in batches as they arrive;
+    the response counts them and lists per-line errors. `dry_run` validates only.
+    """
+    fmt = format or ("jsonl" if "json" in request.headers.get("content-type", "") else "csv")
+    user_id = user_data["user_id"]
+    summary = await import_tasks(get_storage(), user_id, request.stream(), fmt, dry_run=dry_run)
+    print(f"Import for {user_id}: {summary['imported']} imported, {summary['failed']} failed ({fmt})")
+    return summary
+
+@router.get("/tasks/export")
+async def export_task_file(format: str = Query("csv", pattern="^(csv|jsonl)$"), user_data: dict = Depends(verify_jwt)):
+    """Stream all of the user's tasks, oldest first, as CSV or JSON lines."""
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_tasks(get_storage(), user_data["user_id"], format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tasks.{format}"'}
     )
 
-@router.get("/tasks")
-async def get_tasks(user_data: dict = Depends(verify_jwt)):
+REMINDER_KEEPALIVE = 15
+
+@router.get("/reminders/stream")
+async def reminder_stream(request: Request, user_data: dict = Depends(verify_jwt)):
+    """Server-sent events: a `reminder` event for each of the user's tasks coming due while connected."""
+    user_id = user_data["user_id"]
+    queue = reminder_scheduler.subscribe(user_id)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), REMINDER_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: reminder\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            reminder_scheduler.unsubscribe(user_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/reminders/stats")
+async def reminder_stats(user: dict = Depends(verify_jwt)):
+    """Pending reminders, deliveries and firing jitter on this worker."""
+    return reminder_scheduler.stats()
+
+SEARCH_MAX_LIMIT = 50
+
+@router.get("/tasks/search")
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    status: Optional[str] = Query(None, pattern="^(pending|completed)$"),
+    tag: Optional[List[str]] = Query(None),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    user_data: dict = Depends(verify_jwt)
+):
     """
-    Get raw task list for UI rendering.
+    Ranked task search over title and description (full-text plus trigram similarity).
+    Repeat `tag` to require several tags.
     """
     try:
-        user_id = user_data["user_id"]
-        from app.auth import supabase_admin
-        response = supabase_admin.table("tasks").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(20).execute()
-        return response.data
+        rows = await get_storage().search_tasks(user_data["user_id"], q.strip(), status=status, tags=tag,
+                                                limit=limit, offset=offset)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    total = rows[0]["total"] if rows else 0
+    items = [{k: v for k, v in row.items() if k != "total"} for row in rows]
+    return {"items": items, "total": total, "limit": limit, "offset": offset,
+            "has_more": offset + len(items) < total}
+
+# Tools whose effects must not be repeated when a client retries
+MUTATING_TOOLS = {"add_todo", "add_todos_bulk", "toggle_todo", "complete_todo", "delete_todo", "manage_timer"}
 
 @router.post("/tool")
-async def call_tool_direct(request: Request, user_data: dict = Depends(verify_jwt)):
+async def call_tool_direct(
+    request: Request,
+    response: Response,
+    user_data: dict = Depends(verify_jwt),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Directly call an MCP tool. Used for UI interactions (clicks) to ensure consistency.
     """
@@ -187,17 +681,93 @@ async def call_tool_direct(request: Request, user_data: dict = Depends(verify_jw
     # Force user_id for security
     # user_data is {"user_id": "uuid"} from verify_jwt
     arguments["user_id"] = user_data["user_id"]
-    
+
+    async def run():
+        try:
+            from app.mcp_server import mcp
+            print(f"Direct Tool Call: {tool_name} with args {arguments}")
+            result = await mcp.call_tool(tool_name, arguments)
+            return jsonable_encoder({"result": result})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if tool_name not in MUTATING_TOOLS:
+        return await run()
+    payload = {"path": "tool", "name": tool_name, "arguments": arguments}
+    result, replayed = await idempotency_store.run(user_data["user_id"], idempotency_key, payload, run)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+HISTORY_MAX_LIMIT = 100
+
+def encode_history_cursor(row: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(f"{row['created_at']}|{row['id']}".encode()).decode()
+
+def decode_history_cursor(cursor: str):
     try:
-        from app.mcp_server import mcp
-        print(f"Direct Tool Call: {tool_name} with args {arguments}")
-        result = await mcp.call_tool(tool_name, arguments)
-        return {"result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        datetime.fromisoformat(created_at)
+        # ids are bigserial or uuid; anything else is not a cursor we issued
+        if not re.fullmatch(r"[0-9a-fA-F-]+", row_id):
+            raise ValueError(row_id)
+        return created_at, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Malformed history cursor")
 
 @router.get("/history")
-async def get_history(user_data: dict = Depends(verify_jwt)):
+async def get_history(
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_LIMIT),
+    user_data: dict = Depends(verify_jwt)
+):
+    """
+    Keyset-paginated conversation history, always returned oldest -> newest.
+    - no cursor: the latest `limit` turns
+    - before=<cursor>: the page preceding that turn (scrolling back)
+    - since=<cursor>: turns newer than that one (incremental sync on reconnect)
+    """
+    if since and before:
+        raise HTTPException(status_code=400, detail="Use either 'since' or 'before', not both")
     user_id = user_data["user_id"]
-    response = supabase.table("interactions").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(20).execute()
-    return response.data
+    since_cursor = decode_history_cursor(since) if since else None
+    before_cursor = decode_history_cursor(before) if before else None
+
+    # One extra row tells us whether another page exists without a count query
+    rows = await get_storage().list_interactions(user_id, limit + 1, since=since_cursor, before=before_cursor)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not since:
+        rows.reverse()
+
+    return {
+        "items": rows,
+        "has_more": has_more,
+        "before": encode_history_cursor(rows[0]) if rows else before,
+        "since": encode_history_cursor(rows[-1]) if rows else since
+    }
+
+@router.get("/analytics/time")
+async def get_time_analytics(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    user_data: dict = Depends(verify_jwt)
+):
+    """
+    Mission clock totals per day, priority and tag, aggregated in the database from
+    the daily rollup. Defaults to the last 30 days.
+    """
+    to_date = to_date or date.today()
+    from_date = from_date or to_date - timedelta(days=29)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    try:
+        rows = await get_storage().time_analytics(user_data["user_id"], from_date.isoformat(), to_date.isoformat())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    result = {"from": from_date.isoformat(), "to": to_date.isoformat(), "by_day": [], "by_priority": [], "by_tag": []}
+    for row in rows:
+        result[f"by_{row['dimension']}"].append({"bucket": row["bucket"], "seconds": row["seconds"], "share": row["share"]})
+    return result
@@ -1,10 +1,73 @@
 import os
+import re
 import yaml
 import json
+import time
+import functools
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 from openai import OpenAI
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from app.ratelimit import RateLimiter, provider_limiter, speculative_provider_limiter
+from app.routing import ModelRouter, model_router, speculative_router, score_complexity, max_tier
+
+def normalize_utterance(utterance: str) -> str:
+    """Canonical form used to recognise repeated utterances (case, spacing, trailing punctuation)."""
+    text = re.sub(r"\s+", " ", utterance.strip().lower())
+    return text.rstrip(" .!?,;:۔،؟")
+
+RELATIVE_DUE = re.compile(
+    r"\bin\s+(an?|\d+(?:\.\d+)?)\s*(seconds?|secs?|minutes?|mins?|hours?|hrs?|days?|weeks?)\b", re.IGNORECASE
+)
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def relative_due_date(utterance: str, now: Optional[datetime] = None) -> Optional[str]:
+    """Absolute due date for "in 30 mins", "in an hour" and the like, or None."""
+    match = RELATIVE_DUE.search(utterance)
+    if not match:
+        return None
+    amount = 1.0 if match.group(1).lower() in ("a", "an") else float(match.group(1))
+    seconds = amount * UNIT_SECONDS[match.group(2)[0].lower()]
+    return ((now or datetime.now(timezone.utc)) + timedelta(seconds=seconds)).isoformat()
+
+def with_relative_due(result: Dict[str, Any], utterance: str) -> Dict[str, Any]:
+    # Offsets are exact arithmetic, so they are not left to the model
+    due = relative_due_date(utterance) if result.get("intent") == "add_task" else None
+    if due:
+        slots = {**(result.get("slots") or {}), "due_date": due}
+        if slots.get("item"):
+            slots["item"] = RELATIVE_DUE.sub("", slots["item"]).strip() or slots["item"]
+        result["slots"] = slots
+    return result
+
+# Fallback routing for lookups, and the words stripped to leave the search query
+SEARCH_PREFIXES = ("find ", "search for ", "search ", "where is ", "where's ", "look for ", "look up ")
+SEARCH_FILLER_WORDS = {"my", "the", "a", "an", "task", "tasks", "todo", "todos", "about", "for", "called", "named"}
+
+# Shared by the single and batched intent extraction prompts
+INTENT_GUIDE = """
+Intents:
+- add_task (add, create, new task, buy, remember to)
+- list_tasks (show, list, what are my tasks)
+- complete_task (done, finish, check)
+- delete_task (delete, remove)
+- search_tasks (find, search, where is, look for a specific task)
+
+Slots for 'add_task':
+- item (title)
+- priority (urgent, high, medium, low)
+- recurrence (daily, weekly, monthly, none)
+- due_date: CALCULATE the absolute ISO 8601 timestamp based on 'Current Time' if a relative or specific time is given.
+  Examples:
+  - "in 30 mins", "in 2 hours" -> null (relative offsets are computed by the server).
+  - "tomorrow at 5pm" -> Date of tomorrow + 17:00:00.
+  - "at 12:30" -> Today at 12:30.
+  - If no time mentioned, return null.
+
+Slots for 'search_tasks':
+- query (only the words to look for, e.g. "where is my dentist task" -> "dentist")
+- status (pending, completed, or null)
+"""
 
 class SkillManager:
     def __init__(self, skills_dir: str = "skills"):
@@ -13,32 +76,40 @@ class SkillManager:
         self.load_skills()
         
         self.clients: List[Dict[str, Any]] = []
+        # None: the process-wide model_router and provider_limiter (replays bring their own)
+        self.router: Optional[ModelRouter] = None
+        self.limiter: Optional[RateLimiter] = None
         
-        # Initialize providers in order of preference
+        # Initialize providers in order of preference, each with a light / standard / heavy model
+        # (app.routing picks the tier per call; override with e.g. OPENAI_MODEL_HEAVY)
         # 1. OpenAI (Primary)
-        self._add_provider("OPENAI_API_KEY", "OPENAI_API_BASE", "gpt-4o-mini", "OpenAI")
+        self._add_provider("OPENAI_API_KEY", "OPENAI_API_BASE", ("gpt-4o-mini", "gpt-4o-mini", "gpt-4o"), "OpenAI")
         
         # 2. OpenRouter (Secondary)
-        self._add_provider("OPENROUTER_API_KEY", None, "qwen/qwen-2.5-72b-instruct", "OpenRouter", "https://openrouter.ai/api/v1")
+        self._add_provider("OPENROUTER_API_KEY", None, ("qwen/qwen-2.5-7b-instruct", "qwen/qwen-2.5-72b-instruct", "qwen/qwen-2.5-72b-instruct"), "OpenRouter", "https://openrouter.ai/api/v1")
         
         # 3. Groq (Tertiary)
-        self._add_provider("GROQ_API_KEY", None, "llama-3.1-70b-versatile", "Groq", "https://api.groq.com/openai/v1")
+        self._add_provider("GROQ_API_KEY", None, ("llama-3.1-8b-instant", "llama-3.1-70b-versatile", "llama-3.1-70b-versatile"), "Groq", "https://api.groq.com/openai/v1")
         
         # 4. Gemini (Quaternary)
-        self._add_provider("GEMINI_API_KEY", None, "gemini-1.5-flash", "Gemini", "https://generativelanguage.googleapis.com/v1beta/openai")
+        self._add_provider("GEMINI_API_KEY", None, ("gemini-1.5-flash", "gemini-1.5-flash", "gemini-1.5-pro"), "Gemini", "https://generativelanguage.googleapis.com/v1beta/openai")
 
         if not self.clients:
             print("SkillManager: All LLM keys missing. Falling back to keyword logic.")
         else:
             print(f"SkillManager: World-Class Intelligence initialized with {len(self.clients)} brains.")
 
-    def _add_provider(self, env_key: str, base_env_key: Optional[str], model: str, name: str, default_base: Optional[str] = None):
+    def _add_provider(self, env_key: str, base_env_key: Optional[str], models: tuple, name: str, default_base: Optional[str] = None):
         key = os.getenv(env_key)
         base = os.getenv(base_env_key) if base_env_key else default_base
         if key:
             try:
                 client = OpenAI(api_key=key, base_url=base)
-                self.clients.append({"name": name, "client": client, "model": model})
+                tiers = {
+                    tier: os.getenv(f"{name.upper()}_MODEL_{tier.upper()}", default)
+                    for tier, default in zip(("light", "standard", "heavy"), models)
+                }
+                self.clients.append({"name": name, "client": client, "model": tiers["standard"], "models": tiers})
                 print(f"Brain Linked: {name}")
             except Exception as e:
                 print(f"SkillManager: Failed to link {name}: {e}")
@@ -59,16 +130,36 @@ class SkillManager:
     def get_skill(self, name: str) -> Optional[Dict[str, Any]]:
         return self.skills.get(name)
 
-    def _get_llm_json(self, prompt: str) -> Optional[Dict[str, Any]]:
-        """Helper to get structured JSON from LLM with automatic fallback"""
+    def _get_llm_json(self, prompt: str, tier: str = "standard", user_id: Optional[str] = None,
+                      speculative: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Helper to get structured JSON from LLM with automatic fallback. Speculative calls (drafts)
+        use their own provider limiter and budget scope, so they cannot starve real dispatches.
+        """
         if not self.clients:
             return None
+        if speculative:
+            router = self.router or speculative_router
+            limiter = self.limiter or speculative_provider_limiter
+        else:
+            router = self.router or model_router
+            limiter = self.limiter or provider_limiter
+        tier = router.route(prompt, tier, user_id)
+        if tier is None:
+            return None
             
         for provider in self.clients:
+            model = provider.get('models', {}).get(tier, provider['model'])
+            allowed, retry_after = limiter.acquire(provider['name'])
+            if not allowed:
+                router.record_rate_limited(provider['name'], model)
+                print(f"SkillManager: Brain {provider['name']} rate limited for {retry_after:.1f}s. Falling back...")
+                continue
+            started = time.perf_counter()
             try:
-                print(f"Brain {provider['name']} attempting extraction...")
+                print(f"Brain {provider['name']} ({tier}: {model}) attempting extraction...")
                 response = provider['client'].chat.completions.create(
-                    model=provider['model'],
+                    model=model,
                     messages=[
                         {"role": "system", "content": "You are a specialized AI Brain for a Todo Chatbot. Return only valid JSON."},
                         {"role": "user", "content": prompt}
@@ -76,22 +167,115 @@ class SkillManager:
                     response_format={"type": "json_object"},
                     timeout=10 # Prevent hanging
                 )
-                return json.loads(response.choices[0].message.content)
+                content = response.choices[0].message.content
+                router.record(provider['name'], model, tier, user_id, started,
+                                    getattr(response, "usage", None), prompt, content)
+                return json.loads(content)
             except Exception as e:
+                router.record_failure(provider['name'], model, tier, started)
                 print(f"SkillManager: Brain {provider['name']} failed: {e}. Falling back...")
                 continue
         
         print("SkillManager: All brains failed to respond.")
         return None
 
+    def keyword_intent(self, utterance: str) -> Dict[str, Any]:
+        """Keyword fallback for intent extraction when no LLM is available or all of them failed."""
+        u_low = utterance.lower().strip()
+        
+        # Lookups first: "where is my history task" must not read as a greeting
+        for prefix in SEARCH_PREFIXES:
+            if u_low.startswith(prefix):
+                words = [w for w in u_low[len(prefix):].split() if w not in SEARCH_FILLER_WORDS]
+                return {"intent": "search_tasks", "slots": {"query": " ".join(words)}}
+
+        # Handle greetings
+        # Handle greetings and basic conversation
+        if any(k in u_low for k in ["hi", "hello", "hey", "greetings", "what's up", "whats up", "sup", "yo", "hola"]):
+            return {"intent": "greeting", "slots": {}}
+        
+        if u_low in ["yes", "yup", "yeah", "ok", "sure", "please"]:
+            return {"intent": "clarify_add_task", "slots": {}} # Follow-ups to a pending question are resolved by app.dialogue before we get here
+            
+        if u_low in ["no", "nope", "nah", "cancel"]:
+            return {"intent": "greeting", "slots": {}} # Just reset
+        
+        priority = "medium"
+        if "urgent" in u_low or "asap" in u_low: priority = "urgent"
+        elif "high" in u_low or "important" in u_low: priority = "high"
+        elif "low" in u_low: priority = "low"
+
+        recurrence = "none"
+        if "every day" in u_low or "daily" in u_low: recurrence = "daily"
+        elif "every week" in u_low or "weekly" in u_low: recurrence = "weekly"
+        elif "every month" in u_low or "monthly" in u_low: recurrence = "monthly"
+
+        if any(k in u_low for k in ["buy", "add", "new", "create", "need", "remember"]):
+            item = utterance
+            
+            # Check for standalone commands like "add task", "new task", "create task"
+            # Also handle "AI Agentixz USA add task"
+            standalone_commands = ["add task", "new task", "create task", "add a task", "create a task", "new todo", "add todo", "add"]
+            if any(u_low.endswith(cmd) for cmd in standalone_commands) or u_low in standalone_commands:
+                return {
+                    "intent": "add_task",
+                    "slots": {
+                        "item": "",  # Empty item signals missing details
+                        "priority": priority,
+                        "recurrence": recurrence
+                    }
+                }
+            
+            # Extract task name by removing command keywords
+            for k in ["add", "buy", "new", "create", "need", "remember"]:
+                if k in u_low:
+                    # Split and get everything after the keyword
+                    parts = u_low.split(k, 1)
+                    if len(parts) > 1:
+                        item = parts[1].strip()
+                    break
+            
+            # Remove articles and task-related words
+            for word in ["a task", "task", "a todo", "todo", "a new", "the", "an objective", "objective"]:
+                item = item.replace(word, "").strip()
+            
+            # Remove priority and recurrence keywords
+            for k in ["urgent", "high", "low", "daily", "weekly", "monthly", "every day", "every week"]:
+                item = item.replace(k, "").strip()
+            
+            # If item is empty or too generic after cleaning, mark as incomplete
+            if not item or item in ["task", "todo", "something", "it"]:
+                item = ""
+            
+            return {
+                "intent": "add_task", 
+                "slots": {
+                    "item": item.capitalize() if item else "",
+                    "priority": priority,
+                    "recurrence": recurrence
+                }
+            }
+        elif any(k in u_low for k in ["list", "show", "what", "todos", "tasks"]):
+            return {"intent": "list_tasks", "slots": {}}
+        elif any(k in u_low for k in ["done", "finish", "complete", "check", "solved"]):
+            item = u_low
+            for k in ["done", "finish", "complete", "check", "solved"]:
+                if k in u_low:
+                    item = u_low.split(k)[-1].strip()
+                    break
+            return {"intent": "complete_task", "slots": {"item": item}}
+        return {"intent": "clarify", "slots": {}}
+
     def execute_skill(self, name: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """
         Executes a skill based on its YAML definition and inputs.
+        `speculative: True` in the inputs marks a call made for a draft rather than a sent command.
         """
         skill = self.get_skill(name)
         # NOTE: We don't error out if skill YAML is missing, as we have hardcoded implementations below
 
         utterance = inputs.get("utterance", "").strip()
+        llm_json = functools.partial(self._get_llm_json, speculative=True) if inputs.get("speculative") else self._get_llm_json
         
         # --- WORLD-CLASS INTENT EXTRACTION ---
         if name == "intent_extractor":
@@ -103,27 +287,16 @@ class SkillManager:
                 return {"intent": "greeting", "slots": {}}
             
             current_time = datetime.now().isoformat()
+            # Compact dialogue state (see app.dialogue) replaces resending earlier turns
+            context = inputs.get("context")
+            context_line = f"Conversation State: {context} The utterance most likely answers this." if context else ""
             prompt = f"""
             Analyze the following user utterance and extract the intent and slots.
             
             Current Time: {current_time}
+            {context_line}
             
-            Intents: 
-            - add_task (add, create, new task, buy, remember to)
-            - list_tasks (show, list, what are my tasks)
-            - complete_task (done, finish, check)
-            - delete_task (delete, remove)
-            
-            Slots for 'add_task': 
-            - item (title)
-            - priority (urgent, high, medium, low)
-            - recurrence (daily, weekly, monthly, none)
-            - due_date: CALCULATE the absolute ISO 8601 timestamp based on 'Current Time' if a relative or specific time is given.
-              Examples:
-              - "in 30 mins" -> Add 30 minutes to Current Time.
-              - "tomorrow at 5pm" -> Date of tomorrow + 17:00:00.
-              - "at 12:30" -> Today at 12:30.
-              - If no time mentioned, return null.
+            {INTENT_GUIDE}
 
             Utterance: "{utterance}"
 
@@ -133,89 +306,54 @@ class SkillManager:
                 "slots": {{ ... }}
             }}
             """
-            llm_res = self._get_llm_json(prompt)
+            route = score_complexity(utterance, context)
+            llm_res = llm_json(prompt, route["tier"], inputs.get("user_id"))
             if llm_res:
-                return llm_res
+                return with_relative_due(llm_res, utterance)
 
             # --- FALLBACK KEYWORD LOGIC ---
-            u_low = utterance.lower().strip()
-            
-            # Handle greetings
-            # Handle greetings and basic conversation
-            if any(k in u_low for k in ["hi", "hello", "hey", "greetings", "what's up", "whats up", "sup", "yo", "hola"]):
-                return {"intent": "greeting", "slots": {}}
-            
-            if u_low in ["yes", "yup", "yeah", "ok", "sure", "please"]:
-                return {"intent": "clarify_add_task", "slots": {}} # Correct flow would depend on context, but this avoids "clarify" loop
-                
-            if u_low in ["no", "nope", "nah", "cancel"]:
-                return {"intent": "greeting", "slots": {}} # Just reset
-            
-            priority = "medium"
-            if "urgent" in u_low or "asap" in u_low: priority = "urgent"
-            elif "high" in u_low or "important" in u_low: priority = "high"
-            elif "low" in u_low: priority = "low"
-
-            recurrence = "none"
-            if "every day" in u_low or "daily" in u_low: recurrence = "daily"
-            elif "every week" in u_low or "weekly" in u_low: recurrence = "weekly"
-            elif "every month" in u_low or "monthly" in u_low: recurrence = "monthly"
-
-            if any(k in u_low for k in ["buy", "add", "new", "create", "need", "remember"]):
-                item = utterance
-                
-                # Check for standalone commands like "add task", "new task", "create task"
-                # Also handle "AI Agentixz USA add task"
-                standalone_commands = ["add task", "new task", "create task", "add a task", "create a task", "new todo", "add todo", "add"]
-                if any(u_low.endswith(cmd) for cmd in standalone_commands) or u_low in standalone_commands:
-                    return {
-                        "intent": "add_task",
-                        "slots": {
-                            "item": "",  # Empty item signals missing details
-                            "priority": priority,
-                            "recurrence": recurrence
-                        }
-                    }
-                
-                # Extract task name by removing command keywords
-                for k in ["add", "buy", "new", "create", "need", "remember"]:
-                    if k in u_low:
-                        # Split and get everything after the keyword
-                        parts = u_low.split(k, 1)
-                        if len(parts) > 1:
-                            item = parts[1].strip()
-                        break
-                
-                # Remove articles and task-related words
-                for word in ["a task", "task", "a todo", "todo", "a new", "the", "an objective", "objective"]:
-                    item = item.replace(word, "").strip()
-                
-                # Remove priority and recurrence keywords
-                for k in ["urgent", "high", "low", "daily", "weekly", "monthly", "every day", "every week"]:
-                    item = item.replace(k, "").strip()
-                
-                # If item is empty or too generic after cleaning, mark as incomplete
-                if not item or item in ["task", "todo", "something", "it"]:
-                    item = ""
-                
-                return {
-                    "intent": "add_task", 
-                    "slots": {
-                        "item": item.capitalize() if item else "",
-                        "priority": priority,
-                        "recurrence": recurrence
-                    }
-                }
-            elif any(k in u_low for k in ["list", "show", "what", "todos", "tasks"]):
-                return {"intent": "list_tasks", "slots": {}}
-            elif any(k in u_low for k in ["done", "finish", "complete", "check", "solved"]):
-                item = u_low
-                for k in ["done", "finish", "complete", "check", "solved"]:
-                    if k in u_low:
-                        item = u_low.split(k)[-1].strip()
-                        break
-                return {"intent": "complete_task", "slots": {"item": item}}
-            return {"intent": "clarify", "slots": {}}
+            return with_relative_due(self.keyword_intent(utterance), utterance)
+
+        # --- BATCHED TRANSLATION + INTENT EXTRACTION (queued utterances, one LLM call) ---
+        if name == "intent_extractor_batch":
+            utterances = inputs.get("utterances", [])
+            numbered = "\n".join(f"{i + 1}. {json.dumps(u, ensure_ascii=False)}" for i, u in enumerate(utterances))
+            prompt = f"""
+            The user queued these utterances while offline. They are in the order spoken, and a
+            later one may answer a question raised by an earlier one (e.g. "add a task" then "water the plants").
+            Some may be in Urdu: translate those to English first, and write slot values in English.
+            For each utterance, give its English text as utterance_en (the utterance itself if already
+            English; keep time phrases such as "in 30 minutes" in the translation), then extract the intent and slots.
+
+            Current Time: {datetime.now().isoformat()}
+
+            {INTENT_GUIDE}
+
+            Utterances:
+            {numbered}
+
+            Response Format (exactly one result per utterance, same order):
+            {{
+                "results": [
+                    {{"utterance_en": "English text", "intent": "intent_name", "slots": {{ ... }}, "detected_lang": "en" or "ur"}}
+                ]
+            }}
+            """
+            # The whole batch must come back consistent, so never below the standard tier
+            tier = max_tier("standard", *(score_complexity(u)["tier"] for u in utterances))
+            llm_res = llm_json(prompt, tier, inputs.get("user_id")) if utterances else None
+            results = (llm_res or {}).get("results")
+            if isinstance(results, list) and len(results) == len(utterances) and all(isinstance(r, dict) for r in results):
+                # Relative offsets are read from the English text, so Urdu items get them too
+                english = [r["utterance_en"] if isinstance(r.get("utterance_en"), str) else u for r, u in zip(results, utterances)]
+                return {"results": [with_relative_due(r, e) for r, e in zip(results, english)], "source": "llm"}
+
+            # Local fallback, item by item: unicode-range language detection and keyword intents
+            fallback = []
+            for u in utterances:
+                is_urdu = any("\u0600" <= char <= "\u06FF" for char in u)
+                fallback.append(with_relative_due({**self.keyword_intent(u.strip()), "detected_lang": "ur" if is_urdu else "en"}, u))
+            return {"results": fallback, "source": "keywords"}
 
         # --- WORLD-CLASS URDU TRANSLATION ---
         if name == "translator_urdu":
@@ -236,7 +374,7 @@ class SkillManager:
                     "confidence": 1.0
                 }}
                 """
-                llm_res = self._get_llm_json(prompt)
+                llm_res = llm_json(prompt, score_complexity(utterance)["tier"], inputs.get("user_id"))
                 if llm_res:
                     return llm_res
 
@@ -0,0 +1,154 @@
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from app.auth import verify_token
+from app.audio import OpusDecoder, VoiceSession, get_stt_backend
+from app.reminders import reminder_scheduler
+from .agent import dispatch_utterance, start_prefetch
+
+router = APIRouter(prefix="/voice", tags=["voice"])
+
+CODECS = {"pcm_s16le", "opus"}
+SAMPLE_RATES = {8000, 12000, 16000, 24000, 48000}
+# Well under a session's audio buffer at any sample rate; clients send 20-100 ms frames
+MAX_FRAME_BYTES = 256 * 1024
+
+
+async def reject(websocket: WebSocket, detail: str, code: int):
+    await websocket.send_json({"type": "error", "detail": detail})
+    await websocket.close(code=code)
+
+
+@router.websocket("/ws")
+async def voice_ingest(websocket: WebSocket):
+    """
+    Streaming voice commands. The client opens with a text frame
+    {"type": "start", "token": <access token>, "codec": "pcm_s16le" | "opus", "sample_rate": 16000, "dispatch": true},
+    then streams binary audio frames (mono) and ends with {"type": "stop"}.
+    The server answers with "ready", then "vad", "partial" and "final" events as speech is
+    detected and transcribed; with dispatch on, each final transcript is run through the
+    agent and its response sent back as a "result" event. Tasks coming due while the socket
+    is open arrive as "reminder" events.
+    """
+    await websocket.accept()
+    try:
+        start = json.loads(await websocket.receive_text())
+    except WebSocketDisconnect:
+        return
+    except (ValueError, KeyError):
+        start = None
+    if not isinstance(start, dict):
+        await reject(websocket, "Expected a JSON start message", 1007)
+        return
+    if start.get("type") != "start" or not isinstance(start.get("token"), str) or not start["token"]:
+        await reject(websocket, "Expected a start message with a token", 1008)
+        return
+    try:
+        user_id = (await verify_token(start["token"]))["user_id"]
+    except HTTPException as e:
+        await reject(websocket, e.detail, 1008)
+        return
+
+    stt = get_stt_backend()
+    if stt is None:
+        await reject(websocket, "Voice ingest is not configured (STT_BACKEND)", 1011)
+        return
+
+    codec = start.get("codec", "pcm_s16le")
+    try:
+        sample_rate = int(start.get("sample_rate", 16000))
+    except (TypeError, ValueError):
+        sample_rate = None
+    if not isinstance(codec, str) or codec not in CODECS or sample_rate not in SAMPLE_RATES:
+        await reject(websocket, f"Unsupported audio format {codec}@{start.get('sample_rate')}", 1003)
+        return
+    try:
+        decoder = OpusDecoder(sample_rate) if codec == "opus" else None
+    except RuntimeError as e:
+        await reject(websocket, str(e), 1003)
+        return
+    dispatch = start.get("dispatch", True)
+    # Results go out in utterance order even though dispatch runs alongside ingest;
+    # a disconnect does not cancel commands already spoken
+    dispatches = []
+
+    async def on_vad(state: str):
+        await websocket.send_json({"type": "vad", "state": state})
+
+    async def on_partial(text: str):
+        # Understanding starts on the partial; the final transcript usually matches it
+        if dispatch:
+            await start_prefetch(text, user_id)
+        await websocket.send_json({"type": "partial", "text": text})
+
+    async def run_dispatch(text: str, previous):
+        if previous:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            result = await dispatch_utterance(text, user_id)
+            event = {"type": "result", "utterance": text, **result.model_dump()}
+        except HTTPException as e:
+            event = {"type": "error", "utterance": text, "detail": e.detail, "status": e.status_code}
+        try:
+            await websocket.send_json(event)
+        except (WebSocketDisconnect, RuntimeError):
+            # Client hung up mid-command; the command itself still completed
+            pass
+
+    async def on_final(text: str):
+        await websocket.send_json({"type": "final", "text": text})
+        if dispatch:
+            previous = dispatches[-1] if dispatches else None
+            dispatches.append(asyncio.create_task(run_dispatch(text, previous)))
+
+    async def forward_reminders(queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await websocket.send_json(event)
+            except (WebSocketDisconnect, RuntimeError):
+                # Socket closed under us; the receive loop is ending the session
+                return
+
+    session = VoiceSession(stt, sample_rate, on_partial=on_partial, on_final=on_final, on_vad=on_vad)
+    print(f"Voice session for {user_id}: {codec}@{sample_rate}")
+    await websocket.send_json({"type": "ready"})
+    reminders = reminder_scheduler.subscribe(user_id)
+    reminder_task = asyncio.create_task(forward_reminders(reminders))
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                frame = message["bytes"]
+                if len(frame) > MAX_FRAME_BYTES:
+                    await reject(websocket, f"Audio frames must be at most {MAX_FRAME_BYTES} bytes", 1009)
+                    break
+                try:
+                    pcm = decoder.decode(frame) if decoder else frame
+                except ValueError as e:
+                    await reject(websocket, str(e), 1007)
+                    break
+                await session.feed(pcm)
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if not isinstance(control, dict):
+                    await reject(websocket, "Control messages must be JSON objects", 1007)
+                    break
+                if control.get("type") == "stop":
+                    await session.flush()
+                    await asyncio.gather(*dispatches, return_exceptions=True)
+                    await websocket.send_json({"type": "done", "transcripts": session.transcripts})
+                    await websocket.close()
+                    break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reminder_scheduler.unsubscribe(user_id, reminders)
+        reminder_task.cancel()
+        await asyncio.gather(reminder_task, return_exceptions=True)
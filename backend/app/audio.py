@@ -0,0 +1,301 @@
+"""
+Streaming voice ingest: ring buffer, energy-based VAD and pluggable speech-to-text.
+
+Audio arrives as 16-bit little-endian mono PCM (or Opus frames decoded to it). Each frame
+is copied once into a fixed AudioRingBuffer; the VAD and the STT backend then read
+memoryview slices of that buffer instead of concatenating chunks. A VoiceSession ties
+them together and reports partial transcripts while the user is speaking and a final
+one when the VAD detects the end of the utterance.
+
+STT backends (STT_BACKEND):
+- "none" (default): voice ingest is disabled.
+- "faster-whisper[:model]": CPU transcription with faster-whisper (`pip install faster-whisper`),
+  model defaults to STT_MODEL or "base.en".
+"""
+import os
+import math
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+SAMPLE_WIDTH = 2  # int16
+MAX_UTTERANCE_SECONDS = float(os.getenv("VOICE_MAX_UTTERANCE_SECONDS", "30"))
+PARTIAL_INTERVAL = float(os.getenv("VOICE_PARTIAL_INTERVAL", "0.6"))
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size byte ring addressed by absolute stream position. Writes copy into the
+    preallocated bytearray; reads return memoryviews into it when the range does not wrap.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self.written = 0  # absolute position of the next byte
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.written - self.capacity)
+
+    def write(self, data) -> int:
+        src = memoryview(data).cast("B")
+        if len(src) > self.capacity:
+            # Only the tail can survive; skip the rest without copying it
+            self.written += len(src) - self.capacity
+            src = src[-self.capacity:]
+        start = self.written % self.capacity
+        first = min(len(src), self.capacity - start)
+        self._view[start:start + first] = src[:first]
+        if first < len(src):
+            self._view[:len(src) - first] = src[first:]
+        self.written += len(src)
+        return len(src)
+
+    def read(self, start: int, end: int):
+        """Bytes in [start, end). A memoryview when contiguous, otherwise one joined copy."""
+        if start < self.oldest or end > self.written or start > end:
+            raise ValueError(f"Range {start}-{end} is outside the buffered window {self.oldest}-{self.written}")
+        a, b = start % self.capacity, end % self.capacity
+        if end - start == 0:
+            return self._view[0:0]
+        if a < b or b == 0:
+            return self._view[a:b or self.capacity]
+        return bytes(self._view[a:]) + bytes(self._view[:b])
+
+
+def frame_rms(frame) -> float:
+    samples = memoryview(frame).cast("h")
+    if not len(samples):
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detection on RMS energy. A frame is voiced when its energy
+    exceeds both `min_energy` and `ratio` times the running noise floor (an average of
+    unvoiced frames). Speech starts after `start_frames` voiced frames in a row and ends
+    after `hangover_ms` of silence. Positions are absolute byte offsets into the stream.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 20, min_energy: float = 300.0,
+                 ratio: float = 3.0, start_frames: int = 3, hangover_ms: int = 600, pre_roll_ms: int = 200):
+        self.frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+        self.min_energy = min_energy
+        self.ratio = ratio
+        self.start_frames = start_frames
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.pre_roll = sample_rate * pre_roll_ms // 1000 * SAMPLE_WIDTH
+        self.noise_floor = min_energy / ratio
+        self.in_speech = False
+        self.speech_start = 0
+        self._voiced_run = 0
+        self._silent_run = 0
+
+    def process(self, frame, position: int) -> Optional[Tuple[str, int]]:
+        """Feed one frame that starts at `position`. Returns ("start", pos) or ("end", pos) on a transition."""
+        energy = frame_rms(frame)
+        voiced = energy > max(self.min_energy, self.noise_floor * self.ratio)
+        if not voiced:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+
+        if not self.in_speech:
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.start_frames:
+                self.in_speech = True
+                self._silent_run = 0
+                first_voiced = position - (self.start_frames - 1) * self.frame_bytes
+                self.speech_start = max(0, first_voiced - self.pre_roll)
+                return "start", self.speech_start
+            return None
+
+        self._silent_run = 0 if voiced else self._silent_run + 1
+        if self._silent_run >= self.hangover_frames:
+            self.in_speech = False
+            self._voiced_run = 0
+            return "end", position + self.frame_bytes
+        return None
+
+
+class SpeechToText:
+    """CPU speech-to-text. `pcm` is int16 mono at `sample_rate`; `final` asks for the slower, best pass."""
+
+    name = "base"
+
+    def transcribe(self, pcm, sample_rate: int, final: bool = False) -> str:
+        raise NotImplementedError
+
+
+class FasterWhisperSTT(SpeechToText):
+    name = "faster-whisper"
+
+    def __init__(self, model: str = "base.en", compute_type: str = "int8"):
+        self.model_name = model
+        self.compute_type = compute_type
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError:
+                    raise RuntimeError("STT_BACKEND=faster-whisper requires the 'faster-whisper' package.")
+                self._model = WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type)
+        return self._model
+
+    def transcribe(self, pcm, sample_rate: int, final: bool = False) -> str:
+        import numpy as np
+        model = self._load()
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if sample_rate != 16000:
+            # Whisper expects 16 kHz; linear resampling is enough for speech
+            target = int(len(audio) * 16000 / sample_rate)
+            audio = np.interp(np.linspace(0, len(audio), target, endpoint=False), np.arange(len(audio)), audio)
+        segments, _ = model.transcribe(audio, beam_size=5 if final else 1, vad_filter=False)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+def create_stt_backend(spec: Optional[str] = None) -> Optional[SpeechToText]:
+    spec = spec if spec is not None else os.getenv("STT_BACKEND", "none")
+    kind, _, arg = spec.partition(":")
+    if kind in ("", "none"):
+        return None
+    if kind == "faster-whisper":
+        return FasterWhisperSTT(arg or os.getenv("STT_MODEL", "base.en"))
+    raise ValueError(f"Unknown STT_BACKEND: {spec}")
+
+
+class OpusDecoder:
+    """Opus frames -> int16 PCM via the optional 'opuslib' package."""
+
+    def __init__(self, sample_rate: int, channels: int = 1):
+        try:
+            import opuslib
+        except ImportError:
+            raise RuntimeError("Opus audio requires the 'opuslib' package; send pcm_s16le instead.")
+        self._decoder = opuslib.Decoder(sample_rate, channels)
+        self._error = opuslib.OpusError
+        # Largest Opus frame is 120 ms
+        self.max_frame_samples = sample_rate * 120 // 1000
+
+    def decode(self, packet: bytes) -> bytes:
+        """Raises ValueError for a packet libopus cannot decode."""
+        try:
+            return self._decoder.decode(packet, self.max_frame_samples)
+        except self._error as e:
+            raise ValueError(f"Corrupt Opus frame: {e}")
+
+
+Callback = Callable[[str], Awaitable[Any]]
+
+
+class VoiceSession:
+    """
+    One streaming utterance loop. feed() audio as it arrives; `on_partial(text)` fires at
+    most every PARTIAL_INTERVAL seconds of speech (never more than one STT pass in flight),
+    and `on_final(text)` once per utterance when the VAD sees it end, the utterance hits
+    MAX_UTTERANCE_SECONDS, or the stream is flushed.
+    """
+
+    def __init__(self, stt: SpeechToText, sample_rate: int = 16000, on_partial: Optional[Callback] = None,
+                 on_final: Optional[Callback] = None, on_vad: Optional[Callback] = None,
+                 vad: Optional[EnergyVAD] = None):
+        self.stt = stt
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * SAMPLE_WIDTH
+        # Room for the longest utterance plus the VAD pre-roll
+        self.buffer = AudioRingBuffer(int(self.bytes_per_second * (MAX_UTTERANCE_SECONDS + 1)))
+        self.vad = vad or EnergyVAD(sample_rate)
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.on_vad = on_vad
+        self._vad_pos = 0
+        self._last_partial_pos = 0
+        self._partial_task: Optional[asyncio.Task] = None
+        self.transcripts: List[str] = []
+
+    async def feed(self, pcm):
+        self.buffer.write(pcm)
+        if self._vad_pos < self.buffer.oldest:
+            # A write bigger than the ring overran audio the VAD had not seen; carry on from what is left
+            self._vad_pos = self.buffer.oldest
+        frame_bytes = self.vad.frame_bytes
+        while self._vad_pos + frame_bytes <= self.buffer.written:
+            frame = self.buffer.read(self._vad_pos, self._vad_pos + frame_bytes)
+            event = self.vad.process(frame, self._vad_pos)
+            self._vad_pos += frame_bytes
+            if event:
+                kind, position = event
+                if self.on_vad:
+                    await self.on_vad("speech" if kind == "start" else "silence")
+                if kind == "start":
+                    self._last_partial_pos = position
+                else:
+                    await self._finalize(position)
+            elif self.vad.in_speech:
+                await self._maybe_partial()
+
+    async def flush(self):
+        """End of stream: finish any utterance in progress."""
+        if self._partial_task:
+            await asyncio.gather(self._partial_task, return_exceptions=True)
+        if self.vad.in_speech:
+            self.vad.in_speech = False
+            await self._finalize(self._vad_pos)
+
+    async def _maybe_partial(self):
+        end = self._vad_pos
+        if end - self.vad.speech_start >= MAX_UTTERANCE_SECONDS * self.bytes_per_second:
+            self.vad.in_speech = False
+            await self._finalize(end)
+            return
+        if not self.on_partial or (self._partial_task and not self._partial_task.done()):
+            return
+        if end - self._last_partial_pos < PARTIAL_INTERVAL * self.bytes_per_second:
+            return
+        self._last_partial_pos = end
+        # bytes() here: the ring keeps moving while the STT thread works
+        pcm = bytes(self.buffer.read(max(self.vad.speech_start, self.buffer.oldest), end))
+        self._partial_task = asyncio.create_task(self._partial(pcm))
+
+    async def _partial(self, pcm: bytes):
+        text = await asyncio.to_thread(self.stt.transcribe, pcm, self.sample_rate, False)
+        if text and self.vad.in_speech:
+            await self.on_partial(text)
+
+    async def _finalize(self, end: int):
+        start = max(self.vad.speech_start, self.buffer.oldest)
+        pcm = bytes(self.buffer.read(start, min(end, self.buffer.written)))
+        if self._partial_task and not self._partial_task.done():
+            self._partial_task.cancel()
+        text = await asyncio.to_thread(self.stt.transcribe, pcm, self.sample_rate, True)
+        if text:
+            self.transcripts.append(text)
+            if self.on_final:
+                await self.on_final(text)
+
+
+_stt: Optional[SpeechToText] = None
+_stt_loaded = False
+_stt_lock = threading.Lock()
+
+
+def get_stt_backend() -> Optional[SpeechToText]:
+    global _stt, _stt_loaded
+    if not _stt_loaded:
+        with _stt_lock:
+            if not _stt_loaded:
+                _stt = create_stt_backend()
+                _stt_loaded = True
+                print(f"STT backend: {_stt.name if _stt else 'none'}")
+    return _stt
+
+
+def set_stt_backend(stt: Optional[SpeechToText]) -> None:
+    global _stt, _stt_loaded
+    _stt = stt
+    _stt_loaded = True
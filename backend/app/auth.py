@@ -1,9 +1,12 @@
 import os
+import hashlib
+import asyncio
 from dotenv import load_dotenv
 from fastapi import Request, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
 from typing import Optional
+from app.state import NamespaceCache, offload
 
 # explicitly load .env from backend root
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -44,18 +47,32 @@ supabase_admin: Client = create_client(
 
 security = HTTPBearer(auto_error=False)
 
+# Verified token -> claims, shared by all workers so each token costs one Supabase round trip per TTL
+token_claims = NamespaceCache("token_claims", ttl=float(os.getenv("TOKEN_CLAIMS_TTL", "60")))
+
 async def verify_jwt(credentials: Optional[HTTPAuthorizationCredentials] = Security(security)):
     if credentials is None:
         print("[AUTH] Error: Authorization header missing")
         raise HTTPException(status_code=401, detail="Authorization header missing")
-    token = credentials.credentials
+    return await verify_token(credentials.credentials)
+
+async def verify_token(token: str) -> dict:
+    """Claims for a Supabase access token; also used by WebSocket routes, which have no Authorization header."""
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    claims = await offload(token_claims.backend, token_claims.get, token_key)
+    if claims:
+        return claims
     try:
-        # Verify the token with Supabase
-        user = supabase.auth.get_user(token)
+        # Verify the token with Supabase; the client is synchronous, so keep it off the event loop
+        user = await asyncio.to_thread(supabase.auth.get_user, token)
         if not user or not user.user:
             print("[AUTH] Error: Supabase rejected the token")
             raise HTTPException(status_code=401, detail="Invalid token")
-        return {"user_id": user.user.id}
+        claims = {"user_id": user.user.id}
+        await offload(token_claims.backend, token_claims.set, token_key, claims)
+        return claims
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[AUTH] Error: Verification failed: {str(e)}")
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
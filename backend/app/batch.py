@@ -0,0 +1,142 @@
+"""
+Batched dispatch for utterances queued by offline or voice clients.
+
+The batch is classified in one go, then applied in order against an in-memory view of
+the user's tasks, so later items see the effect of earlier ones ("add milk" followed by
+"done milk", or a follow-up answer to "add a task"). Only the net result is written:
+one bulk insert, one bulk update and one bulk delete in a single transaction, whatever
+the batch size.
+"""
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.storage import TaskStorage, BatchWriteError
+from app.mcp_server import next_due_date
+from app.reminders import reminder_scheduler
+
+BATCH_MAX = int(os.getenv("DISPATCH_BATCH_MAX", "50"))
+
+
+class BatchPlan:
+    def __init__(self, tasks: List[Dict[str, Any]], user_id: str, now: Optional[datetime] = None):
+        self.user_id = user_id
+        self.now = now or datetime.now()
+        self.existing = list(tasks)
+        self.new_rows: List[Dict[str, Any]] = []
+        self.completed_ids: List[str] = []
+        self.deleted_ids: List[str] = []
+
+    def visible(self) -> List[Dict[str, Any]]:
+        return self.existing + self.new_rows
+
+    @property
+    def changed(self) -> bool:
+        """Whether earlier items changed anything, i.e. the database no longer matches this view."""
+        return bool(self.new_rows or self.completed_ids or self.deleted_ids)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Tasks whose title contains every word of `query`, pending first. A plain substring match:
+        the database search also tolerates typos, so callers use this only once the view has changed.
+        """
+        words = query.lower().split()
+        found = [t for t in self.visible() if words and all(w in t["title"].lower() for w in words)]
+        return sorted(found, key=lambda t: t["status"] != "pending")[:limit]
+
+    def matches(self, ref: str) -> List[Dict[str, Any]]:
+        """
+        Candidates for a task named by id, exact title or a whole word or phrase of a title.
+        One entry is a match; several mean the reference is ambiguous and the user should be asked.
+        Copies of one title (a recurring task and its respawn) count once, pending and newer first.
+        """
+        ref = (ref or "").strip()
+        if not ref:
+            return []
+        tasks = self.visible()
+        for task in tasks:
+            if str(task.get("id")) == ref:
+                return [task]
+        low = ref.lower()
+        pattern = re.compile(r"\b" + re.escape(low) + r"\b")
+        for matches in (
+            [(i, t) for i, t in enumerate(tasks) if t["title"].lower() == low],
+            [(i, t) for i, t in enumerate(tasks) if pattern.search(t["title"].lower())],
+        ):
+            if matches:
+                best: Dict[str, Any] = {}
+                for i, task in sorted(matches, key=lambda m: (m[1]["status"] == "pending", m[0])):
+                    best[task["title"].lower()] = task
+                return list(best.values())
+        return []
+
+    def find(self, ref: str) -> Optional[Dict[str, Any]]:
+        """The task `ref` names, or None when nothing or more than one task matches."""
+        matches = self.matches(ref)
+        return matches[0] if len(matches) == 1 else None
+
+    def add(self, title: str, priority: str = "medium", recurrence: str = "none",
+            due_date: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        # Bulk inserts need the same keys on every row, or PostgREST nulls the missing columns
+        row = {
+            "title": title, "user_id": self.user_id, "priority": priority, "recurrence": recurrence,
+            "due_date": due_date, "tags": tags or [], "status": "pending", "last_completed_at": None
+        }
+        self.new_rows.append(row)
+        return row
+
+    def complete(self, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Mark completed; returns the respawned instance for a recurring task (Mission Respawn)."""
+        task["status"] = "completed"
+        task["last_completed_at"] = self.now.isoformat()
+        if "id" in task:
+            self.completed_ids.append(task["id"])
+        if not task.get("recurrence") or task["recurrence"] == "none":
+            return None
+        next_due = next_due_date(task["recurrence"], self.now)
+        return self.add(task["title"], task.get("priority") or "medium", task["recurrence"],
+                        next_due.isoformat(), task.get("tags"))
+
+    def delete(self, task: Dict[str, Any]):
+        if any(row is task for row in self.new_rows):
+            # Created earlier in this batch: it never reaches the database
+            self.new_rows = [row for row in self.new_rows if row is not task]
+            return
+        self.existing = [t for t in self.existing if t is not task]
+        if task["id"] in self.completed_ids:
+            self.completed_ids.remove(task["id"])
+        self.deleted_ids.append(task["id"])
+
+    async def commit(self, storage: TaskStorage) -> Dict[str, Any]:
+        """
+        Write the net effect in one transaction. A failed write does not raise: `failed` in the
+        returned counts lists the steps ("insert", "complete", "delete") that did not land.
+        """
+        steps = ("insert", "complete", "delete")
+        try:
+            await storage.apply_task_batch(self.user_id, self.new_rows, self.completed_ids,
+                                           self.now.isoformat(), self.deleted_ids)
+            applied = steps
+        except BatchWriteError as e:
+            print(f"Batch write failed after {e.applied}: {e.__cause__}")
+            applied = tuple(e.applied)
+        except Exception as e:
+            print(f"Batch write failed, nothing applied: {e}")
+            applied = ()
+        pending = {"insert": self.new_rows, "complete": self.completed_ids, "delete": self.deleted_ids}
+
+        if "complete" in applied:
+            for task_id in self.completed_ids:
+                reminder_scheduler.task_removed(task_id, self.user_id)
+        if "delete" in applied:
+            for task_id in self.deleted_ids:
+                reminder_scheduler.task_removed(task_id, self.user_id)
+        if "insert" in applied and any(row["due_date"] for row in self.new_rows):
+            # Bulk inserts return no ids, so the reminder window is re-read instead
+            reminder_scheduler.reload()
+        return {
+            "inserted": len(self.new_rows) if "insert" in applied else 0,
+            "completed": len(self.completed_ids) if "complete" in applied else 0,
+            "deleted": len(self.deleted_ids) if "delete" in applied else 0,
+            "failed": [step for step in steps if step not in applied and pending[step]]
+        }
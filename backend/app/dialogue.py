@@ -0,0 +1,108 @@
+"""
+Per-session dialogue state for multi-turn intents.
+
+When the agent has to ask a follow-up ("What task would you like to add?"), the
+pending intent and the slots it already extracted are kept here for a short TTL.
+The next utterance is resolved against that state first: simple answers fill the
+missing slot locally with no LLM call, and anything richer is sent to the LLM with a
+one-line state summary instead of a cold extraction.
+"""
+import os
+import re
+from typing import Any, Dict, Optional
+from app.state import StateBackend, get_state_backend, offload
+
+DIALOGUE_TTL = float(os.getenv("DIALOGUE_TTL", "300"))
+
+AFFIRMATIVES = {"yes", "yup", "yeah", "yep", "ok", "okay", "sure", "please", "ji", "haan", "han"}
+# Refusals and thanks end the pending question rather than becoming the task
+NEGATIVES = {
+    "no", "nope", "nah", "cancel", "nevermind", "never mind", "forget it", "stop", "nothing", "none",
+    "no thanks", "no thank you", "nah thanks", "not now", "not really", "maybe later", "later",
+    "thanks", "thank you", "thanks anyway", "thank you anyway", "ok thanks", "okay thanks",
+    "no need", "all good", "that's all", "thats all", "nahi", "nahin", "shukriya", "bas"
+}
+# Utterances starting with these words are new commands, not answers to the pending question
+COMMAND_PREFIXES = (
+    "show", "list", "what are", "delete", "remove", "complete", "done", "finish", "mark",
+    "start", "stop", "search", "find", "where is", "hi", "hello", "hey"
+)
+COMMAND_PATTERN = re.compile(r"^(?:" + "|".join(re.escape(p) for p in COMMAND_PREFIXES) + r")\b")
+# Dates and times need the LLM to resolve against the current time
+TEMPORAL_PATTERN = re.compile(
+    r"\b(today|tonight|tomorrow|yesterday|next|this (morning|afternoon|evening|week|month)|"
+    r"at \d|in \d+|\d{1,2}(:\d{2})?\s*(am|pm)|monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"noon|midnight|week|month|daily|weekly|monthly|every)\b",
+    re.IGNORECASE
+)
+ANSWER_LEADS = re.compile(r"^(it'?s|it is|the task is|task is|i want to|i need to|add|to)\s+", re.IGNORECASE)
+
+
+class DialogueStateStore:
+    def __init__(self, ttl: float = DIALOGUE_TTL, backend: Optional[StateBackend] = None):
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    def _key(self, session_id: str) -> str:
+        return f"dialogue:{session_id}"
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.backend.get(self._key(session_id))
+
+    def set(self, session_id: str, intent: str, slots: Dict[str, Any], missing: str):
+        # Only keep slots that carry information, so the stored state stays small
+        kept = {k: v for k, v in slots.items() if v not in (None, "", "none", "medium")}
+        self.backend.set(self._key(session_id), {"intent": intent, "slots": kept, "missing": missing}, ttl=self.ttl)
+
+    def clear(self, session_id: str):
+        self.backend.delete(self._key(session_id))
+
+    # Async variants for request handlers, so a shared backend does not block the event loop
+    async def get_async(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await offload(self.backend, self.get, session_id)
+
+    async def set_async(self, session_id: str, intent: str, slots: Dict[str, Any], missing: str):
+        await offload(self.backend, self.set, session_id, intent, slots, missing)
+
+    async def clear_async(self, session_id: str):
+        await offload(self.backend, self.clear, session_id)
+
+
+def summarize_state(state: Dict[str, Any]) -> str:
+    """Compact description of the pending turn for the LLM prompt."""
+    known = ", ".join(f"{k}={v}" for k, v in state["slots"].items()) or "none"
+    return f"Pending intent {state['intent']}; known slots: {known}; missing: {state['missing']}."
+
+
+def resolve_follow_up(state: Dict[str, Any], utterance: str) -> Dict[str, Any]:
+    """
+    Decide how an utterance relates to the pending dialogue state. Returns one of
+    {"kind": "fill", "intent", "slots"}, {"kind": "reprompt"}, {"kind": "cancel"},
+    {"kind": "llm"} (needs extraction with context) or {"kind": "new"} (unrelated command).
+    """
+    text = utterance.strip().rstrip(".!?")
+    low = text.lower()
+    # "No, thanks!" and "no thanks" compare the same
+    bare = re.sub(r"[\s,.!]+", " ", low).strip()
+    if bare in AFFIRMATIVES:
+        return {"kind": "reprompt"}
+    if bare in NEGATIVES:
+        return {"kind": "cancel"}
+    if COMMAND_PATTERN.match(low):
+        return {"kind": "new"}
+    if state["missing"] != "item" or TEMPORAL_PATTERN.search(low) or len(low.split()) > 8:
+        return {"kind": "llm"}
+
+    item = ANSWER_LEADS.sub("", text).strip()
+    if not item:
+        return {"kind": "reprompt"}
+    slots = dict(state["slots"])
+    slots["item"] = item[0].upper() + item[1:]
+    return {"kind": "fill", "intent": state["intent"], "slots": slots}
+
+
+dialogue_store = DialogueStateStore()
@@ -0,0 +1,74 @@
+"""
+Idempotency-Key support for task-mutating endpoints.
+
+The first request with a key runs normally and its response is stored against
+(user, key) together with a hash of the request body. A retry with the same key and
+body gets the stored response back without touching Supabase or the LLM. Entries
+expire after IDEMPOTENCY_TTL seconds, and the memory backend is additionally LRU-bounded.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from app.state import StateBackend, get_state_backend, offload
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long a key stays locked by a request that never finished (crashed worker)
+PENDING_TTL = 120
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, backend: Optional[StateBackend] = None):
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    def _key(self, user_id: str, key: str) -> str:
+        return f"idempotency:{user_id}:{key}"
+
+    async def run(self, user_id: str, key: Optional[str], payload: Dict[str, Any],
+                  fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Execute `fn` at most once per (user_id, key). Returns (response, replayed).
+        The response must be JSON serializable.
+        """
+        if not key:
+            return await fn(), False
+        if len(key) > 255:
+            raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+
+        store_key = self._key(user_id, key)
+        fingerprint = request_fingerprint(payload)
+        backend = self.backend
+        if not await offload(backend, backend.add, store_key, {"hash": fingerprint, "status": "pending"}, ttl=PENDING_TTL):
+            entry = await offload(backend, backend.get, store_key) or {}
+            if entry.get("hash") != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if entry.get("status") == "done":
+                print(f"Idempotent replay for {user_id}: {key}")
+                return entry["response"], True
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"}
+            )
+
+        try:
+            response = await fn()
+        except Exception:
+            # Let the client retry a request that failed before producing a response
+            await offload(backend, backend.delete, store_key)
+            raise
+        await offload(backend, backend.set, store_key, {"hash": fingerprint, "status": "done", "response": response}, ttl=self.ttl)
+        return response, False
+
+
+idempotency_store = IdempotencyStore()
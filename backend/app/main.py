@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import agent
+from app.api import agent, voice
+from app.reminders import reminder_scheduler
+from app.storage import get_storage
 
 app = FastAPI(title="AI-Powered Todo Chatbot API")
 
@@ -15,6 +17,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(agent.router, prefix="/api")
+app.include_router(voice.router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -28,4 +31,11 @@ async def test_direct():
 async def startup_event():
     print("API Routes:")
     for route in app.routes:
-        print(f"   {route.path} [{route.methods}]")
+        print(f"   {getattr(route, 'path', route)} [{getattr(route, 'methods', None)}]")
+    # Build the storage backend now, so a misconfigured one fails the boot rather than the first request
+    get_storage()
+    reminder_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await reminder_scheduler.stop()
@@ -1,11 +1,35 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from mcp.server.fastmcp import FastMCP
-from app.auth import supabase_admin as supabase
+from app.storage import get_storage
+from app.reminders import reminder_scheduler
 import logging
 
 # Initialize FastMCP server
 mcp = FastMCP("TodoAgent")
 
+def next_due_date(recurrence: str, now: datetime | None = None) -> datetime:
+    """Due date of the instance respawned when a recurring task is completed."""
+    next_due = now or datetime.now()
+    if recurrence == "daily":
+        next_due += timedelta(days=1)
+    elif recurrence == "weekly":
+        next_due += timedelta(weeks=1)
+    elif recurrence == "monthly":
+        # Simple month jump
+        next_due = next_due.replace(month=next_due.month % 12 + 1)
+    return next_due
+
+def format_task_list(tasks: list) -> str:
+    task_list = "\n".join([f"- [{t['status'].upper()}] {t['title']} (Priority: {t['priority']}, Recurrence: {t['recurrence']})" for t in tasks])
+    return f"Current Objectives:\n{task_list}"
+
+def format_search_results(query: str, tasks: list, total: int, offset: int = 0) -> str:
+    if not tasks:
+        return f"No objectives matching '{query}' in the archives."
+    # Tasks created earlier in a dispatch batch have no id until it is written
+    task_list = "\n".join([f"- [{t['status'].upper()}] {t['title']} (Priority: {t['priority']}, ID: {t.get('id', 'new')})" for t in tasks])
+    return f"Objectives matching '{query}' ({offset + 1}-{offset + len(tasks)} of {total}):\n{task_list}"
+
 @mcp.tool()
 async def add_todo(
     title: str, 
@@ -29,7 +53,8 @@ async def add_todo(
         if due_date:
             data["due_date"] = due_date
             
-        supabase.table("tasks").insert(data).execute()
+        task = await get_storage().insert_task(data)
+        reminder_scheduler.task_saved(task)
         
         msg = f"Objective '{title}' deployed."
         if due_date:
@@ -59,38 +84,61 @@ async def add_todos_bulk(
         if not data:
             return "No objectives found in the list."
             
-        supabase.table("tasks").insert(data).execute()
+        await get_storage().insert_tasks(data)
         return f"Bulk Deployment Complete: {len(data)} objectives synchronized."
     except Exception as e:
         return f"Bulk deployment error: {str(e)}"
 
 @mcp.tool()
-async def list_todos(user_id: str) -> str:
+async def list_todos(user_id: str, tags: list | None = None) -> str:
     """
-    Retrieve a list of all todo tasks for the specified user.
+    Retrieve a list of all todo tasks for the specified user, optionally only those carrying all given tags.
     """
     try:
-        response = supabase.table("tasks").select("*").eq("user_id", user_id).execute()
-        tasks = response.data
+        tasks = await get_storage().list_tasks(user_id, tags=tags or None)
         if not tasks:
+            if tags:
+                return f"No objectives tagged {', '.join(tags)} in the archives."
             return "No current objectives in the archives."
         
-        task_list = "\n".join([f"- [{t['status'].upper()}] {t['title']} (Priority: {t['priority']}, Recurrence: {t['recurrence']})" for t in tasks])
-        return f"Current Objectives:\n{task_list}"
+        return format_task_list(tasks)
     except Exception as e:
         return f"Error listing tasks: {str(e)}"
 
+@mcp.tool()
+async def search_todos(
+    user_id: str,
+    query: str,
+    status: str | None = None,
+    tags: list | None = None,
+    limit: int = 10,
+    offset: int = 0
+) -> str:
+    """
+    Search todo tasks by words in their title or description, best matches first.
+    Tolerates typos and partial words. Optionally filter by status ('pending', 'completed') and tags.
+    """
+    try:
+        query = query.strip()
+        if not query:
+            return "Tell me what to search for."
+        tasks = await get_storage().search_tasks(user_id, query, status=status, tags=tags or None,
+                                                 limit=max(1, min(limit, 50)), offset=max(0, offset))
+        return format_search_results(query, tasks, tasks[0]["total"] if tasks else 0, max(0, offset))
+    except Exception as e:
+        return f"Error searching tasks: {str(e)}"
+
 @mcp.tool()
 async def toggle_todo(task_id: str, user_id: str) -> str:
     """
     Toggle a task between pending and completed. Triggers Mission Respawn if completed.
     """
     try:
-        task_res = supabase.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id).execute()
-        if not task_res.data:
+        storage = get_storage()
+        task = await storage.get_task(task_id, user_id)
+        if not task:
             return "Task not found."
         
-        task = task_res.data[0]
         new_status = "completed" if task["status"] == "pending" else "pending"
         
         # 2. Update status
@@ -99,24 +147,22 @@ async def toggle_todo(task_id: str, user_id: str) -> str:
         if new_status == "completed":
             updates["last_completed_at"] = now
         
-        supabase.table("tasks").update(updates).eq("id", task_id).execute()
+        await storage.update_task(task_id, user_id, updates)
+        reminder_scheduler.task_saved({**task, **updates})
         
         # 3. Mission Respawn
         if new_status == "completed" and task.get("recurrence") and task["recurrence"] != "none":
-            from datetime import timedelta
-            next_due = datetime.now()
-            if task["recurrence"] == "daily": next_due += timedelta(days=1)
-            elif task["recurrence"] == "weekly": next_due += timedelta(weeks=1)
-            elif task["recurrence"] == "monthly": next_due = next_due.replace(month=next_due.month % 12 + 1)
-            
-            supabase.table("tasks").insert({
+            next_due = next_due_date(task["recurrence"])
+            respawned = await storage.insert_task({
                 "title": task["title"],
                 "user_id": user_id,
                 "priority": task["priority"],
                 "recurrence": task["recurrence"],
                 "due_date": next_due.isoformat(),
+                "tags": task.get("tags", []),
                 "status": "pending"
-            }).execute()
+            })
+            reminder_scheduler.task_saved(respawned)
             return f"Status: {new_status}. Mission Respawned!"
 
         return f"Status: {new_status}. Objective updated."
@@ -130,34 +176,25 @@ async def complete_todo(task_id: str, user_id: str) -> str:
     """
     try:
         # 1. Fetch the task to check for recurrence
-        task_res = supabase.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id).execute()
-        if not task_res.data:
+        storage = get_storage()
+        task = await storage.get_task(task_id, user_id)
+        if not task:
             return f"Objective {task_id} not found in the archives."
         
-        task = task_res.data[0]
         
         # 2. Mark current task as completed
         now = datetime.now().isoformat()
-        supabase.table("tasks").update({
+        await storage.update_task(task_id, user_id, {
             "status": "completed",
             "last_completed_at": now
-        }).eq("id", task_id).execute()
+        })
+        reminder_scheduler.task_removed(task_id, user_id)
         
         # 3. Mission Respawn (Recurrence Logic)
         if task.get("recurrence") and task["recurrence"] != "none":
-            from datetime import timedelta
-            
             # Calculate next due date
-            next_due = datetime.now()
-            if task["recurrence"] == "daily":
-                next_due += timedelta(days=1)
-            elif task["recurrence"] == "weekly":
-                next_due += timedelta(weeks=1)
-            elif task["recurrence"] == "monthly":
-                # Simple month jump
-                next_due = next_due.replace(month=next_due.month % 12 + 1)
-            
-            supabase.table("tasks").insert({
+            next_due = next_due_date(task["recurrence"])
+            respawned = await storage.insert_task({
                 "title": task["title"],
                 "user_id": user_id,
                 "priority": task["priority"],
@@ -165,7 +202,8 @@ async def complete_todo(task_id: str, user_id: str) -> str:
                 "due_date": next_due.isoformat(),
                 "tags": task.get("tags", []),
                 "status": "pending"
-            }).execute()
+            })
+            reminder_scheduler.task_saved(respawned)
             return f"Mission Accomplished! '{task['title']}' completed. A new instance has been respawned for {next_due.strftime('%Y-%m-%d')}."
 
         return f"Mission Accomplished! Objective '{task['title']}' is marked as completed."
@@ -178,7 +216,8 @@ async def delete_todo(task_id: str, user_id: str) -> str:
     Delete a specific todo task from the archives.
     """
     try:
-        response = supabase.table("tasks").delete().eq("id", task_id).eq("user_id", user_id).execute()
+        await get_storage().delete_task(task_id, user_id)
+        reminder_scheduler.task_removed(task_id, user_id)
         return f"Objective {task_id} eliminated from the archives."
     except Exception as e:
         return f"Error during elimination: {str(e)}"
@@ -189,32 +228,21 @@ async def manage_timer(task_id: str, user_id: str, action: str) -> str:
     Manage the mission clock for a task. Actions: 'start', 'stop'.
     """
     try:
-        task_res = supabase.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id).execute()
-        if not task_res.data:
-            return "Task not found."
-        
-        task = task_res.data[0]
-        now = datetime.now()
-        
+        # Start/stop are single RPCs against the append-only time_entries table, so
+        # concurrent stops cannot double count or lose time
         if action == "start":
-            supabase.table("tasks").update({"timer_started_at": now.isoformat()}).eq("id", task_id).execute()
-            return f"Mission clock started for '{task['title']}'. ⏱️"
-        
+            entry = await get_storage().start_timer(task_id, user_id)
+            if not entry:
+                return "Task not found."
+            if entry["already_running"]:
+                return f"Mission clock already running for '{entry['title']}'. ⏱️"
+            return f"Mission clock started for '{entry['title']}'. ⏱️"
+
         elif action == "stop":
-            if not task.get("timer_started_at"):
+            entry = await get_storage().stop_timer(task_id, user_id)
+            if not entry:
                 return "Mission clock was not running."
-            
-            start_time = datetime.fromisoformat(task["timer_started_at"].replace('Z', '+00:00'))
-            # Calculate elapsed time in seconds
-            elapsed = int((now.astimezone() - start_time.astimezone()).total_seconds())
-            new_total = (task.get("total_time_spent") or 0) + elapsed
-            
-            supabase.table("tasks").update({
-                "total_time_spent": new_total,
-                "timer_started_at": None
-            }).eq("id", task_id).execute()
-            
-            return f"Mission clock stopped for '{task['title']}'. Total mission time: {new_total} seconds. 📊"
+            return f"Mission clock stopped for '{entry['title']}'. Total mission time: {entry['total_time_spent']} seconds. 📊"
             
         return "Invalid timer action. Use 'start' or 'stop'."
     except Exception as e:
@@ -0,0 +1,138 @@
+"""
+Speculative understanding of utterances that are still being typed or dictated.
+
+Clients post debounced drafts to /api/agent/prefetch (and the voice route feeds its partial
+transcripts in); translation and intent extraction start right away and the pending result
+is kept for a short TTL under the normalized text. When the user sends, dispatch claims the
+matching entry, joining it if it is still running, instead of starting the LLM pipeline cold.
+
+Only one speculation per user runs at a time: a newer draft cancels the older one, and a
+dispatch cancels whatever it did not use. Cancellation takes effect at the next pipeline
+step, so an LLM request already on the wire finishes but nothing after it starts.
+
+Entries hold asyncio tasks, so the cache is per process; behind several workers the hit
+rate reflects how often the draft and the send land on the same worker.
+"""
+import os
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.api.skills import normalize_utterance
+
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "30"))
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "3"))
+PREFETCH_MAX_PER_USER = 4
+SWEEP_EVERY = 100
+
+# Words tacked on before sending that do not change the command ("buy milk" -> "buy milk please")
+IGNORABLE_TAIL = re.compile(r"^(?:(?:please|pls|plz|thanks|thank you|now|ok|okay|ji)\b[\s,]*)+$")
+
+
+@dataclass
+class Speculation:
+    task: asyncio.Task
+    context: Any
+    expires: float
+
+
+class PrefetchCache:
+    def __init__(self, ttl: float = PREFETCH_TTL, max_per_user: int = PREFETCH_MAX_PER_USER):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self._entries: Dict[str, "OrderedDict[str, Speculation]"] = {}
+        self._starts = 0
+        self.stats = {"started": 0, "cancelled": 0, "hits": 0, "extended_hits": 0, "misses": 0}
+
+    def _user(self, user_id: str) -> "OrderedDict[str, Speculation]":
+        entries = self._entries.setdefault(user_id, OrderedDict())
+        now = time.monotonic()
+        for key in [k for k, e in entries.items() if e.expires <= now]:
+            self._drop(entries, key)
+        return entries
+
+    def _drop(self, entries: "OrderedDict[str, Speculation]", key: str):
+        entry = entries.pop(key)
+        if not entry.task.done():
+            entry.task.cancel()
+            self.stats["cancelled"] += 1
+
+    def _cancel_running(self, entries: "OrderedDict[str, Speculation]"):
+        for key in [k for k, e in entries.items() if not e.task.done()]:
+            self._drop(entries, key)
+
+    def _sweep(self):
+        for user_id in list(self._entries):
+            if not self._user(user_id):
+                del self._entries[user_id]
+
+    def peek(self, user_id: str, utterance: str, context: Any = None) -> Optional[str]:
+        """"cached" or "in_flight" if this draft is already covered, else None."""
+        entry = self._user(user_id).get(normalize_utterance(utterance))
+        if entry is None or entry.context != context:
+            return None
+        return "cached" if entry.task.done() else "in_flight"
+
+    def start(self, user_id: str, utterance: str, context: Any,
+              fn: Callable[[], Awaitable[Any]]) -> str:
+        """Speculatively run `fn` for a draft. `context` must match at claim time (e.g. pending dialogue)."""
+        status = self.peek(user_id, utterance, context)
+        if status:
+            return status
+        self._starts += 1
+        if self._starts % SWEEP_EVERY == 0:
+            self._sweep()
+
+        entries = self._user(user_id)
+        # Anything still running is an older draft of what the user is typing now
+        self._cancel_running(entries)
+        key = normalize_utterance(utterance)
+        entries.pop(key, None)
+        entries[key] = Speculation(asyncio.ensure_future(fn()), context, time.monotonic() + self.ttl)
+        while len(entries) > self.max_per_user:
+            self._drop(entries, next(iter(entries)))
+        self.stats["started"] += 1
+        return "started"
+
+    def _match(self, entries: "OrderedDict[str, Speculation]", key: str):
+        if key in entries:
+            return key, "hits"
+        extended = [k for k in entries if key.startswith(k + " ") and IGNORABLE_TAIL.match(key[len(k):].strip())]
+        if extended:
+            return max(extended, key=len), "extended_hits"
+        return None, "misses"
+
+    async def claim(self, user_id: str, utterance: str, context: Any = None) -> Optional[Any]:
+        """
+        Result speculated for this utterance (or a draft it only extends with filler words),
+        awaiting it if still running. Each entry is used at most once. None on a miss.
+        """
+        entries = self._user(user_id)
+        key, kind = self._match(entries, normalize_utterance(utterance))
+        entry = entries.pop(key) if key else None
+        # The user has sent; any other speculation is stale
+        self._cancel_running(entries)
+        if entry is None or entry.context != context or entry.task.cancelled():
+            if entry is not None and not entry.task.done():
+                entry.task.cancel()
+                self.stats["cancelled"] += 1
+            self.stats["misses"] += 1
+            return None
+        try:
+            result = await asyncio.shield(entry.task)
+        except Exception as e:
+            print(f"Speculative prefetch failed, running cold: {e}")
+            self.stats["misses"] += 1
+            return None
+        self.stats[kind] += 1
+        return result
+
+    def report(self) -> Dict[str, Any]:
+        claimed = self.stats["hits"] + self.stats["extended_hits"]
+        lookups = claimed + self.stats["misses"]
+        return {**self.stats, "lookups": lookups, "hit_rate": round(claimed / lookups, 4) if lookups else 0.0}
+
+
+prefetch_cache = PrefetchCache()
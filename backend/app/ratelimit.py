@@ -0,0 +1,105 @@
+"""
+Rate limiting and request coalescing for the LLM-backed paths.
+
+- RateLimiter: token buckets kept in the shared state backend, one per (scope, id).
+  Callers that run out get a retry-after delay instead of waiting in line.
+- SingleFlight: identical in-flight calls share one execution and one result.
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from app.state import StateBackend, get_state_backend, offload
+
+
+class RateLimiter:
+    """
+    Token bucket: `rate` tokens per second refill up to `burst`. Bucket state is stored
+    in the state backend so all workers draw from the same bucket. The read-modify-write
+    is serialized per process only, so across workers it is approximate under contention.
+    """
+
+    def __init__(self, scope: str, rate: float, burst: int, backend: Optional[StateBackend] = None):
+        self.scope = scope
+        self.rate = rate
+        self.burst = burst
+        self._backend = backend
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    def acquire(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take `cost` tokens. Returns (allowed, seconds_until_allowed)."""
+        if self.rate <= 0:
+            return True, 0.0
+        bucket_key = f"ratelimit:{self.scope}:{key}"
+        # Idle buckets expire once they would have refilled anyway
+        ttl = self.burst / self.rate + 1
+        with self._lock:
+            now = time.time()
+            bucket = self.backend.get(bucket_key) or {"tokens": self.burst, "ts": now}
+            tokens = min(self.burst, bucket["tokens"] + (now - bucket["ts"]) * self.rate)
+            if tokens >= cost:
+                self.backend.set(bucket_key, {"tokens": tokens - cost, "ts": now}, ttl=ttl)
+                return True, 0.0
+            self.backend.set(bucket_key, {"tokens": tokens, "ts": now}, ttl=ttl)
+            return False, (cost - tokens) / self.rate
+
+    async def acquire_async(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """acquire() for the event loop; shared backends are called from a worker thread."""
+        if self.rate <= 0:
+            return True, 0.0
+        return await offload(self.backend, self.acquire, key, cost)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into a single awaited execution."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: a disconnecting follower must not cancel the leader's work
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._calls.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._calls.pop(key, None))
+
+
+def _per_minute(env_key: str, default: str) -> float:
+    return float(os.getenv(env_key, default)) / 60.0
+
+
+# Requests per minute per user on /dispatch, and LLM calls per minute per provider across all users
+user_limiter = RateLimiter(
+    "user", rate=_per_minute("USER_RATE_LIMIT", "30"), burst=int(os.getenv("USER_RATE_BURST", "10"))
+)
+# Speculative drafts from /prefetch and voice partials; over the limit they are skipped, not rejected
+prefetch_limiter = RateLimiter(
+    "prefetch", rate=_per_minute("PREFETCH_RATE_LIMIT", "60"), burst=int(os.getenv("PREFETCH_RATE_BURST", "10"))
+)
+provider_limiter = RateLimiter(
+    "provider", rate=_per_minute("PROVIDER_RATE_LIMIT", "300"), burst=int(os.getenv("PROVIDER_RATE_BURST", "30"))
+)
+# LLM calls made for speculative drafts draw from their own bucket, so they cannot starve real dispatches
+speculative_provider_limiter = RateLimiter(
+    "provider_prefetch", rate=_per_minute("PREFETCH_PROVIDER_RATE_LIMIT", "60"),
+    burst=int(os.getenv("PREFETCH_PROVIDER_RATE_BURST", "10"))
+)
@@ -0,0 +1,373 @@
+"""
+Due-date reminders, fired in-process from a hierarchical timing wheel.
+
+The wheel follows the classic kernel timer wheel: 256 slots of one tick, then three
+levels of 64 slots, each slot spanning a whole turn of the level below. A reminder
+goes into the slot of its deadline on the finest level that reaches it, so adding or
+cancelling one is a dict insert or delete however many are pending. Each time a level
+turns over, the next level's current slot is cascaded down. With the default one
+second tick the wheel spans about two years; later deadlines wait in the top level
+and are re-placed as they cascade.
+
+The scheduler holds only tasks due within REMINDER_HORIZON. It re-reads that window
+from storage every REMINDER_LOAD_INTERVAL, and the MCP tools keep it in step write-through. Those
+changes go out on the state backend's invalidation log, so other workers re-read the
+task. When a reminder fires it is pushed to the user's connected sessions, after a
+re-check that the task is still pending (the web app also writes to Supabase directly).
+"""
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from app.state import StateBackend, get_state_backend, offload
+from app.storage import TaskStorage, get_storage
+
+REMINDER_TICK = float(os.getenv("REMINDER_TICK", "1"))
+# Every worker re-reads all users' pending tasks due within the horizon once per load interval:
+# one paged range scan on due_date each, so cost grows with workers x tasks due in the next 15 min.
+# Shrink the horizon or raise the interval if that scan shows up on the database.
+REMINDER_HORIZON = float(os.getenv("REMINDER_HORIZON", "900"))
+REMINDER_LOAD_INTERVAL = float(os.getenv("REMINDER_LOAD_INTERVAL", "60"))
+REMINDER_LOAD_PAGE = 1000
+REMINDER_QUEUE_SIZE = 100
+NAMESPACE = "reminders"
+
+WHEEL_BITS = (8, 6, 6, 6)
+
+
+class TimingWheel:
+    """Hierarchical timing wheel over integer ticks. Keys are unique; re-adding one moves it."""
+
+    def __init__(self, start_tick: int = 0):
+        self.current = start_tick  # next tick to expire
+        self._levels = [[{} for _ in range(1 << bits)] for bits in WHEEL_BITS]
+        self._shifts = [sum(WHEEL_BITS[:level]) for level in range(len(WHEEL_BITS))]
+        self._slot_of: Dict[Hashable, Dict[Hashable, Tuple[int, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def _slot(self, deadline: int) -> Dict[Hashable, Tuple[int, Any]]:
+        delta = deadline - self.current
+        if delta < 0:
+            return self._levels[0][self.current & 0xFF]
+        for level, bits in enumerate(WHEEL_BITS):
+            shift = self._shifts[level]
+            if delta < 1 << (shift + bits):
+                return self._levels[level][(deadline >> shift) & ((1 << bits) - 1)]
+        # Past the top level: park in its furthest slot, re-placed when that cascades
+        shift, bits = self._shifts[-1], WHEEL_BITS[-1]
+        furthest = self.current + (1 << (shift + bits)) - 1
+        return self._levels[-1][(furthest >> shift) & ((1 << bits) - 1)]
+
+    def add(self, key: Hashable, deadline: int, payload: Any = None) -> None:
+        self.cancel(key)
+        slot = self._slot(deadline)
+        slot[key] = (deadline, payload)
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def _cascade(self, level: int) -> None:
+        shift, bits = self._shifts[level], WHEEL_BITS[level]
+        index = (self.current >> shift) & ((1 << bits) - 1)
+        slot = self._levels[level][index]
+        self._levels[level][index] = {}
+        for key, (deadline, payload) in slot.items():
+            target = self._slot(deadline)
+            target[key] = (deadline, payload)
+            self._slot_of[key] = target
+        if index == 0 and level + 1 < len(WHEEL_BITS):
+            self._cascade(level + 1)
+
+    def advance(self, tick: int) -> List[Tuple[Hashable, int, Any]]:
+        """Expire every tick up to and including `tick`; returns (key, deadline, payload) in order."""
+        fired = []
+        while self.current <= tick:
+            index = self.current & 0xFF
+            if index == 0:
+                self._cascade(1)
+            slot = self._levels[0][index]
+            if slot:
+                self._levels[0][index] = {}
+                for key, (deadline, payload) in slot.items():
+                    del self._slot_of[key]
+                    fired.append((key, deadline, payload))
+            self.current += 1
+        return fired
+
+
+def due_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of a due_date; naive values are UTC, as Postgres stores them."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class ReminderScheduler:
+    def __init__(self, tick: float = REMINDER_TICK, horizon: float = REMINDER_HORIZON,
+                 load_interval: float = REMINDER_LOAD_INTERVAL, storage: Optional[TaskStorage] = None,
+                 backend: Optional[StateBackend] = None, clock=time.time):
+        self.tick = tick
+        self.horizon = horizon
+        self.load_interval = load_interval
+        self._storage = storage
+        self._backend = backend
+        self.clock = clock
+        self.wheel: Optional[TimingWheel] = None
+        self.loaded_until = 0.0
+        self._next_load = 0.0
+        self._cursor: Optional[int] = None
+        self._published: Set[Optional[str]] = set()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self._jitter: deque = deque(maxlen=1000)
+        self.counters = dict.fromkeys(("loaded", "fired", "delivered", "stale", "dropped"), 0)
+
+    @property
+    def storage(self) -> TaskStorage:
+        return self._storage or get_storage()
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    @property
+    def active(self) -> bool:
+        """Started (see reset); until then the write-through hooks do nothing."""
+        return self.wheel is not None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def reset(self, now: Optional[float] = None) -> None:
+        """Empty wheel starting at `now`; nothing due before it will fire."""
+        now = self.clock() if now is None else now
+        self.wheel = TimingWheel(math.floor(now / self.tick))
+        self.loaded_until = now
+        self._next_load = 0.0
+
+    # --- Wheel updates ---
+
+    def schedule(self, task: Dict[str, Any]) -> bool:
+        """Put a task on the wheel if it is pending and due inside the loaded window, else take it off."""
+        due = due_timestamp(task.get("due_date"))
+        task_id = str(task["id"])
+        if task.get("status", "pending") != "pending" or due is None or due > self.loaded_until \
+                or due < self.wheel.current * self.tick - self.tick:
+            self.wheel.cancel(task_id)
+            return False
+        self.wheel.add(task_id, math.ceil(due / self.tick), (str(task["user_id"]), task.get("title"), due))
+        return True
+
+    def cancel(self, task_id: str) -> bool:
+        return self.wheel.cancel(str(task_id))
+
+    # --- Write-through from the tools ---
+
+    def _publish(self, key: Optional[str]) -> None:
+        self._published.add(key)
+        self.backend.publish_invalidation(NAMESPACE, key)
+
+    def task_saved(self, task: Optional[Dict[str, Any]]) -> None:
+        if not self.active or not task or not task.get("id"):
+            return
+        self.schedule(task)
+        self._publish(f"{task['user_id']}:{task['id']}")
+
+    def task_removed(self, task_id: str, user_id: str) -> None:
+        if not self.active:
+            return
+        self.cancel(task_id)
+        self._publish(f"{user_id}:{task_id}")
+
+    def reload(self) -> None:
+        """Re-read the whole window, e.g. after a bulk write that returned no ids."""
+        if not self.active:
+            return
+        self.loaded_until = self.clock()
+        self._next_load = 0.0
+        self._publish(None)
+
+    # --- Loading and cross-worker sync ---
+
+    async def load(self, now: float) -> int:
+        """
+        Page in every task coming due in (now, now + horizon]; returns how many were new.
+        The whole window is re-read each time, because the web app writes due dates to
+        Supabase directly: re-adding a task already on the wheel just moves its deadline.
+        """
+        start, end = now, now + self.horizon
+        self.loaded_until = end
+        loaded, after = 0, None
+        while True:
+            rows = await self.storage.list_due_tasks(_iso(start), _iso(end), REMINDER_LOAD_PAGE, after)
+            for row in rows:
+                fresh = str(row["id"]) not in self.wheel
+                if self.schedule(row) and fresh:
+                    loaded += 1
+            if len(rows) < REMINDER_LOAD_PAGE:
+                break
+            after = (rows[-1]["due_date"], str(rows[-1]["id"]))
+        self.counters["loaded"] += loaded
+        return loaded
+
+    async def sync(self, now: float) -> None:
+        """
+        Apply other workers' changes. A task that cannot be read is not skipped: the whole
+        window is re-read on the next load instead (deletes are then caught at delivery).
+        """
+        cursor, events = await offload(self.backend, self.backend.poll_invalidations, self._cursor or 0)
+        first_poll = self._cursor is None
+        self._cursor = cursor
+        if first_poll:
+            self._published.clear()
+            return
+        for namespace, key in events:
+            if namespace != "*":
+                if namespace != NAMESPACE:
+                    continue
+                if key in self._published:
+                    # Our own write-through, already applied
+                    self._published.discard(key)
+                    continue
+            if key is None:
+                self.loaded_until = now
+                self._next_load = 0.0
+            else:
+                user_id, _, task_id = key.partition(":")
+                try:
+                    task = await self.storage.get_task(task_id, user_id)
+                except Exception as e:
+                    print(f"Reminder sync could not read {key}, re-reading the window: {e}")
+                    self.loaded_until = now
+                    self._next_load = 0.0
+                    continue
+                if task:
+                    self.schedule(task)
+                else:
+                    self.cancel(task_id)
+
+    # --- Delivery ---
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=REMINDER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    async def deliver(self, task_id: str, payload: Tuple[str, Optional[str], float], now: float) -> bool:
+        user_id, title, due = payload
+        self.counters["fired"] += 1
+        self._jitter.append(max(0.0, now - due))
+        if not self._subscribers.get(user_id):
+            return False
+        task = await self.storage.get_task(task_id, user_id)
+        current = due_timestamp(task.get("due_date")) if task else None
+        if not task or task.get("status") != "pending" or current is None or abs(current - due) > 0.001:
+            # Completed, deleted or moved since it was scheduled; a new due date goes back on the wheel
+            self.counters["stale"] += 1
+            if task:
+                self.schedule(task)
+            return False
+        event = {"type": "reminder", "task_id": task_id, "title": task.get("title") or title, "due_date": task["due_date"]}
+        for queue in list(self._subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(event)
+                self.counters["delivered"] += 1
+            except asyncio.QueueFull:
+                self.counters["dropped"] += 1
+        return True
+
+    def fire(self, now: float) -> int:
+        """Expire the wheel up to `now` and deliver in the background."""
+        fired = self.wheel.advance(math.floor(now / self.tick))
+        for task_id, _, payload in fired:
+            delivery = asyncio.create_task(self.deliver(task_id, payload, now))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._delivered)
+        return len(fired)
+
+    def _delivered(self, delivery: asyncio.Task) -> None:
+        self._deliveries.discard(delivery)
+        if not delivery.cancelled() and delivery.exception():
+            print(f"Reminder delivery failed: {delivery.exception()}")
+
+    # --- Lifecycle ---
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            try:
+                await self.sync(now)
+                if now >= self._next_load:
+                    self._next_load = now + self.load_interval
+                    loaded = await self.load(now)
+                    if loaded:
+                        print(f"Reminders: {loaded} loaded, {len(self.wheel)} pending")
+            except Exception as e:
+                print(f"Reminder refresh failed: {e}")
+            self.fire(self.clock())
+            # Wake on the next tick boundary
+            await asyncio.sleep(self.tick - self.clock() % self.tick)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.reset()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._deliveries, return_exceptions=True)
+            self._task = None
+        self.wheel = None
+
+    def stats(self) -> Dict[str, Any]:
+        jitter = sorted(self._jitter)
+
+        def pct(p):
+            return round(jitter[min(len(jitter) - 1, int(p * len(jitter)))] * 1000, 1) if jitter else None
+
+        return {
+            "running": self.running,
+            "pending": len(self.wheel) if self.wheel else 0,
+            "loaded_until": _iso(self.loaded_until) if self.loaded_until else None,
+            "sessions": sum(len(q) for q in self._subscribers.values()),
+            **self.counters,
+            "jitter_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+        }
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,361 @@
+"""
+Replay logged utterances through the skills to check accuracy and latency before a deploy.
+
+    python -m app.replay history/interactions.json --providers stub
+    python -m app.replay export.csv --providers live --record cassette.json --output baseline.json
+    python -m app.replay export.csv --providers recorded --cassette cassette.json --baseline baseline.json
+
+Each case runs translator_urdu then intent_extractor (the cold dispatch path) on a thread
+or process pool. Inputs are the interactions JSON log ({"history": [...]} or a list), a
+JSON-lines file, or a CSV export of the `interactions` table; only `utterance` is required.
+
+Expected intents come from a previous report (--baseline, which also enables slot diffs)
+or, failing that, from the logged `action`. Relative due dates ("in 30 mins") are computed
+from each run's own clock, so a due_date counts as unchanged when it is the same instant or
+the same offset from the time its case ran. Providers:
+- stub: no LLM, so the keyword fallback rules are what is measured.
+- live: the configured providers; --record saves their responses to a cassette.
+- recorded: answers from a cassette, keyed by prompt with the timestamp removed, so prompt
+  changes show up as misses. --replay-latency sleeps the recorded latency of each call.
+
+Replays are not rate limited and do not touch the production token budgets. Provider calls
+that fell back are reported by cause: rate limits, provider errors and cassette misses.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+import contextlib
+import statistics
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from app.api.skills import SkillManager, normalize_utterance
+from app.ratelimit import RateLimiter
+from app.routing import ModelRouter, TokenBudget, UsageStats
+from app.state import MemoryStateBackend
+
+SKILLS = ("translator_urdu", "intent_extractor")
+# Logged dispatch actions and the intent that produced them
+ACTION_INTENTS = {
+    "create": "add_task", "clarify_add_task": "add_task", "list": "list_tasks", "search": "search_tasks",
+    "update": "complete_task", "delete": "delete_task", "timer": "manage_timer", "greeting": "greeting",
+    "clarify": "clarify",
+}
+TIMESTAMP_LINE = re.compile(r"Current Time: \S+")
+
+
+def load_interactions(path: str) -> List[Dict[str, Any]]:
+    """Rows with an utterance from a JSON log, JSON-lines file or CSV table export."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            rows = data.get("history", []) if isinstance(data, dict) else data
+    return [r for r in rows if (r.get("utterance") or "").strip()]
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(TIMESTAMP_LINE.sub("", prompt).encode()).hexdigest()
+
+
+class Cassette:
+    """Provider responses keyed by prompt. Loaded for replay, or filled while recording."""
+
+    def __init__(self, entries: Optional[Dict[str, Any]] = None):
+        self.entries = entries or {}
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+
+    def put(self, prompt: str, content: str, usage: Any, latency: float):
+        with self._lock:
+            self.entries[prompt_key(prompt)] = {
+                "content": content, "latency": latency,
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+            }
+
+    def get(self, prompt: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(prompt_key(prompt))
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+        return entry
+
+
+def _completion(content: str, prompt_tokens=None, completion_tokens=None):
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class CassetteClient:
+    """Stands in for an OpenAI client, answering from a cassette."""
+
+    def __init__(self, cassette: Cassette, replay_latency: bool = False):
+        self.cassette = cassette
+        self.replay_latency = replay_latency
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        entry = self.cassette.get(messages[-1]["content"])
+        if entry is None:
+            raise LookupError("prompt not in cassette")
+        if self.replay_latency:
+            time.sleep(entry["latency"])
+        return _completion(entry["content"], entry["prompt_tokens"], entry["completion_tokens"])
+
+
+class RecordingClient:
+    """Wraps a live client and copies every response into a cassette."""
+
+    def __init__(self, client: Any, cassette: Cassette):
+        self.client = client
+        self.cassette = cassette
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        self.cassette.put(messages[-1]["content"], response.choices[0].message.content,
+                          getattr(response, "usage", None), time.perf_counter() - started)
+        return response
+
+
+def build_manager(providers: str, cassette: Optional[Cassette] = None, replay_latency: bool = False) -> SkillManager:
+    """
+    A manager with its own unlimited provider limiter and an unbudgeted router, so a replay
+    neither falls back for the production rate limit nor charges the production token counters.
+    """
+    manager = SkillManager()
+    manager.limiter = RateLimiter("replay", rate=0, burst=0, backend=MemoryStateBackend())
+    manager.router = ModelRouter(TokenBudget(user_budget=0, global_budget=0, backend=MemoryStateBackend()), UsageStats())
+    if providers == "stub":
+        manager.clients = []
+    elif providers == "recorded":
+        models = dict.fromkeys(("light", "standard", "heavy"), "recorded")
+        manager.clients = [{"name": "Cassette", "client": CassetteClient(cassette, replay_latency),
+                            "model": "recorded", "models": models}]
+    elif cassette is not None:
+        for provider in manager.clients:
+            provider["client"] = RecordingClient(provider["client"], cassette)
+    return manager
+
+
+def run_case(manager: SkillManager, utterance: str) -> Dict[str, Any]:
+    timings = {}
+    ran_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    translation = manager.execute_skill("translator_urdu", {"utterance": utterance})
+    timings["translator_urdu"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    intent = manager.execute_skill("intent_extractor", {"utterance": translation.get("utterance_en", utterance)})
+    timings["intent_extractor"] = time.perf_counter() - started
+    return {
+        "utterance": utterance,
+        "detected_lang": translation.get("detected_lang"),
+        "intent": intent.get("intent"),
+        "slots": intent.get("slots") or {},
+        "timings": timings,
+        "ran_at": ran_at,
+    }
+
+
+# Process pool workers build their own manager once
+_worker_manager: Optional[SkillManager] = None
+
+
+def _init_worker(providers: str, cassette_entries: Optional[Dict[str, Any]], replay_latency: bool):
+    global _worker_manager
+    cassette = Cassette(cassette_entries) if cassette_entries is not None else None
+    _worker_manager = build_manager(providers, cassette, replay_latency)
+
+
+def _run_in_worker(utterance: str) -> Dict[str, Any]:
+    return run_case(_worker_manager, utterance)
+
+
+def replay(utterances: List[str], manager: Optional[SkillManager] = None, workers: int = 8,
+           executor: str = "thread", providers: str = "stub", cassette: Optional[Cassette] = None,
+           replay_latency: bool = False) -> List[Dict[str, Any]]:
+    """Results in input order. Threads share `manager`; processes each build one (not for recording)."""
+    if executor == "process":
+        entries = cassette.entries if cassette is not None and providers == "recorded" else None
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(providers, entries, replay_latency)) as pool:
+            return list(pool.map(_run_in_worker, utterances, chunksize=max(1, len(utterances) // (workers * 4))))
+    manager = manager or build_manager(providers, cassette, replay_latency)
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda u: run_case(manager, u), utterances))
+
+
+def fallback_summary(manager: SkillManager, cassette: Optional[Cassette] = None) -> Dict[str, int]:
+    """Provider calls that did not answer, by cause; each one fell back to the next provider or the keyword rules."""
+    stats = (manager.router.stats if manager.router else UsageStats()).report().values()
+    misses = cassette.misses if cassette is not None else 0
+    return {
+        "rate_limited": sum(s["rate_limited"] for s in stats),
+        "provider_errors": sum(s["failures"] for s in stats) - misses,
+        "cassette_misses": misses,
+    }
+
+
+def due_offset(due: Any, ran_at: Optional[str]) -> Optional[float]:
+    """Seconds from the time a case ran to its due date, or None when either is missing or unparsable."""
+    try:
+        due_at, ran = datetime.fromisoformat(due), datetime.fromisoformat(ran_at)
+    except (TypeError, ValueError):
+        return None
+    # Model answers are often naive local times
+    return (due_at.astimezone() - ran.astimezone()).total_seconds()
+
+
+def diff_slots(expected: Dict[str, Any], actual: Dict[str, Any],
+               expected_at: Optional[str] = None, actual_at: Optional[str] = None) -> Dict[str, List[Any]]:
+    norm = lambda v: normalize_utterance(v) if isinstance(v, str) else v
+
+    def same(key):
+        if norm(expected.get(key)) == norm(actual.get(key)):
+            return True
+        if key != "due_date":
+            return False
+        offsets = due_offset(expected.get(key), expected_at), due_offset(actual.get(key), actual_at)
+        # A minute covers the skill latency between the clock read and the due date
+        return None not in offsets and abs(offsets[0] - offsets[1]) < 60
+
+    return {key: [expected.get(key), actual.get(key)] for key in sorted(set(expected) | set(actual)) if not same(key)}
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {
+        "count": len(ordered), "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def build_report(rows: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                 baseline: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Agreement with the baseline results (same order) or the logged actions, slot diffs and latency."""
+    compared, agreed, confusion, slot_diffs = 0, 0, {}, []
+    for i, (row, result) in enumerate(zip(rows, results)):
+        expected_slots = expected_at = None
+        if baseline is not None:
+            expected = baseline[i]["intent"]
+            expected_slots = baseline[i].get("slots") or {}
+            expected_at = baseline[i].get("ran_at")
+        else:
+            expected = ACTION_INTENTS.get(row.get("action"))
+        if expected is None:
+            continue
+        compared += 1
+        if result["intent"] == expected:
+            agreed += 1
+            if expected_slots is not None:
+                diff = diff_slots(expected_slots, result["slots"], expected_at, result.get("ran_at"))
+                if diff:
+                    slot_diffs.append({"index": i, "utterance": result["utterance"], "diff": diff})
+        else:
+            pair = f"{expected} -> {result['intent']}"
+            confusion[pair] = confusion.get(pair, 0) + 1
+
+    return {
+        "cases": len(results),
+        "compared": compared,
+        "agreement": round(agreed / compared, 4) if compared else None,
+        "confusion": dict(sorted(confusion.items(), key=lambda kv: -kv[1])),
+        "slot_diffs": slot_diffs,
+        "latency": {skill: latency_summary([r["timings"][skill] for r in results]) for skill in SKILLS} if results else {},
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay logged utterances through the skills.")
+    parser.add_argument("interactions", help="interactions JSON log, .jsonl or .csv table export")
+    parser.add_argument("--providers", choices=("stub", "live", "recorded"), default="stub")
+    parser.add_argument("--cassette", help="recorded provider responses (with --providers recorded)")
+    parser.add_argument("--record", help="save live provider responses to this cassette")
+    parser.add_argument("--replay-latency", action="store_true", help="sleep each recorded call's latency")
+    parser.add_argument("--baseline", help="report from an earlier run to compare intents and slots against")
+    parser.add_argument("--output", help="write the full JSON report (usable as a later --baseline)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--limit", type=int, help="only the first N interactions")
+    parser.add_argument("--quiet", action="store_true", help="silence per-call skill logging")
+    args = parser.parse_args(argv)
+
+    if args.providers == "recorded" and not args.cassette:
+        parser.error("--providers recorded needs --cassette")
+    if args.record and (args.providers != "live" or args.executor != "thread"):
+        parser.error("--record needs --providers live with the thread executor")
+
+    rows = load_interactions(args.interactions)[:args.limit]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if len(baseline) < len(rows):
+            parser.error(f"baseline has {len(baseline)} results for {len(rows)} interactions")
+    cassette = Cassette.load(args.cassette) if args.cassette else Cassette() if args.record else None
+
+    # Thread workers share this manager, so its counters cover the whole run
+    manager = build_manager(args.providers, cassette, args.replay_latency) if args.executor == "thread" else None
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")) if args.quiet else contextlib.nullcontext():
+        results = replay([r["utterance"].strip() for r in rows], manager=manager, workers=args.workers,
+                         executor=args.executor, providers=args.providers, cassette=cassette,
+                         replay_latency=args.replay_latency)
+    elapsed = time.perf_counter() - started
+    report = build_report(rows, results, baseline)
+    report["fallbacks"] = fallback_summary(manager, cassette) if manager else None
+
+    if args.record:
+        cassette.save(args.record)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    source = "baseline" if baseline is not None else "logged actions"
+    print(f"Replayed {report['cases']} utterances in {elapsed:.2f}s ({args.providers} providers, "
+          f"{args.workers} {args.executor} workers)")
+    if report["compared"]:
+        print(f"Intent agreement vs {source}: {report['agreement']:.1%} of {report['compared']}")
+    for pair, count in report["confusion"].items():
+        print(f"  {count:5d}  {pair}")
+    if baseline is not None:
+        print(f"Slot diffs: {len(report['slot_diffs'])}")
+        for item in report["slot_diffs"][:20]:
+            print(f"  #{item['index']} {item['utterance']!r}: {item['diff']}")
+    for skill, stats in report["latency"].items():
+        print(f"{skill:18s} p50 {stats['p50_ms']:8.2f} ms  p90 {stats['p90_ms']:8.2f} ms  "
+              f"p99 {stats['p99_ms']:8.2f} ms  max {stats['max_ms']:8.2f} ms")
+    fallbacks = report["fallbacks"]
+    if fallbacks and fallbacks["rate_limited"]:
+        print(f"Rate-limited provider calls: {fallbacks['rate_limited']} (those calls used the fallback)")
+    if fallbacks and fallbacks["provider_errors"]:
+        print(f"Failed provider calls: {fallbacks['provider_errors']} (those calls used the fallback)")
+    if fallbacks and fallbacks["cassette_misses"]:
+        print(f"Cassette misses: {fallbacks['cassette_misses']} (prompt changed since recording; those calls used the fallback)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
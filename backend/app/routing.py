@@ -0,0 +1,208 @@
+"""
+Model routing and token accounting for the LLM skills.
+
+Every extraction used to go to the same model. The router now scores how hard an
+utterance is and picks a tier per call:
+- light: short single commands ("show tasks", "buy milk"), the provider's small model.
+- standard: dates and times to resolve, longer commands, follow-up answers.
+- heavy: Urdu, several items in one command, or a mix of hard signals.
+
+Each provider maps the tiers to its own models (see SkillManager). Token budgets are
+counted per UTC day in the shared state backend, per user and globally (off unless set): close to the
+limit calls drop to the light tier, and past it the skills fall back to keyword logic.
+Prompt/completion tokens and latency are recorded per model from the API `usage` field.
+Speculative calls for drafts go through speculative_router, whose budget is counted
+separately, so prefetching cannot push real dispatches down a tier or onto keywords.
+"""
+import os
+import re
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from app.dialogue import TEMPORAL_PATTERN
+from app.state import StateBackend, get_state_backend
+
+TIERS = ("light", "standard", "heavy")
+# Tokens per UTC day; 0 (the default) disables the budget
+USER_TOKEN_BUDGET = int(os.getenv("USER_TOKEN_BUDGET", "0"))
+GLOBAL_TOKEN_BUDGET = int(os.getenv("GLOBAL_TOKEN_BUDGET", "0"))
+# Speculative understanding of drafts (/prefetch, voice partials) has its own counters
+PREFETCH_USER_TOKEN_BUDGET = int(os.getenv("PREFETCH_USER_TOKEN_BUDGET", "0"))
+PREFETCH_GLOBAL_TOKEN_BUDGET = int(os.getenv("PREFETCH_GLOBAL_TOKEN_BUDGET", "0"))
+# Share of a budget after which calls are routed to the light tier
+BUDGET_DOWNGRADE_AT = float(os.getenv("BUDGET_DOWNGRADE_AT", "0.8"))
+# Rough completion size for the pre-call budget check
+COMPLETION_ESTIMATE = 150
+LATENCY_WINDOW = 500
+
+NON_LATIN = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u0900-\u097F]")
+LIST_PATTERN = re.compile(r",|;|\n|\b(and|also|then|plus)\b|^\s*\d+[.)]", re.IGNORECASE | re.MULTILINE)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def score_complexity(utterance: str, context: Optional[str] = None) -> Dict[str, Any]:
+    """Signals that make an utterance hard to extract, summed into a score and a tier."""
+    signals: List[str] = []
+    words = len(utterance.split())
+    if words > 12:
+        signals.append("long")
+    if words > 30:
+        signals.append("very_long")
+    if NON_LATIN.search(utterance):
+        signals += ["non_latin", "non_latin"]  # translation and slot values both suffer on small models
+    if TEMPORAL_PATTERN.search(utterance):
+        signals.append("temporal")
+    list_marks = len(LIST_PATTERN.findall(utterance))
+    if list_marks:
+        signals.append("list")
+        if list_marks > 1:
+            signals.append("list")
+    if context:
+        signals.append("context")
+    score = len(signals)
+    tier = "light" if score == 0 else "standard" if score <= 2 else "heavy"
+    return {"score": score, "tier": tier, "signals": sorted(set(signals))}
+
+
+def max_tier(*tiers: str) -> str:
+    return max(tiers, key=TIERS.index)
+
+
+class TokenBudget:
+    def __init__(self, user_budget: int = USER_TOKEN_BUDGET, global_budget: int = GLOBAL_TOKEN_BUDGET,
+                 backend: Optional[StateBackend] = None, scope: str = "tokens"):
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self._backend = backend
+        # Counter key prefix; separate scopes never draw from each other
+        self.scope = scope
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    def _keys(self, user_id: Optional[str]):
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        keys = [(f"{self.scope}:global:{day}", self.global_budget)]
+        if user_id:
+            keys.append((f"{self.scope}:user:{user_id}:{day}", self.user_budget))
+        return keys
+
+    def usage(self, user_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        report = {}
+        for (key, budget), scope in zip(self._keys(user_id), ("global", "user")):
+            used = int(self.backend.get(key) or 0)
+            report[scope] = {"used": used, "budget": budget, "exhausted": bool(budget) and used + COMPLETION_ESTIMATE > budget}
+        return report
+
+    def exhausted(self, user_id: Optional[str] = None) -> bool:
+        """Whether even a minimal call would overrun a budget, i.e. the skills are on keyword logic for this user."""
+        return self.check(user_id, COMPLETION_ESTIMATE) == "exhausted"
+
+    def check(self, user_id: Optional[str], estimate: int) -> str:
+        """"ok", "downgrade" (close to a limit) or "exhausted"."""
+        status = "ok"
+        for key, budget in self._keys(user_id):
+            if not budget:
+                continue
+            used = int(self.backend.get(key) or 0)
+            if used + estimate > budget:
+                return "exhausted"
+            if used + estimate > budget * BUDGET_DOWNGRADE_AT:
+                status = "downgrade"
+        return status
+
+    def charge(self, user_id: Optional[str], tokens: int):
+        for key, _ in self._keys(user_id):
+            # Two days, so the counter outlives the whole UTC day it covers
+            self.backend.incr(key, tokens, ttl=172800)
+
+
+class UsageStats:
+    """Per-model call counts, tokens and latency for this worker. Skills run in threads, hence the lock."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, provider: str, model: str) -> Dict[str, Any]:
+        return self._models.setdefault(f"{provider}/{model}", {
+            "calls": 0, "failures": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "tiers": {}, "latencies": deque(maxlen=self.window)
+        })
+
+    def record(self, provider: str, model: str, tier: str, latency: float,
+               prompt_tokens: int = 0, completion_tokens: int = 0, ok: bool = True):
+        with self._lock:
+            stats = self._entry(provider, model)
+            stats["calls"] += 1
+            if not ok:
+                stats["failures"] += 1
+                return
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["tiers"][tier] = stats["tiers"].get(tier, 0) + 1
+            stats["latencies"].append(latency)
+
+    def record_rate_limited(self, provider: str, model: str):
+        """A call skipped by the provider rate limiter; not counted in `calls`."""
+        with self._lock:
+            self._entry(provider, model)["rate_limited"] += 1
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            report = {}
+            for name, stats in self._models.items():
+                latencies = sorted(stats["latencies"])
+                pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 4) if latencies else None
+                report[name] = {
+                    **{k: v for k, v in stats.items() if k != "latencies"},
+                    "tiers": dict(stats["tiers"]),
+                    "latency_p50": pick(0.5),
+                    "latency_p95": pick(0.95),
+                }
+            return report
+
+
+class ModelRouter:
+    def __init__(self, budget: Optional[TokenBudget] = None, stats: Optional[UsageStats] = None):
+        self.budget = budget or TokenBudget()
+        self.stats = stats or UsageStats()
+
+    def route(self, prompt: str, tier: str, user_id: Optional[str] = None) -> Optional[str]:
+        """Tier to call with after the budget check, or None when the budget is spent."""
+        status = self.budget.check(user_id, estimate_tokens(prompt) + COMPLETION_ESTIMATE)
+        if status == "exhausted":
+            print(f"Router: token budget exhausted for {user_id or 'global'}; using keyword logic")
+            return None
+        if status == "downgrade" and tier != "light":
+            print(f"Router: token budget nearly spent for {user_id or 'global'}; {tier} -> light")
+            return "light"
+        return tier
+
+    def record(self, provider: str, model: str, tier: str, user_id: Optional[str], started: float,
+               usage: Any = None, prompt: str = "", completion: str = ""):
+        latency = time.perf_counter() - started
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or estimate_tokens(prompt)
+        completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(completion)
+        self.stats.record(provider, model, tier, latency, prompt_tokens, completion_tokens)
+        self.budget.charge(user_id, prompt_tokens + completion_tokens)
+
+    def record_failure(self, provider: str, model: str, tier: str, started: float):
+        self.stats.record(provider, model, tier, time.perf_counter() - started, ok=False)
+
+    def record_rate_limited(self, provider: str, model: str):
+        self.stats.record_rate_limited(provider, model)
+
+
+model_router = ModelRouter()
+# Speculative calls are charged to their own budget scope but show up in the same per-model stats
+speculative_router = ModelRouter(
+    TokenBudget(PREFETCH_USER_TOKEN_BUDGET, PREFETCH_GLOBAL_TOKEN_BUDGET, scope="tokens:prefetch"), model_router.stats
+)
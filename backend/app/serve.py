@@ -0,0 +1,32 @@
+"""
+Multi-worker entry point for the API.
+
+    python -m app.serve --workers 4 --port 8000
+
+Each worker is a separate process with its own event loop, so caches must live in a
+shared STATE_BACKEND (sqlite:///... on one host, redis://... across hosts) for
+workers to agree on them. The in-process "memory" backend is only safe with one worker.
+"""
+import os
+import argparse
+import uvicorn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Todo Chatbot API with N worker processes.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    state_backend = os.getenv("STATE_BACKEND", "memory")
+    if args.workers > 1 and state_backend == "memory":
+        print(f"WARNING: {args.workers} workers with STATE_BACKEND=memory. Caches will not be shared; "
+              "set STATE_BACKEND=sqlite:///state.db or redis://...")
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Shared state backend for caches that must survive across API workers.
+
+Selected with the STATE_BACKEND environment variable:
+- "memory" (default): in-process, bounded LRU with TTLs. Fine for a single worker.
+- "sqlite:///state.db": one SQLite file in WAL mode shared by all workers on a host.
+- "redis://host:6379/0": any Redis-protocol server shared by every worker and pod.
+
+Values are JSON encoded so every backend stores the same thing. Invalidations are
+appended to a shared, sequence-numbered log that each worker polls, so a cache
+entry dropped on one worker is dropped everywhere.
+
+The SQLite and Redis backends do blocking I/O; async callers go through offload(),
+which runs the call in a worker thread unless the backend is in-process.
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class StateBackend:
+    """Key/value store with TTLs plus a broadcast log for cache invalidation."""
+
+    name = "base"
+    # Whether calls do I/O that must be kept off the event loop
+    blocking = True
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set only if the key is absent. Returns True if the value was stored."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to an integer counter. The TTL is applied when the key is created."""
+        raise NotImplementedError
+
+    def publish_invalidation(self, namespace: str, key: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def poll_invalidations(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        """
+        Return (new_cursor, [(namespace, key), ...]) published after `cursor`.
+        A namespace of "*" means the log was truncated and every cache should be flushed.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """In-process backend. Bounded so a flood of unique keys cannot grow memory forever."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000, max_log: int = 1000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._log: deque = deque(maxlen=max_log)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> bool:
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return False
+        return True
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]):
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (json.dumps(value), expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if not self._live(key):
+                return None
+            self._data.move_to_end(key)
+            return json.loads(self._data[key][0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key):
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            if self._live(key):
+                raw, expires_at = self._data[key]
+                value = int(json.loads(raw)) + amount
+                self._data[key] = (json.dumps(value), expires_at)
+                return value
+            self._store(key, amount, ttl)
+            return amount
+
+    def publish_invalidation(self, namespace: str, key: Optional[str] = None) -> None:
+        with self._lock:
+            self._seq += 1
+            self._log.append((self._seq, namespace, key))
+
+    def poll_invalidations(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        with self._lock:
+            if self._log and cursor < self._log[0][0] - 1:
+                return self._seq, [("*", None)]
+            return self._seq, [(ns, k) for seq, ns, k in self._log if seq > cursor]
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Single-host shared backend. WAL mode lets every worker read concurrently while
+    one writes, and the file is the only coordination point between processes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, log_retention: float = 300.0):
+        self.path = path
+        self.log_retention = log_retention
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                key TEXT,
+                created_at REAL NOT NULL
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at)
+        )
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            conn.execute("COMMIT")
+            return cur.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+            ).fetchone()
+            if row:
+                value = int(json.loads(row[0])) + amount
+                conn.execute("UPDATE kv SET value = ? WHERE key = ?", (json.dumps(value), key))
+            else:
+                value = amount
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def publish_invalidation(self, namespace: str, key: Optional[str] = None) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT INTO invalidations (namespace, key, created_at) VALUES (?, ?, ?)", (namespace, key, now))
+        conn.execute("DELETE FROM invalidations WHERE created_at < ?", (now - self.log_retention,))
+        conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def poll_invalidations(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT seq, namespace, key FROM invalidations WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        if rows and cursor and rows[0][0] > cursor + 1:
+            return rows[-1][0], [("*", None)]
+        if not rows:
+            return cursor, []
+        return rows[-1][0], [(ns, k) for _, ns, k in rows]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Cluster-wide backend for any server speaking the Redis protocol. Takes a
+    redis-py compatible client, or a URL (requires `pip install redis`).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: Optional[str] = None, client: Any = None, prefix: str = "todo:", log_retention: int = 300):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("STATE_BACKEND points at Redis but the 'redis' package is not installed.")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.log_retention = log_retention
+
+    def _k(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self._k(key))
+        return json.loads(raw) if raw is not None else None
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        # Milliseconds, so sub-second TTLs (rate limit buckets) do not round down to "no expiry"
+        return max(1, int(ttl * 1000)) if ttl else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.client.set(self._k(key), json.dumps(value), px=self._px(ttl))
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(self._k(key), json.dumps(value), px=self._px(ttl), nx=True))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._k(key))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return int(self.client.incrby(self._k(key), amount))
+        # One MULTI/EXEC: the key is created with its expiry before the increment, so a counter
+        # can never be left without a TTL, and an existing key keeps the TTL it was created with
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._k(key), 0, px=self._px(ttl), nx=True)
+        pipe.incrby(self._k(key), amount)
+        _, value = pipe.execute()
+        return int(value)
+
+    def publish_invalidation(self, namespace: str, key: Optional[str] = None) -> None:
+        seq = int(self.client.incrby(self._k("inv:seq"), 1))
+        self.client.set(self._k(f"inv:{seq}"), json.dumps([namespace, key]), ex=self.log_retention)
+
+    def poll_invalidations(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        raw = self.client.get(self._k("inv:seq"))
+        head = int(raw) if raw is not None else 0
+        if head <= cursor:
+            return head, []
+        if head - cursor > 1000:
+            return head, [("*", None)]
+        entries = self.client.mget([self._k(f"inv:{seq}") for seq in range(cursor + 1, head + 1)])
+        if any(e is None for e in entries):
+            return head, [("*", None)]
+        return head, [tuple(json.loads(e)) for e in entries]
+
+
+async def offload(backend: StateBackend, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Call `fn` for an async caller: directly for in-process backends, in a worker thread otherwise."""
+    if not backend.blocking:
+        return fn(*args, **kwargs)
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+def create_state_backend(spec: Optional[str] = None) -> StateBackend:
+    spec = spec or os.getenv("STATE_BACKEND", "memory")
+    if spec == "memory":
+        return MemoryStateBackend(max_entries=int(os.getenv("STATE_MAX_ENTRIES", "10000")))
+    if spec.startswith("sqlite://"):
+        # sqlite:///state.db is relative to the working directory, sqlite:////var/lib/state.db absolute
+        return SQLiteStateBackend(spec[len("sqlite:///"):])
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url=spec)
+    raise ValueError(f"Unknown STATE_BACKEND: {spec}")
+
+
+class NamespaceCache:
+    """
+    Per-worker near-cache in front of the shared backend. Reads are served locally
+    until another worker publishes an invalidation for the key or namespace.
+    """
+
+    def __init__(self, namespace: str, ttl: float, backend: Optional[StateBackend] = None,
+                 max_local: int = 1000, poll_interval: float = 0.5):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+        self.max_local = max_local
+        self.poll_interval = poll_interval
+        self._local: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._cursor: Optional[int] = None
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> StateBackend:
+        return self._backend or get_state_backend()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._cursor is not None and now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        cursor, events = self.backend.poll_invalidations(self._cursor or 0)
+        first_poll = self._cursor is None
+        self._cursor = cursor
+        if first_poll:
+            return
+        with self._lock:
+            for namespace, key in events:
+                if namespace == "*" or (namespace == self.namespace and key is None):
+                    self._local.clear()
+                elif namespace == self.namespace:
+                    self._local.pop(key, None)
+
+    def get(self, key: str) -> Optional[Any]:
+        self._sync()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._local.move_to_end(key)
+                return entry[0]
+        value = self.backend.get(self._key(key))
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + self.ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def set(self, key: str, value: Any):
+        self.backend.set(self._key(key), value, ttl=self.ttl)
+        self._remember(key, value)
+
+    def invalidate(self, key: str):
+        self.backend.delete(self._key(key))
+        with self._lock:
+            self._local.pop(key, None)
+        self.backend.publish_invalidation(self.namespace, key)
+
+    def get_or_set(self, key: str, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_state_backend()
+                print(f"State backend: {_backend.name}")
+    return _backend
+
+
+def set_state_backend(backend: StateBackend) -> None:
+    global _backend
+    _backend = backend
@@ -0,0 +1,42 @@
+"""
+Storage backends for task and interaction data, selected with STORAGE_BACKEND:
+- "supabase" (default): PostgREST over HTTP with the service-role client.
+- "postgres": pooled asyncpg connections to DATABASE_URL (asyncpg is in requirements.txt).
+"""
+import os
+from typing import Optional
+from .base import TaskStorage, BatchWriteError, Cursor, UPDATABLE_TASK_COLUMNS
+from .supabase_store import SupabaseStorage
+from .postgres_store import PostgresStorage
+
+
+def create_storage(kind: Optional[str] = None) -> TaskStorage:
+    kind = kind or os.getenv("STORAGE_BACKEND", "supabase")
+    if kind == "supabase":
+        return SupabaseStorage()
+    if kind == "postgres":
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires DATABASE_URL")
+        return PostgresStorage(
+            dsn,
+            min_size=int(os.getenv("DB_POOL_MIN", "2")),
+            max_size=int(os.getenv("DB_POOL_MAX", "10"))
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
+
+
+_storage: Optional[TaskStorage] = None
+
+
+def get_storage() -> TaskStorage:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+        print(f"Storage backend: {_storage.name}")
+    return _storage
+
+
+def set_storage(storage: TaskStorage) -> None:
+    global _storage
+    _storage = storage
@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# (created_at, id) position of a row, used for keyset pagination
+Cursor = Tuple[str, str]
+
+# Columns callers may change through update_task
+UPDATABLE_TASK_COLUMNS = {
+    "title", "description", "status", "priority", "recurrence", "due_date", "tags",
+    "total_time_spent", "timer_started_at", "last_completed_at"
+}
+
+
+class BatchWriteError(Exception):
+    """A non-atomic batch write failed part way; `applied` lists the steps that landed."""
+
+    def __init__(self, applied: List[str]):
+        super().__init__(f"batch write failed after {applied or 'no steps'}")
+        self.applied = applied
+
+
+class TaskStorage:
+    """
+    Storage operations for tasks and interactions. Every method takes the owning
+    user_id explicitly; implementations run with elevated privileges and must
+    scope every query by it. Rows are returned as JSON-friendly dicts (ids and
+    timestamps as strings) whatever the backend.
+    """
+
+    name = "base"
+
+    # --- tasks ---
+    async def insert_task(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def insert_tasks(self, rows: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    async def get_task(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def list_tasks(self, user_id: str, limit: Optional[int] = None, newest_first: bool = False,
+                         tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """All of the user's tasks, or only those carrying every tag in `tags`."""
+        raise NotImplementedError
+
+    async def list_tasks_page(self, user_id: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        """Keyset page of tasks, oldest first, strictly after the (created_at, id) cursor."""
+        raise NotImplementedError
+
+    async def list_due_tasks(self, start: str, end: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        """
+        Pending tasks of every user due in (start, end], as id, user_id, title and due_date,
+        in keyset pages strictly after the (due_date, id) cursor.
+        """
+        raise NotImplementedError
+
+    async def update_task(self, task_id: str, user_id: str, updates: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def delete_task(self, task_id: str, user_id: str) -> None:
+        raise NotImplementedError
+
+    async def update_tasks(self, task_ids: List[str], user_id: str, updates: Dict[str, Any]) -> None:
+        """Apply the same updates to several tasks in one write."""
+        raise NotImplementedError
+
+    async def delete_tasks(self, task_ids: List[str], user_id: str) -> None:
+        raise NotImplementedError
+
+    async def apply_task_batch(self, user_id: str, rows: List[Dict[str, Any]], complete_ids: List[str],
+                               completed_at: str, delete_ids: List[str]) -> None:
+        """
+        Insert `rows`, mark `complete_ids` completed at `completed_at` and delete `delete_ids`.
+        Backends do this in one transaction. This fallback is not atomic: it writes in that
+        order and raises BatchWriteError naming the steps that landed before the failure.
+        """
+        applied: List[str] = []
+        try:
+            if rows:
+                await self.insert_tasks(rows)
+            applied.append("insert")
+            if complete_ids:
+                await self.update_tasks(complete_ids, user_id, {"status": "completed", "last_completed_at": completed_at})
+            applied.append("complete")
+            if delete_ids:
+                await self.delete_tasks(delete_ids, user_id)
+            applied.append("delete")
+        except Exception as e:
+            raise BatchWriteError(applied) from e
+
+    async def search_tasks(self, user_id: str, query: str, status: Optional[str] = None,
+                           tags: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Ranked matches, best first. Every row carries `rank` and `total` (matches before paging)."""
+        raise NotImplementedError
+
+    async def tag_facets(self, user_id: str, tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """{tag, pending, completed, total} per tag, most used first, over tasks carrying every tag in `tags`."""
+        raise NotImplementedError
+
+    # --- mission clock ---
+    async def start_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {title, started_at, already_running}, or None if the task does not exist."""
+        raise NotImplementedError
+
+    async def stop_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {title, elapsed_seconds, total_time_spent}, or None if no clock was running."""
+        raise NotImplementedError
+
+    async def time_analytics(self, user_id: str, from_date: str, to_date: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # --- interactions ---
+    async def insert_interaction(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def insert_interactions(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk insert; returns the stored rows in input order."""
+        raise NotImplementedError
+
+    async def list_interactions(self, user_id: str, limit: int, since: Optional[Cursor] = None,
+                                before: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        """
+        Keyset page of interactions. With `since`: oldest first, strictly after the cursor.
+        Otherwise newest first, strictly before `before` when given.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+def check_update_columns(updates: Dict[str, Any]):
+    unknown = set(updates) - UPDATABLE_TASK_COLUMNS
+    if unknown:
+        raise ValueError(f"Cannot update task columns: {', '.join(sorted(unknown))}")
@@ -0,0 +1,266 @@
+import json
+import uuid
+import asyncio
+import importlib.util
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from .base import TaskStorage, Cursor, check_update_columns
+
+TASK_INSERT_COLUMNS = (
+    "title", "user_id", "description", "priority", "recurrence", "due_date", "tags", "status", "last_completed_at"
+)
+TIMESTAMP_COLUMNS = {"due_date", "timer_started_at", "last_completed_at", "created_at"}
+HISTORY_SELECT = "SELECT id, created_at, utterance, action, agent_response FROM interactions"
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _row(record) -> Dict[str, Any]:
+    return {k: _to_json_value(v) for k, v in record.items()}
+
+
+def _row_id(value: str) -> Any:
+    # interactions.id is bigserial in database_init.sql; older deployments may use uuid
+    return int(value) if value.isdigit() else value
+
+
+def _param(column: str, value: Any) -> Any:
+    """Convert the string values the tools pass around into what asyncpg binds."""
+    if value is None:
+        return None
+    if column in TIMESTAMP_COLUMNS and isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if column in ("from_date", "to_date") and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+class PostgresStorage(TaskStorage):
+    """
+    Direct backend: an asyncpg connection pool talking to Postgres, skipping the
+    PostgREST HTTP hop and its JSON round trip. asyncpg prepares every
+    parameterized statement and caches it per connection, so the fixed SQL below
+    is parsed and planned once per pooled connection.
+    Uses the same schema (database_init.sql) and RPC functions as Supabase.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10):
+        # Fail when the backend is selected, not on the first query
+        if importlib.util.find_spec("asyncpg") is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres requires the 'asyncpg' package (pip install asyncpg).")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _init_connection(self, conn):
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    async def pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn, min_size=self.min_size, max_size=self.max_size, init=self._init_connection
+                    )
+        return self._pool
+
+    async def _fetch(self, sql: str, *args) -> List[Dict[str, Any]]:
+        pool = await self.pool()
+        return [_row(r) for r in await pool.fetch(sql, *args)]
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[Dict[str, Any]]:
+        pool = await self.pool()
+        record = await pool.fetchrow(sql, *args)
+        return _row(record) if record else None
+
+    async def _execute(self, sql: str, *args) -> str:
+        pool = await self.pool()
+        return await pool.execute(sql, *args)
+
+    def _insert_values(self, row: Dict[str, Any]) -> List[Any]:
+        return [_param(c, row.get(c)) for c in TASK_INSERT_COLUMNS]
+
+    async def insert_task(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        # COALESCE keeps the column defaults when the caller leaves a field out
+        return await self._fetchrow("""
+            INSERT INTO tasks (title, user_id, description, priority, recurrence, due_date, tags, status, last_completed_at)
+            VALUES ($1, $2, $3, COALESCE($4, 'medium'), COALESCE($5, 'none'), $6, COALESCE($7, '[]'::jsonb),
+                    COALESCE($8, 'pending'), $9)
+            RETURNING *
+        """, *self._insert_values(row))
+
+    async def insert_tasks(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO tasks (title, user_id, description, priority, recurrence, due_date, tags, status, last_completed_at)
+                    VALUES ($1, $2, $3, COALESCE($4, 'medium'), COALESCE($5, 'none'), $6, COALESCE($7, '[]'::jsonb),
+                            COALESCE($8, 'pending'), $9)
+                """, [self._insert_values(r) for r in rows])
+        return len(rows)
+
+    async def get_task(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._fetchrow("SELECT * FROM tasks WHERE id = $1 AND user_id = $2", task_id, user_id)
+
+    async def list_tasks(self, user_id: str, limit: Optional[int] = None, newest_first: bool = False,
+                         tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        order = "ORDER BY created_at DESC" if newest_first else ""
+        if tags:
+            # Separate statement rather than "$3 IS NULL OR ...", which a cached generic plan cannot index
+            return await self._fetch(
+                f"SELECT * FROM tasks WHERE user_id = $1 AND tags @> $3 {order} LIMIT $2", user_id, limit, tags
+            )
+        return await self._fetch(f"SELECT * FROM tasks WHERE user_id = $1 {order} LIMIT $2", user_id, limit)
+
+    async def list_tasks_page(self, user_id: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        if after:
+            created_at, row_id = after
+            return await self._fetch(
+                "SELECT * FROM tasks WHERE user_id = $1 AND (created_at, id) > ($2, $3) ORDER BY created_at, id LIMIT $4",
+                user_id, _param("created_at", created_at), row_id, limit
+            )
+        return await self._fetch("SELECT * FROM tasks WHERE user_id = $1 ORDER BY created_at, id LIMIT $2", user_id, limit)
+
+    async def list_due_tasks(self, start: str, end: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        select = "SELECT id, user_id, title, due_date FROM tasks WHERE status = 'pending'"
+        if after:
+            due_date, row_id = after
+            return await self._fetch(
+                f"{select} AND (due_date, id) > ($1, $2) AND due_date <= $3 ORDER BY due_date, id LIMIT $4",
+                _param("due_date", due_date), row_id, _param("due_date", end), limit
+            )
+        return await self._fetch(
+            f"{select} AND due_date > $1 AND due_date <= $2 ORDER BY due_date, id LIMIT $3",
+            _param("due_date", start), _param("due_date", end), limit
+        )
+
+    async def update_task(self, task_id: str, user_id: str, updates: Dict[str, Any]) -> None:
+        check_update_columns(updates)
+        if not updates:
+            return
+        # Column names come from the whitelist; sorting keeps the SQL text (and its cached plan) stable
+        columns = sorted(updates)
+        assignments = ", ".join(f"{c} = ${i + 3}" for i, c in enumerate(columns))
+        await self._execute(
+            f"UPDATE tasks SET {assignments} WHERE id = $1 AND user_id = $2",
+            task_id, user_id, *[_param(c, updates[c]) for c in columns]
+        )
+
+    async def delete_task(self, task_id: str, user_id: str) -> None:
+        await self._execute("DELETE FROM tasks WHERE id = $1 AND user_id = $2", task_id, user_id)
+
+    async def update_tasks(self, task_ids: List[str], user_id: str, updates: Dict[str, Any]) -> None:
+        check_update_columns(updates)
+        if not task_ids or not updates:
+            return
+        columns = sorted(updates)
+        assignments = ", ".join(f"{c} = ${i + 3}" for i, c in enumerate(columns))
+        await self._execute(
+            f"UPDATE tasks SET {assignments} WHERE id = ANY($1::uuid[]) AND user_id = $2",
+            task_ids, user_id, *[_param(c, updates[c]) for c in columns]
+        )
+
+    async def delete_tasks(self, task_ids: List[str], user_id: str) -> None:
+        if task_ids:
+            await self._execute("DELETE FROM tasks WHERE id = ANY($1::uuid[]) AND user_id = $2", task_ids, user_id)
+
+    async def apply_task_batch(self, user_id: str, rows: List[Dict[str, Any]], complete_ids: List[str],
+                               completed_at: str, delete_ids: List[str]) -> None:
+        await self._execute(
+            "SELECT apply_task_batch($1, $2, $3::uuid[], $4, $5::uuid[])",
+            user_id, rows, complete_ids, _param("last_completed_at", completed_at), delete_ids
+        )
+
+    async def search_tasks(self, user_id: str, query: str, status: Optional[str] = None,
+                           tags: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        return await self._fetch(
+            "SELECT * FROM search_tasks($1, $2, $3, $4, $5, $6)", user_id, query, status, tags, limit, offset
+        )
+
+    async def tag_facets(self, user_id: str, tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return await self._fetch("SELECT * FROM tag_facets($1, $2)", user_id, tags or None)
+
+    async def start_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._fetchrow("SELECT * FROM start_task_timer($1, $2)", task_id, user_id)
+
+    async def stop_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._fetchrow("SELECT * FROM stop_task_timer($1, $2)", task_id, user_id)
+
+    async def time_analytics(self, user_id: str, from_date: str, to_date: str) -> List[Dict[str, Any]]:
+        return await self._fetch(
+            "SELECT * FROM time_analytics($1, $2, $3)",
+            user_id, _param("from_date", from_date), _param("to_date", to_date)
+        )
+
+    async def insert_interaction(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self._fetchrow("""
+            INSERT INTO interactions (user_id, utterance, action, agent_response)
+            VALUES ($1, $2, $3, $4)
+            RETURNING id, created_at, utterance, action, agent_response
+        """, row["user_id"], row["utterance"], row.get("action"), row.get("agent_response"))
+
+    async def insert_interactions(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        # One statement for the whole batch. Ids are drawn in input order and every row shares the
+        # statement's created_at, so (created_at, id) history order matches the input order;
+        # the ordinality column also returns the saved rows in that order
+        return await self._fetch("""
+            WITH input AS (
+                SELECT r.*, nextval(pg_get_serial_sequence('interactions', 'id')) AS id
+                FROM (
+                    SELECT * FROM unnest($1::uuid[], $2::text[], $3::text[], $4::text[]) WITH ORDINALITY
+                           AS u(user_id, utterance, action, agent_response, n)
+                    ORDER BY u.n
+                ) r
+            ), saved AS (
+                INSERT INTO interactions (id, user_id, utterance, action, agent_response)
+                SELECT id, user_id, utterance, action, agent_response FROM input
+                RETURNING id, created_at, utterance, action, agent_response
+            )
+            SELECT saved.* FROM saved JOIN input USING (id) ORDER BY input.n
+        """, [r["user_id"] for r in rows], [r["utterance"] for r in rows],
+             [r.get("action") for r in rows], [r.get("agent_response") for r in rows])
+
+    async def list_interactions(self, user_id: str, limit: int, since: Optional[Cursor] = None,
+                                before: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        # Row comparisons walk the (user_id, created_at, id) index directly
+        if since:
+            created_at, row_id = since
+            return await self._fetch(
+                f"{HISTORY_SELECT} WHERE user_id = $1 AND (created_at, id) > ($2, $3) "
+                "ORDER BY created_at, id LIMIT $4",
+                user_id, _param("created_at", created_at), _row_id(row_id), limit
+            )
+        if before:
+            created_at, row_id = before
+            return await self._fetch(
+                f"{HISTORY_SELECT} WHERE user_id = $1 AND (created_at, id) < ($2, $3) "
+                "ORDER BY created_at DESC, id DESC LIMIT $4",
+                user_id, _param("created_at", created_at), _row_id(row_id), limit
+            )
+        return await self._fetch(
+            f"{HISTORY_SELECT} WHERE user_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2", user_id, limit
+        )
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,146 @@
+import json
+import asyncio
+from typing import Any, Dict, List, Optional
+from .base import TaskStorage, Cursor, check_update_columns
+
+HISTORY_COLUMNS = "id,created_at,utterance,action,agent_response"
+
+
+class SupabaseStorage(TaskStorage):
+    """Default backend: PostgREST over HTTP with the service-role client."""
+
+    name = "supabase"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.auth import supabase_admin
+            self._client = supabase_admin
+        return self._client
+
+    async def _execute(self, query):
+        # supabase-py's client is synchronous; run the HTTP round trip off the event loop
+        return await asyncio.to_thread(query.execute)
+
+    async def insert_task(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self._execute(self.client.table("tasks").insert(row))
+        return response.data[0] if response.data else row
+
+    async def insert_tasks(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        await self._execute(self.client.table("tasks").insert(rows))
+        return len(rows)
+
+    async def get_task(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        response = await self._execute(self.client.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id))
+        return response.data[0] if response.data else None
+
+    async def list_tasks(self, user_id: str, limit: Optional[int] = None, newest_first: bool = False,
+                         tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        query = self.client.table("tasks").select("*").eq("user_id", user_id)
+        if tags:
+            # A JSON string makes PostgREST compare as jsonb (tags @> '["a"]'); a list would be sent as a text[] literal
+            query = query.contains("tags", json.dumps(tags))
+        if newest_first:
+            query = query.order("created_at", desc=True)
+        if limit:
+            query = query.limit(limit)
+        return (await self._execute(query)).data or []
+
+    async def list_tasks_page(self, user_id: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        query = self.client.table("tasks").select("*").eq("user_id", user_id)
+        if after:
+            created_at, row_id = after
+            query = query.gte("created_at", created_at)
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})')
+        return (await self._execute(query.order("created_at").order("id").limit(limit))).data or []
+
+    async def list_due_tasks(self, start: str, end: str, limit: int, after: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        query = self.client.table("tasks").select("id,user_id,title,due_date").eq("status", "pending").lte("due_date", end)
+        if after:
+            due_date, row_id = after
+            query = query.gte("due_date", due_date)
+            query = query.or_(f'due_date.gt."{due_date}",and(due_date.eq."{due_date}",id.gt.{row_id})')
+        else:
+            query = query.gt("due_date", start)
+        return (await self._execute(query.order("due_date").order("id").limit(limit))).data or []
+
+    async def update_task(self, task_id: str, user_id: str, updates: Dict[str, Any]) -> None:
+        check_update_columns(updates)
+        await self._execute(self.client.table("tasks").update(updates).eq("id", task_id).eq("user_id", user_id))
+
+    async def delete_task(self, task_id: str, user_id: str) -> None:
+        await self._execute(self.client.table("tasks").delete().eq("id", task_id).eq("user_id", user_id))
+
+    async def update_tasks(self, task_ids: List[str], user_id: str, updates: Dict[str, Any]) -> None:
+        check_update_columns(updates)
+        if task_ids:
+            await self._execute(self.client.table("tasks").update(updates).in_("id", task_ids).eq("user_id", user_id))
+
+    async def delete_tasks(self, task_ids: List[str], user_id: str) -> None:
+        if task_ids:
+            await self._execute(self.client.table("tasks").delete().in_("id", task_ids).eq("user_id", user_id))
+
+    async def apply_task_batch(self, user_id: str, rows: List[Dict[str, Any]], complete_ids: List[str],
+                               completed_at: str, delete_ids: List[str]) -> None:
+        # One RPC, so the whole batch commits or rolls back in a single transaction
+        await self._execute(self.client.rpc("apply_task_batch", {
+            "p_user_id": user_id, "p_rows": rows, "p_complete_ids": complete_ids,
+            "p_completed_at": completed_at, "p_delete_ids": delete_ids
+        }))
+
+    async def search_tasks(self, user_id: str, query: str, status: Optional[str] = None,
+                           tags: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        response = await self._execute(self.client.rpc("search_tasks", {
+            "p_user_id": user_id, "p_query": query, "p_status": status, "p_tags": tags,
+            "p_limit": limit, "p_offset": offset
+        }))
+        return response.data or []
+
+    async def tag_facets(self, user_id: str, tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        response = await self._execute(self.client.rpc("tag_facets", {"p_user_id": user_id, "p_tags": tags or None}))
+        return response.data or []
+
+    async def start_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        response = await self._execute(self.client.rpc("start_task_timer", {"p_task_id": task_id, "p_user_id": user_id}))
+        return response.data[0] if response.data else None
+
+    async def stop_timer(self, task_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        response = await self._execute(self.client.rpc("stop_task_timer", {"p_task_id": task_id, "p_user_id": user_id}))
+        return response.data[0] if response.data else None
+
+    async def time_analytics(self, user_id: str, from_date: str, to_date: str) -> List[Dict[str, Any]]:
+        response = await self._execute(self.client.rpc("time_analytics", {
+            "p_user_id": user_id, "p_from": from_date, "p_to": to_date
+        }))
+        return response.data or []
+
+    async def insert_interaction(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        response = await self._execute(self.client.table("interactions").insert(row))
+        return response.data[0] if response.data else None
+
+    async def insert_interactions(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        return (await self._execute(self.client.table("interactions").insert(rows))).data or []
+
+    async def list_interactions(self, user_id: str, limit: int, since: Optional[Cursor] = None,
+                                before: Optional[Cursor] = None) -> List[Dict[str, Any]]:
+        query = self.client.table("interactions").select(HISTORY_COLUMNS).eq("user_id", user_id)
+        if since:
+            created_at, row_id = since
+            # The redundant gte/lte bound is what lets Postgres walk the index instead of filtering the OR
+            query = query.gte("created_at", created_at)
+            query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})')
+            query = query.order("created_at").order("id")
+        else:
+            if before:
+                created_at, row_id = before
+                query = query.lte("created_at", created_at)
+                query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+            query = query.order("created_at", desc=True).order("id", desc=True)
+        return (await self._execute(query.limit(limit))).data or []
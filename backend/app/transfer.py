@@ -0,0 +1,273 @@
+"""
+Streaming task import and export (CSV or JSON lines).
+
+Import is a generator pipeline over the request body: byte chunks -> lines -> records ->
+validated rows -> batches of IMPORT_BATCH_SIZE inserts. Nothing holds more than one
+batch, and errors are reported per line (the first IMPORT_MAX_ERRORS of them).
+Export walks the user's tasks in keyset pages of EXPORT_PAGE_SIZE and yields each page
+encoded, so memory stays flat whatever the number of tasks.
+
+CSV tags are a JSON array (as exported) or a comma-separated list.
+"""
+import io
+import os
+import csv
+import json
+import codecs
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.storage import TaskStorage
+from app.reminders import reminder_scheduler
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "200000"))
+IMPORT_MAX_ERRORS = 100
+IMPORT_MAX_LINE = 64 * 1024
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+STATUSES = ("pending", "completed")
+PRIORITIES = ("low", "medium", "high", "urgent")
+RECURRENCES = ("none", "daily", "weekly", "monthly")
+TITLE_MAX = 500
+EXPORT_COLUMNS = (
+    "id", "title", "description", "status", "priority", "recurrence", "due_date", "tags",
+    "total_time_spent", "last_completed_at", "created_at"
+)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """UTF-8 lines from a byte stream; multi-byte characters may straddle chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if "\n" not in buffer:
+            if len(buffer) > IMPORT_MAX_LINE:
+                raise ValueError(f"Line longer than {IMPORT_MAX_LINE} bytes")
+            continue
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer.strip():
+        yield buffer.rstrip("\r")
+
+
+def _ends_in_quotes(line: str, in_quotes: bool) -> bool:
+    """
+    Whether a quoted field is still open at the end of `line`, scanning as the csv module
+    does: only a quote at the start of a field opens one ('Buy 12" pipe' is plain text),
+    and "" inside a quoted field is an escaped quote.
+    """
+    i = 0
+    while True:
+        j = line.find('"', i)
+        if j < 0:
+            return in_quotes
+        if in_quotes:
+            if line.startswith('"', j + 1):
+                i = j + 2
+                continue
+            in_quotes = False
+        elif j == 0 or line[j - 1] == ",":
+            in_quotes = True
+        i = j + 1
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Optional[Dict[str, str]], Optional[str]]]:
+    """(line number, record, error) per CSV row. Quoted fields may span lines."""
+    header: Optional[List[str]] = None
+    pending, start = "", 0
+    in_quotes = False
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not pending:
+            if not line.strip():
+                continue
+            start = line_no
+        pending = f"{pending}\n{line}" if pending else line
+        in_quotes = _ends_in_quotes(line, in_quotes)
+        if in_quotes:
+            if len(pending) > IMPORT_MAX_LINE:
+                # Report the row once and resume at the next line
+                yield start, None, "Unterminated quoted field"
+                pending, in_quotes = "", False
+            continue
+        fields = next(csv.reader([pending]))
+        pending = ""
+        if header is None:
+            header = [h.strip().lower() for h in fields]
+            if "title" not in header:
+                yield start, None, "CSV header must include a 'title' column"
+                return
+            continue
+        if len(fields) > len(header):
+            yield start, None, f"Expected {len(header)} fields, got {len(fields)}"
+            continue
+        yield start, dict(zip(header, fields)), None
+    if pending:
+        yield start, None, "Unterminated quoted field"
+
+
+async def iter_jsonl_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def _choice(record: Dict[str, Any], field: str, allowed: Tuple[str, ...], default: str) -> str:
+    value = record.get(field)
+    if value in (None, ""):
+        return default
+    value = str(value).strip().lower()
+    if value not in allowed:
+        raise ValueError(f"{field} must be one of {', '.join(allowed)}, not '{value}'")
+    return value
+
+
+def _timestamp(record: Dict[str, Any], field: str) -> Optional[str]:
+    value = record.get(field)
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip().replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO 8601 date: '{value}'")
+
+
+def _tags(value: Any) -> List[str]:
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        value = json.loads(value) if value.startswith("[") else value.split(",")
+    if not isinstance(value, list):
+        raise ValueError("tags must be a list")
+    return [str(tag).strip() for tag in value if str(tag).strip()]
+
+
+def validate_task(record: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Insert row for an imported record, enforcing the tasks table constraints. Raises ValueError."""
+    title = str(record.get("title") or "").strip()
+    if not title:
+        raise ValueError("title is required")
+    if len(title) > TITLE_MAX:
+        raise ValueError(f"title is longer than {TITLE_MAX} characters")
+    status = _choice(record, "status", STATUSES, "pending")
+    try:
+        tags = _tags(record.get("tags"))
+    except ValueError as e:
+        raise ValueError(f"tags: {e}")
+    # Same keys on every row, so PostgREST bulk inserts keep the column defaults straight
+    return {
+        "title": title,
+        "user_id": user_id,
+        "description": str(record.get("description") or "").strip() or None,
+        "priority": _choice(record, "priority", PRIORITIES, "medium"),
+        "recurrence": _choice(record, "recurrence", RECURRENCES, "none"),
+        "due_date": _timestamp(record, "due_date"),
+        "tags": tags,
+        "status": status,
+        "last_completed_at": _timestamp(record, "last_completed_at") if status == "completed" else None,
+    }
+
+
+async def import_tasks(storage: TaskStorage, user_id: str, chunks: AsyncIterator[bytes], fmt: str,
+                       dry_run: bool = False) -> Dict[str, Any]:
+    lines = iter_lines(chunks)
+    records = iter_csv_records(lines) if fmt == "csv" else iter_jsonl_records(lines)
+    summary: Dict[str, Any] = {"imported": 0, "failed": 0, "errors": [], "dry_run": dry_run}
+    batch: List[Dict[str, Any]] = []
+    batch_start = 0
+    saved_due_dates = False
+
+    def fail(line: int, error: str, count: int = 1):
+        summary["failed"] += count
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": error})
+        else:
+            summary["errors_truncated"] = True
+
+    async def flush():
+        nonlocal saved_due_dates
+        if not batch:
+            return
+        try:
+            if not dry_run:
+                await storage.insert_tasks(batch)
+                saved_due_dates = saved_due_dates or any(row["due_date"] for row in batch)
+            summary["imported"] += len(batch)
+        except Exception as e:
+            fail(batch_start, f"Batch of {len(batch)} rows starting here was not saved: {e}", len(batch))
+        batch.clear()
+
+    try:
+        async for line, record, error in records:
+            if error:
+                fail(line, error)
+                continue
+            if summary["imported"] + summary["failed"] + len(batch) >= IMPORT_MAX_ROWS:
+                summary["truncated"] = f"Stopped at {IMPORT_MAX_ROWS} rows"
+                break
+            try:
+                row = validate_task(record, user_id)
+            except ValueError as e:
+                fail(line, str(e))
+                continue
+            if not batch:
+                batch_start = line
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+    except ValueError as e:
+        # Undecodable or unbounded input: keep what was already imported
+        fail(0, str(e))
+    await flush()
+    if saved_due_dates:
+        reminder_scheduler.reload()
+    return summary
+
+
+def _export_value(column: str, value: Any) -> Any:
+    if column == "tags":
+        return json.dumps(value or [], ensure_ascii=False)
+    return "" if value is None else value
+
+
+async def export_tasks(storage: TaskStorage, user_id: str, fmt: str) -> AsyncIterator[bytes]:
+    """Encoded export, one keyset page per chunk."""
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(EXPORT_COLUMNS)
+        yield out.getvalue().encode()
+    after = None
+    while True:
+        rows = await storage.list_tasks_page(user_id, EXPORT_PAGE_SIZE, after)
+        if not rows:
+            return
+        if fmt == "csv":
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerows([_export_value(c, row.get(c)) for c in EXPORT_COLUMNS] for row in rows)
+            chunk = out.getvalue()
+        else:
+            chunk = "".join(
+                json.dumps({c: row.get(c) for c in EXPORT_COLUMNS}, ensure_ascii=False, default=str) + "\n" for row in rows
+            )
+        yield chunk.encode()
+        if len(rows) < EXPORT_PAGE_SIZE:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["id"])
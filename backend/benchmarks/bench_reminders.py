@@ -0,0 +1,116 @@
+"""
+Reminder engine benchmark: timing wheel throughput at millions of pending reminders,
+then firing jitter of the running scheduler.
+
+Throughput adds --pending reminders spread over --spread ticks, cancels a tenth of
+them and expires the rest. Jitter runs ReminderScheduler's loop with that many
+reminders parked beyond the horizon, delivers --fire reminders due over a few seconds
+to a subscribed session, and reports how late each arrived. Storage is an in-process
+dict, so the numbers are the engine's own, not the database's.
+
+    python benchmarks/bench_reminders.py --pending 1000000 --tick 0.01
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import resource
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.reminders import ReminderScheduler, TimingWheel, due_timestamp
+from app.state import MemoryStateBackend
+from app.storage import TaskStorage
+
+
+class DictStorage(TaskStorage):
+    def __init__(self):
+        self.tasks = {}
+
+    async def get_task(self, task_id, user_id):
+        return self.tasks.get(task_id)
+
+    async def list_due_tasks(self, start, end, limit, after=None):
+        return []
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def rate(label, count, elapsed):
+    print(f"  {label:<8} {count / elapsed:12,.0f} ops/s  ({elapsed:.2f}s for {count:,})")
+
+
+def bench_wheel(pending, spread):
+    rng = random.Random(1)
+    deadlines = [rng.randrange(1, spread) for _ in range(pending)]
+    wheel = TimingWheel()
+    print(f"[timing wheel: {pending:,} reminders over {spread:,} ticks]")
+
+    start = time.perf_counter()
+    for i, deadline in enumerate(deadlines):
+        wheel.add(i, deadline)
+    rate("add", pending, time.perf_counter() - start)
+    print(f"  max RSS  {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:12,.0f} MB")
+
+    cancels = rng.sample(range(pending), pending // 10)
+    start = time.perf_counter()
+    for key in cancels:
+        wheel.cancel(key)
+    rate("cancel", len(cancels), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    fired = len(wheel.advance(spread))
+    rate("expire", fired, time.perf_counter() - start)
+
+
+async def bench_jitter(pending, fire, tick, seconds):
+    storage = DictStorage()
+    sched = ReminderScheduler(tick=tick, horizon=3600, load_interval=3600, storage=storage, backend=MemoryStateBackend())
+    sched.start()
+    await asyncio.sleep(0)
+    now = time.time()
+    # Background load: parked far beyond the firing window
+    for i in range(pending):
+        sched.schedule({"id": f"p{i}", "user_id": "idle", "due_date": iso(now + 1800 + i % 1800), "status": "pending"})
+    now = time.time()
+    for i in range(fire):
+        due = now + 0.5 + seconds * i / fire
+        task = {"id": f"f{i}", "user_id": "bench", "title": f"reminder {i}", "due_date": iso(due), "status": "pending"}
+        storage.tasks[task["id"]] = task
+        sched.schedule(task)
+    print(f"[scheduler: tick {tick * 1000:g} ms, {len(sched.wheel):,} pending, {fire:,} firing over {seconds:g}s]")
+
+    queue = sched.subscribe("bench")
+    late = []
+    try:
+        while len(late) < fire:
+            event = await asyncio.wait_for(queue.get(), seconds + 5)
+            late.append(time.time() - due_timestamp(event["due_date"]))
+    finally:
+        await sched.stop()
+    late.sort()
+    pct = lambda p: late[min(len(late) - 1, int(p * len(late)))] * 1000
+    print(f"  late     p50 {pct(0.5):.1f} ms  p95 {pct(0.95):.1f} ms  p99 {pct(0.99):.1f} ms  max {late[-1] * 1000:.1f} ms")
+    print(f"  early    {sum(1 for x in late if x < 0)} of {fire}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, default=1000000)
+    parser.add_argument("--spread", type=int, default=1 << 22, help="ticks the reminders are spread over")
+    parser.add_argument("--fire", type=int, default=2000)
+    parser.add_argument("--tick", type=float, default=0.01)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    bench_wheel(args.pending, args.spread)
+    asyncio.run(bench_jitter(args.pending, args.fire, args.tick, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Throughput scaling across worker counts.
+
+Starts `python -m app.serve --workers N` for each N, drives it with several client
+processes for a fixed duration and reports requests/second.
+
+    cd backend
+    STATE_BACKEND=sqlite:///bench_state.db python benchmarks/bench_workers.py --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _drive(url: str, duration: float, concurrency: int) -> int:
+    done = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client):
+        nonlocal done
+        while time.perf_counter() < deadline:
+            response = await client.get(url)
+            if response.status_code == 200:
+                done += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return done
+
+
+def _client_process(url: str, duration: float, concurrency: int, out):
+    out.put(asyncio.run(_drive(url, duration, concurrency)))
+
+
+def _wait_ready(base: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base} did not start")
+
+
+def run(workers: int, port: int, path: str, duration: float, clients: int, concurrency: int) -> float:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base)
+        # Let every worker finish booting before measuring
+        time.sleep(1.0 + 0.25 * workers)
+        out = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_client_process, args=(base + path, duration, concurrency, out))
+                 for _ in range(clients)]
+        for p in procs:
+            p.start()
+        total = sum(out.get() for _ in procs)
+        for p in procs:
+            p.join()
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/api/agent/ping")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    args = parser.parse_args()
+
+    print(f"STATE_BACKEND={os.getenv('STATE_BACKEND', 'memory')} path={args.path} cpus={os.cpu_count()}")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    for n in args.workers:
+        rps = run(n, args.port, args.path, args.duration, args.clients, args.concurrency)
+        baseline = baseline or rps
+        print(f"{n:>8} {rps:>10.0f} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
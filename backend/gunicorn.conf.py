@@ -0,0 +1,15 @@
+# Gunicorn config for multi-worker deployments:
+#   pip install gunicorn
+#   STATE_BACKEND=sqlite:///state.db gunicorn -c gunicorn.conf.py app.main:app
+import os
+import multiprocessing
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+if workers > 1 and os.getenv("STATE_BACKEND", "memory") == "memory":
+    print(f"WARNING: {workers} workers with STATE_BACKEND=memory. Caches will not be shared.")
@@ -0,0 +1,39 @@
+import pytest
+import httpx
+from types import SimpleNamespace
+from httpx import ASGITransport
+from app import auth
+from app.main import app
+from app.auth import verify_jwt
+
+
+@pytest.mark.asyncio
+async def test_time_analytics_groups_rpc_rows_by_dimension(monkeypatch):
+    calls = []
+    rows = [
+        {"dimension": "day", "bucket": "2026-10-18", "seconds": 600, "share": 60.0},
+        {"dimension": "day", "bucket": "2026-10-19", "seconds": 400, "share": 40.0},
+        {"dimension": "priority", "bucket": "high", "seconds": 1000, "share": 100.0},
+        {"dimension": "tag", "bucket": "work", "seconds": 1000, "share": 100.0},
+    ]
+
+    def fake_rpc(name, params):
+        calls.append((name, params))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=rows))
+
+    monkeypatch.setattr(auth.supabase_admin, "rpc", fake_rpc)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "clock-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/api/agent/analytics/time", params={"from": "2026-10-18", "to": "2026-10-19"})
+            bad = await ac.get("/api/agent/analytics/time", params={"from": "2026-10-20", "to": "2026-10-19"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [d["bucket"] for d in body["by_day"]] == ["2026-10-18", "2026-10-19"]
+    assert body["by_priority"][0]["seconds"] == 1000
+    assert body["by_tag"][0]["bucket"] == "work"
+    assert calls == [("time_analytics", {"p_user_id": "clock-user", "p_from": "2026-10-18", "p_to": "2026-10-19"})]
+    assert bad.status_code == 400
@@ -0,0 +1,213 @@
+import pytest
+import httpx
+from httpx import ASGITransport
+from app import storage as storage_module
+from app.main import app
+from app.auth import verify_jwt
+from app.api import agent
+from app.batch import BatchPlan
+from app.dialogue import DialogueStateStore
+from app.mcp_server import mcp
+from app.state import MemoryStateBackend
+from app.storage import TaskStorage, set_storage
+
+EXISTING = [
+    {"id": "t-report", "title": "Write report", "status": "pending", "priority": "high", "recurrence": "none", "tags": []},
+    {"id": "t-gym", "title": "Gym", "status": "pending", "priority": "medium", "recurrence": "daily", "tags": ["health"]},
+]
+
+
+class RecordingStorage(TaskStorage):
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.calls = []
+
+    async def list_tasks(self, user_id, limit=None, newest_first=False, tags=None):
+        self.calls.append(("list_tasks",))
+        rows = [dict(t) for t in self.tasks]  # oldest first
+        return rows[::-1] if newest_first else rows
+
+    async def insert_tasks(self, rows):
+        self.calls.append(("insert_tasks", rows))
+        return len(rows)
+
+    async def update_tasks(self, task_ids, user_id, updates):
+        self.calls.append(("update_tasks", task_ids, updates["status"]))
+
+    async def delete_tasks(self, task_ids, user_id):
+        self.calls.append(("delete_tasks", task_ids))
+
+    async def insert_interactions(self, rows):
+        self.calls.append(("insert_interactions", rows))
+        return [{"id": i + 1, "created_at": "2026-10-19T10:00:00+00:00", **r} for i, r in enumerate(rows)]
+
+
+@pytest.fixture
+def recording_storage(monkeypatch):
+    previous = storage_module._storage
+    store = RecordingStorage(EXISTING)
+    set_storage(store)
+    monkeypatch.setattr(agent, "dialogue_store", DialogueStateStore(backend=MemoryStateBackend()))
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "batch-user"}
+    yield store
+    app.dependency_overrides.clear()
+    set_storage(previous)
+
+
+@pytest.mark.asyncio
+async def test_plan_applies_in_order_and_writes_net_effect():
+    store = RecordingStorage([])
+    plan = BatchPlan([dict(t) for t in EXISTING], "u1")
+    plan.add("Milk")
+    plan.complete(plan.find("milk"))
+    plan.add("Temp")
+    plan.delete(plan.find("temp"))
+    respawned = plan.complete(plan.find("gym"))
+    plan.delete(plan.find("t-report"))
+
+    assert respawned["title"] == "Gym" and respawned["tags"] == ["health"]
+    assert await plan.commit(store) == {"inserted": 2, "completed": 1, "deleted": 1, "failed": []}
+    assert store.calls[1] == ("update_tasks", ["t-gym"], "completed")
+    assert store.calls[2] == ("delete_tasks", ["t-report"])
+    inserted = store.calls[0][1]
+    assert [(r["title"], r["status"]) for r in inserted] == [("Milk", "completed"), ("Gym", "pending")]
+    # Uniform keys, so a PostgREST bulk insert does not null out defaults
+    assert len({tuple(sorted(r)) for r in inserted}) == 1
+
+
+def test_find_takes_whole_words_and_refuses_to_guess():
+    plan = BatchPlan([
+        {"id": "t1", "title": "Call mom", "status": "pending"},
+        {"id": "t2", "title": "Call dentist", "status": "pending"},
+        {"id": "t3", "title": "Buy bread", "status": "completed"},
+        {"id": "t4", "title": "Buy bread", "status": "pending"},
+        {"id": "t5", "title": "Breakfast meeting", "status": "pending"},
+    ], "u1")
+    assert plan.find("mom")["id"] == "t1"
+    assert plan.find("read") is None and plan.find("brea") is None
+    assert plan.find("bread")["id"] == "t4"  # a respawned copy is the same task, not a choice
+    assert [t["id"] for t in plan.matches("call")] == ["t1", "t2"] and plan.find("call") is None
+    assert plan.find("call dentist")["id"] == "t2" and plan.find("t5")["title"] == "Breakfast meeting"
+
+
+class FailingStorage(RecordingStorage):
+    async def update_tasks(self, task_ids, user_id, updates):
+        raise RuntimeError("connection reset")
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_reported_per_item(monkeypatch):
+    previous = storage_module._storage
+    store = FailingStorage(EXISTING)
+    set_storage(store)
+    monkeypatch.setattr(agent, "dialogue_store", DialogueStateStore(backend=MemoryStateBackend()))
+    monkeypatch.setattr(agent.skill_manager, "clients", [])
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "batch-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.post("/api/agent/dispatch/batch", json={"utterances": ["buy milk", "finish report"]})
+    finally:
+        app.dependency_overrides.clear()
+        set_storage(previous)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    # Inserts go first and landed; the completion did not
+    assert [r["action"] for r in results] == ["create", "save_failed"]
+    assert "could not be saved" in results[1]["message"]
+    assert [c[0] for c in store.calls] == ["list_tasks", "insert_tasks", "insert_interactions"]
+
+
+@pytest.mark.asyncio
+async def test_batch_asks_which_task_when_ambiguous(recording_storage, monkeypatch):
+    recording_storage.tasks = EXISTING + [{"id": "t-review", "title": "Review report", "status": "pending",
+                                           "priority": "medium", "recurrence": "none", "tags": []}]
+    monkeypatch.setattr(agent.skill_manager, "clients", [])
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/agent/dispatch/batch", json={"utterances": ["finish report"]})
+
+    result = response.json()["results"][0]
+    assert result["action"] == "clarify_task" and result["result"]["matches"] == ["Write report", "Review report"]
+    assert "Which one" in result["message"]
+    assert [c[0] for c in recording_storage.calls] == ["list_tasks", "insert_interactions"]
+
+
+@pytest.mark.asyncio
+async def test_batch_dispatch_uses_bulk_writes_and_dialogue(recording_storage, monkeypatch):
+    monkeypatch.setattr(agent.skill_manager, "clients", [])
+    utterances = ["buy milk", "add a task", "water the plants", "done milk", "finish report", "finish report", "show my tasks"]
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/agent/dispatch/batch", json={"utterances": utterances})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["action"] for r in body["results"]] == ["create", "clarify_add_task", "create", "update", "update", "update", "list"]
+    assert body["results"][2]["result"]["task"] == "Water the plants"
+    assert "already completed" in body["results"][5]["result"]["response"]
+    assert "Water the plants" in body["results"][6]["result"]["response"]
+    assert body["history_cursor"] == agent.encode_history_cursor({"created_at": "2026-10-19T10:00:00+00:00", "id": 7})
+
+    calls = [c[0] for c in recording_storage.calls]
+    assert calls == ["list_tasks", "insert_tasks", "update_tasks", "insert_interactions"]
+    inserted = recording_storage.calls[1][1]
+    assert [(r["title"], r["status"]) for r in inserted] == [("Milk", "completed"), ("Water the plants", "pending")]
+    assert recording_storage.calls[2][1] == ["t-report"]
+    assert len(recording_storage.calls[3][1]) == len(utterances)
+    assert agent.dialogue_store.get("batch-user") is None
+
+
+@pytest.mark.asyncio
+async def test_batch_classification_is_one_llm_call(recording_storage, monkeypatch):
+    prompts = []
+
+    def fake_llm(prompt, tier="standard", user_id=None):
+        prompts.append(prompt)
+        return {"results": [
+            {"intent": "add_task", "slots": {"item": "Call mom", "priority": "high"}, "detected_lang": "ur"},
+            {"intent": "add_task", "slots": {"item": "Pay rent"}, "detected_lang": "en"},
+        ]}
+
+    monkeypatch.setattr(agent.skill_manager, "_get_llm_json", fake_llm)
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/agent/dispatch/batch", json={"utterances": ["امی کو فون کرو", "add pay rent"]})
+        too_many = await ac.post("/api/agent/dispatch/batch", json={"utterances": ["x"] * 51})
+
+    results = response.json()["results"]
+    assert len(prompts) == 1 and "امی کو فون کرو" in prompts[0]
+    assert results[0]["message"].startswith("اوکے جی") and results[1]["message"].startswith("Got it!")
+    assert [c[0] for c in recording_storage.calls] == ["insert_tasks", "insert_interactions"]
+    assert too_many.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_batch_timers_and_search_see_earlier_items(recording_storage, monkeypatch):
+    extractions = [
+        {"intent": "add_task", "slots": {"item": "Milk"}},
+        {"intent": "manage_timer", "slots": {"item": "milk", "timer_action": "start"}},
+        {"intent": "manage_timer", "slots": {"item": "report", "timer_action": "start"}},
+        {"intent": "delete_task", "slots": {"item": "gym"}},
+        {"intent": "search_tasks", "slots": {"query": "gym"}},
+        {"intent": "search_tasks", "slots": {"query": "milk"}},
+    ]
+
+    def fake_execute_skill(name, inputs):
+        return {"source": "test", "results": [{**e, "detected_lang": "en"} for e in extractions]}
+
+    async def fake_call_tool(name, arguments):
+        recording_storage.calls.append((name, arguments))
+        return f"Mission clock started for '{arguments['task_id']}'."
+
+    monkeypatch.setattr(agent.skill_manager, "execute_skill", fake_execute_skill)
+    monkeypatch.setattr(mcp, "call_tool", fake_call_tool)
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/agent/dispatch/batch", json={"utterances": [f"u{i}" for i in range(6)]})
+
+    results = response.json()["results"]
+    assert [r["action"] for r in results] == ["create", "clarify_timer", "timer", "delete", "search", "search"]
+    assert "not saved yet" in results[1]["message"]
+    assert results[2]["result"]["response"] == "Mission clock started for 't-report'."
+    assert results[4]["result"]["response"] == "No objectives matching 'gym' in the archives."
+    assert "Milk (Priority: medium, ID: new)" in results[5]["result"]["response"]
+    # The clock RPC runs once the batch is written; searches never reach the database
+    calls = [c[0] for c in recording_storage.calls]
+    assert calls == ["list_tasks", "insert_tasks", "delete_tasks", "manage_timer", "insert_interactions"]
@@ -0,0 +1,75 @@
+import pytest
+import httpx
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app.api import agent
+from app.dialogue import DialogueStateStore, resolve_follow_up, summarize_state
+from app.mcp_server import mcp
+from app.state import MemoryStateBackend
+
+PENDING = {"intent": "add_task", "slots": {"priority": "high", "recurrence": "daily"}, "missing": "item"}
+
+
+def test_resolve_follow_up_kinds():
+    assert resolve_follow_up(PENDING, "yes") == {"kind": "reprompt"}
+    assert resolve_follow_up(PENDING, "cancel") == {"kind": "cancel"}
+    assert resolve_follow_up(PENDING, "show my tasks") == {"kind": "new"}
+    assert resolve_follow_up(PENDING, "call mom tomorrow at 5pm") == {"kind": "llm"}
+    assert resolve_follow_up(PENDING, "it's water the plants") == {
+        "kind": "fill", "intent": "add_task",
+        "slots": {"priority": "high", "recurrence": "daily", "item": "Water the plants"}
+    }
+
+
+def test_follow_up_commands_need_whole_words_and_refusals_cancel():
+    for answer in ("hire a plumber", "history homework", "listen to podcast", "showcase prep", "Finisher medal pickup"):
+        assert resolve_follow_up(PENDING, answer)["kind"] == "fill", answer
+    assert resolve_follow_up(PENDING, "hire a plumber")["slots"]["item"] == "Hire a plumber"
+    for command in ("hi there", "list everything", "done with laundry", "where is my report"):
+        assert resolve_follow_up(PENDING, command) == {"kind": "new"}, command
+    for refusal in ("no thanks", "No, thanks!", "thanks", "thank you.", "not now", "never mind"):
+        assert resolve_follow_up(PENDING, refusal) == {"kind": "cancel"}, refusal
+
+
+def test_summarize_state_is_compact():
+    assert summarize_state(PENDING) == "Pending intent add_task; known slots: priority=high, recurrence=daily; missing: item."
+
+
+@pytest.mark.asyncio
+async def test_follow_up_fills_item_without_second_extraction(monkeypatch):
+    extractions = []
+    tool_calls = []
+
+    def fake_execute_skill(name, inputs):
+        if name == "translator_urdu":
+            return {"utterance_en": inputs["utterance"], "detected_lang": "en"}
+        extractions.append(inputs)
+        return {"intent": "add_task", "slots": {"item": "", "priority": "high", "recurrence": "daily"}}
+
+    async def fake_call_tool(name, arguments):
+        tool_calls.append((name, arguments))
+        return "ok"
+
+    monkeypatch.setattr(agent.skill_manager, "execute_skill", fake_execute_skill)
+    monkeypatch.setattr(agent, "dialogue_store", DialogueStateStore(backend=MemoryStateBackend()))
+    async def fake_save_interaction(data):
+        return None
+
+    monkeypatch.setattr(agent, "save_interaction", fake_save_interaction)
+    monkeypatch.setattr(mcp, "call_tool", fake_call_tool)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "dialogue-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            ask = await ac.post("/api/agent/dispatch", json={"utterance": "add an important daily task"})
+            answer = await ac.post("/api/agent/dispatch", json={"utterance": "water the plants"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert ask.json()["action"] == "clarify_add_task"
+    assert answer.json()["action"] == "create"
+    assert len(extractions) == 1
+    name, arguments = tool_calls[0]
+    assert name == "add_todo"
+    assert (arguments["title"], arguments["priority"], arguments["recurrence"]) == ("Water the plants", "high", "daily")
+    assert agent.dialogue_store.get("dialogue-user") is None
@@ -0,0 +1,32 @@
+import pytest
+import httpx
+from fastapi import HTTPException
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app.api.agent import encode_history_cursor, decode_history_cursor
+
+
+def test_history_cursor_roundtrip():
+    row = {"id": 42, "created_at": "2026-10-19T14:39:02.250505+00:00"}
+    assert decode_history_cursor(encode_history_cursor(row)) == ("2026-10-19T14:39:02.250505+00:00", "42")
+
+
+def test_malformed_history_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        decode_history_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_history_rejects_both_cursors():
+    cursor = encode_history_cursor({"id": 1, "created_at": "2026-10-19T00:00:00+00:00"})
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "history-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/api/agent/history", params={"since": cursor, "before": cursor})
+            too_big = await ac.get("/api/agent/history", params={"limit": 1000})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 400
+    assert too_big.status_code == 422
@@ -0,0 +1,73 @@
+import pytest
+import httpx
+from fastapi import HTTPException
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app.idempotency import IdempotencyStore
+from app.mcp_server import mcp
+from app.state import MemoryStateBackend
+
+
+@pytest.mark.asyncio
+async def test_store_replays_and_rejects_mismatched_body():
+    store = IdempotencyStore(backend=MemoryStateBackend())
+    calls = 0
+
+    async def create():
+        nonlocal calls
+        calls += 1
+        return {"result": f"created #{calls}"}
+
+    first = await store.run("u1", "key-1", {"title": "milk"}, create)
+    second = await store.run("u1", "key-1", {"title": "milk"}, create)
+    assert first == ({"result": "created #1"}, False)
+    assert second == ({"result": "created #1"}, True)
+    assert calls == 1
+
+    with pytest.raises(HTTPException) as exc:
+        await store.run("u1", "key-1", {"title": "eggs"}, create)
+    assert exc.value.status_code == 422
+
+    # Keys are scoped per user
+    assert (await store.run("u2", "key-1", {"title": "milk"}, create))[1] is False
+
+
+@pytest.mark.asyncio
+async def test_failed_request_releases_key():
+    store = IdempotencyStore(backend=MemoryStateBackend())
+
+    async def boom():
+        raise RuntimeError("supabase down")
+
+    async def ok():
+        return {"result": "ok"}
+
+    with pytest.raises(RuntimeError):
+        await store.run("u1", "k", {}, boom)
+    assert await store.run("u1", "k", {}, ok) == ({"result": "ok"}, False)
+
+
+@pytest.mark.asyncio
+async def test_tool_endpoint_replays_without_calling_tool(monkeypatch):
+    calls = []
+
+    async def fake_call_tool(name, arguments):
+        calls.append(name)
+        return f"Objective '{arguments['title']}' deployed."
+
+    monkeypatch.setattr(mcp, "call_tool", fake_call_tool)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "idem-user"}
+    body = {"name": "add_todo", "arguments": {"title": "Buy milk"}}
+    headers = {"Idempotency-Key": "retry-me"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            first = await ac.post("/api/agent/tool", json=body, headers=headers)
+            replay = await ac.post("/api/agent/tool", json=body, headers=headers)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.json() == first.json()
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert calls == ["add_todo"]
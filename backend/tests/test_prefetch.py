@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+import httpx
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app.api import agent
+from app.dialogue import DialogueStateStore
+from app.mcp_server import mcp
+from app.prefetch import PrefetchCache
+from app.state import MemoryStateBackend
+
+
+@pytest.mark.asyncio
+async def test_newer_draft_cancels_stale_speculation():
+    cache = PrefetchCache()
+    release = asyncio.Event()
+
+    async def slow(value):
+        await release.wait()
+        return value
+
+    assert cache.start("u1", "buy", None, lambda: slow("buy")) == "started"
+    stale = cache._entries["u1"]["buy"].task
+    assert cache.start("u1", "Buy milk", None, lambda: slow("milk")) == "started"
+    assert cache.start("u1", "buy milk!", None, lambda: slow("dup")) == "in_flight"
+    await asyncio.sleep(0)
+    assert stale.cancelled()
+
+    # The send joins the speculation that is still running
+    claim = asyncio.ensure_future(cache.claim("u1", "buy milk please"))
+    await asyncio.sleep(0)
+    release.set()
+    assert await claim == "milk"
+    assert await cache.claim("u1", "buy milk") is None  # used at most once
+
+    cache.start("u1", "call mom", {"pending": "add_task"}, lambda: slow("mom"))
+    assert await cache.claim("u1", "call mom", None) is None  # dialogue moved on
+    assert cache.report() == {
+        "started": 3, "cancelled": 2, "hits": 0, "extended_hits": 1, "misses": 2, "lookups": 3, "hit_rate": 0.3333
+    }
+
+
+@pytest.mark.asyncio
+async def test_dispatch_reuses_prefetched_understanding(monkeypatch):
+    skill_calls = []
+    tool_calls = []
+
+    def fake_execute_skill(name, inputs):
+        skill_calls.append(name)
+        if name == "translator_urdu":
+            return {"utterance_en": inputs["utterance"], "detected_lang": "en"}
+        return {"intent": "add_task", "slots": {"item": "Milk", "priority": "high"}}
+
+    async def fake_call_tool(name, arguments):
+        tool_calls.append((name, arguments))
+        return "ok"
+
+    async def fake_save_interaction(data):
+        return None
+
+    monkeypatch.setattr(agent.skill_manager, "execute_skill", fake_execute_skill)
+    monkeypatch.setattr(agent, "dialogue_store", DialogueStateStore(backend=MemoryStateBackend()))
+    monkeypatch.setattr(agent, "prefetch_cache", PrefetchCache())
+    monkeypatch.setattr(agent, "save_interaction", fake_save_interaction)
+    monkeypatch.setattr(mcp, "call_tool", fake_call_tool)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "prefetch-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            short = await ac.post("/api/agent/prefetch", json={"utterance": "b"})
+            draft = await ac.post("/api/agent/prefetch", json={"utterance": "buy milk urgently"})
+            await asyncio.sleep(0.05)
+            assert skill_calls == ["translator_urdu", "intent_extractor"]
+            sent = await ac.post("/api/agent/dispatch", json={"utterance": "Buy milk urgently."})
+            stats = await ac.get("/api/agent/prefetch/stats")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert short.json() == {"status": "skipped"}
+    assert draft.status_code == 202 and draft.json() == {"status": "started"}
+    assert sent.json()["action"] == "create"
+    assert skill_calls == ["translator_urdu", "intent_extractor"]
+    assert tool_calls[0][1]["title"] == "Milk"
+    assert stats.json()["hits"] == 1 and stats.json()["hit_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_prefetch_burst_leaves_dispatch_on_the_llm(monkeypatch):
+    from types import SimpleNamespace
+    from app.api import skills
+    from app.ratelimit import RateLimiter
+    from app.routing import ModelRouter, TokenBudget, UsageStats
+
+    calls = []
+
+    class Completions:
+        def create(self, model, messages, **kwargs):
+            calls.append(messages[-1]["content"])
+            usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+            content = '{"intent": "add_task", "slots": {"item": "Milk"}}'
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+    backend = MemoryStateBackend()
+    stats = UsageStats()
+    real = ModelRouter(TokenBudget(user_budget=1000, global_budget=0, backend=backend), stats)
+    spec = ModelRouter(TokenBudget(user_budget=100000, global_budget=0, backend=backend, scope="tokens:prefetch"), stats)
+    monkeypatch.setattr(skills, "model_router", real)
+    monkeypatch.setattr(skills, "speculative_router", spec)
+    monkeypatch.setattr(skills, "provider_limiter", RateLimiter("p", rate=0.001, burst=2, backend=backend))
+    monkeypatch.setattr(skills, "speculative_provider_limiter", RateLimiter("pp", rate=0.001, burst=5, backend=backend))
+    monkeypatch.setattr(agent, "prefetch_limiter", RateLimiter("pf", rate=0, burst=0))
+    monkeypatch.setattr(agent, "prefetch_cache", PrefetchCache())
+    monkeypatch.setattr(agent, "dialogue_store", DialogueStateStore(backend=MemoryStateBackend()))
+    monkeypatch.setattr(agent.skill_manager, "clients", [{
+        "name": "Fake", "client": SimpleNamespace(chat=SimpleNamespace(completions=Completions())),
+        "model": "m", "models": dict.fromkeys(("light", "standard", "heavy"), "m")
+    }])
+
+    # A typing burst, each draft understood speculatively, far past the speculative bucket
+    assert await agent.start_prefetch("buy milk and eggs", "burst-user") == "started"
+    await asyncio.sleep(0.05)
+    for i in range(30):
+        await agent.understand_utterance(f"buy milk and eggs {i}", "burst-user", None, speculative=True)
+    assert len(calls) == 5 and stats.report()["Fake/m"]["rate_limited"] == 26
+    assert real.budget.usage("burst-user")["user"]["used"] == 0
+
+    understood = await agent.understand_utterance("buy bread", "burst-user", None)
+    assert len(calls) == 6 and "buy bread" in calls[-1]
+    assert understood["intent"]["slots"]["item"] == "Milk"  # the LLM answer, not the keyword fallback
+    assert real.budget.usage("burst-user")["user"]["used"] == 120
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+import httpx
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app.api import agent
+from app.api.skills import normalize_utterance
+from app.ratelimit import RateLimiter, SingleFlight
+from app.state import MemoryStateBackend, SQLiteStateBackend
+
+
+def test_token_bucket_allows_burst_then_reports_retry_after():
+    limiter = RateLimiter("test", rate=1.0, burst=2, backend=MemoryStateBackend())
+    assert limiter.acquire("u1") == (True, 0.0)
+    assert limiter.acquire("u1") == (True, 0.0)
+    allowed, retry_after = limiter.acquire("u1")
+    assert allowed is False
+    assert 0 < retry_after <= 1.0
+    # Buckets are per key
+    assert limiter.acquire("u2")[0] is True
+
+
+@pytest.mark.asyncio
+async def test_async_acquire_on_a_shared_backend(tmp_path):
+    limiter = RateLimiter("test", rate=1.0, burst=1, backend=SQLiteStateBackend(str(tmp_path / "state.db")))
+    assert await limiter.acquire_async("u1") == (True, 0.0)
+    assert (await limiter.acquire_async("u1"))[0] is False
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_identical_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    results = await asyncio.gather(*(flight.do(("u1", "buy milk"), slow) for _ in range(5)))
+    assert results == [1] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+    assert not flight.in_flight(("u1", "buy milk"))
+
+
+def test_normalize_utterance():
+    assert normalize_utterance("  Buy   MILK!! ") == "buy milk"
+    assert normalize_utterance("دودھ خریدنا ہے۔") == "دودھ خریدنا ہے"
+
+
+@pytest.mark.asyncio
+async def test_dispatch_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(agent, "user_limiter", RateLimiter("user", rate=0.1, burst=1, backend=MemoryStateBackend()))
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "rate-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            first = await ac.post("/api/agent/dispatch", json={"utterance": "what's up"})
+            second = await ac.post("/api/agent/dispatch", json={"utterance": "show tasks"})
+    finally:
+        app.dependency_overrides.clear()
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
@@ -0,0 +1,263 @@
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+import httpx
+from httpx import ASGITransport
+from app import reminders
+from app import storage as storage_module
+from app.main import app
+from app.auth import verify_jwt
+from app.mcp_server import add_todo, complete_todo, delete_todo
+from app.reminders import ReminderScheduler, TimingWheel, due_timestamp
+from app.api.skills import SkillManager, relative_due_date
+from app.state import MemoryStateBackend
+from app.storage import TaskStorage, set_storage
+
+NOW = 1_800_000_000.0
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW
+
+    def __call__(self):
+        return self.now
+
+
+class DueStorage(TaskStorage):
+    def __init__(self):
+        self.tasks = {}
+        self.pages = 0
+        self.ids = 0
+
+    def add(self, user_id, title, due, status="pending"):
+        self.ids += 1
+        task_id = f"t{self.ids}"
+        self.tasks[task_id] = {"id": task_id, "user_id": user_id, "title": title, "due_date": iso(due), "status": status}
+        return self.tasks[task_id]
+
+    async def insert_task(self, row):
+        task = self.add(row["user_id"], row["title"], due_timestamp(row["due_date"]) if row.get("due_date") else None)
+        task.update({k: v for k, v in row.items() if k not in ("due_date", "title", "user_id")})
+        if not row.get("due_date"):
+            task["due_date"] = None
+        return dict(task)
+
+    async def get_task(self, task_id, user_id):
+        task = self.tasks.get(task_id)
+        return dict(task) if task and task["user_id"] == user_id else None
+
+    async def update_task(self, task_id, user_id, updates):
+        self.tasks[task_id].update(updates)
+
+    async def delete_task(self, task_id, user_id):
+        self.tasks.pop(task_id, None)
+
+    async def list_due_tasks(self, start, end, limit, after=None):
+        self.pages += 1
+        rows = sorted((t for t in self.tasks.values() if t["status"] == "pending" and t["due_date"]
+                       and due_timestamp(start) < due_timestamp(t["due_date"]) <= due_timestamp(end)),
+                      key=lambda t: (due_timestamp(t["due_date"]), t["id"]))
+        if after:
+            rows = [t for t in rows if (due_timestamp(t["due_date"]), t["id"]) > (due_timestamp(after[0]), after[1])]
+        return [dict(t) for t in rows[:limit]]
+
+
+@pytest.fixture
+def scheduler():
+    storage = DueStorage()
+    sched = ReminderScheduler(tick=1, horizon=600, storage=storage, backend=MemoryStateBackend(), clock=Clock())
+    sched.reset(NOW)
+    return sched
+
+
+def test_wheel_fires_each_deadline_on_its_tick_across_levels():
+    rng = random.Random(7)
+    wheel = TimingWheel(start_tick=1000)
+    deadlines = {f"k{i}": 1000 + rng.randrange(1 << 21) for i in range(3000)}
+    for key, deadline in deadlines.items():
+        wheel.add(key, deadline)
+    cancelled = set(rng.sample(sorted(deadlines), 500))
+    for key in cancelled:
+        assert wheel.cancel(key)
+    assert not wheel.cancel("k-missing") and len(wheel) == 2500
+
+    fired, tick = {}, 1000
+    while len(wheel):
+        tick += rng.randrange(1, 5000)
+        for key, deadline, _ in wheel.advance(tick):
+            assert tick - 5000 < deadline <= tick
+            fired[key] = deadline
+    assert fired == {k: d for k, d in deadlines.items() if k not in cancelled}
+
+    # Overdue fires on the next advance; beyond the top level waits there
+    wheel.add("late", tick - 10)
+    wheel.add("far", tick + (1 << 27))
+    assert [f[0] for f in wheel.advance(tick + 1)] == ["late"] and "far" in wheel
+
+
+@pytest.mark.asyncio
+async def test_loads_window_in_pages_and_delivers_to_sessions(scheduler, monkeypatch):
+    monkeypatch.setattr(reminders, "REMINDER_LOAD_PAGE", 2)
+    storage = scheduler.storage
+    for i in range(5):
+        storage.add("u1", f"soon {i}", NOW + 10 + i)
+    storage.add("u1", "done", NOW + 20, status="completed")
+    storage.add("u2", "later", NOW + 3600)
+
+    assert await scheduler.load(NOW) == 5 and storage.pages == 3
+    assert scheduler.loaded_until == NOW + 600
+
+    queue = scheduler.subscribe("u1")
+    storage.tasks["t2"]["status"] = "completed"  # completed straight in the database after loading
+    assert scheduler.fire(NOW + 11.25) == 2
+    await asyncio.sleep(0)
+    event = queue.get_nowait()
+    assert event["type"] == "reminder" and event["task_id"] == "t1" and event["title"] == "soon 0"
+    assert queue.empty() and scheduler.counters["stale"] == 1
+
+    # The horizon moves on: the later task comes in with the next load
+    assert await scheduler.load(NOW + 3100) == 1
+    stats = scheduler.stats()
+    assert stats["pending"] == 4 and stats["delivered"] == 1 and stats["jitter_ms"]["max"] == 1250.0
+
+
+@pytest.mark.asyncio
+async def test_each_load_rereads_the_whole_window(scheduler):
+    storage = scheduler.storage
+    storage.add("u1", "Dentist", NOW + 300)
+    assert await scheduler.load(NOW) == 1
+
+    # The web app writes to the database directly: a moved due date and a new task inside the loaded window
+    storage.tasks["t1"]["due_date"] = iso(NOW + 120)
+    storage.add("u1", "Pharmacy", NOW + 200)
+    assert await scheduler.load(NOW + 60) == 1
+    assert scheduler.wheel._slot_of.keys() == {"t1", "t2"}
+    assert [key for key, _, _ in scheduler.wheel.advance(int(NOW + 120))] == ["t1"]
+
+
+@pytest.mark.asyncio
+async def test_running_scheduler_pushes_on_time():
+    storage = DueStorage()
+    sched = ReminderScheduler(tick=0.02, horizon=60, storage=storage, backend=MemoryStateBackend())
+    due = time.time() + 0.1
+    storage.add("u1", "Tea", due)
+    queue = sched.subscribe("u1")
+    sched.start()
+    try:
+        event = await asyncio.wait_for(queue.get(), 2)
+        assert event["title"] == "Tea" and time.time() >= due
+    finally:
+        await sched.stop()
+    assert sched.counters["fired"] == 1 and not sched.active
+
+
+@pytest.mark.asyncio
+async def test_tools_write_through(scheduler, monkeypatch):
+    previous = storage_module._storage
+    set_storage(scheduler.storage)
+    monkeypatch.setattr(reminders, "reminder_scheduler", scheduler)
+    from app import mcp_server
+    monkeypatch.setattr(mcp_server, "reminder_scheduler", scheduler)
+    try:
+        await scheduler.load(NOW)
+        await add_todo("Call mom", "u1", due_date=iso(NOW + 30))
+        await add_todo("Next year", "u1", due_date=iso(NOW + 86400 * 365))
+        await add_todo("Gym", "u1", recurrence="daily", due_date=iso(NOW + 60))
+        assert set(scheduler.wheel._slot_of) == {"t1", "t3"}
+
+        await delete_todo("t1", "u1")
+        await complete_todo("t3", "u1")
+        assert len(scheduler.wheel) == 0  # the respawned Gym is due tomorrow, outside the window
+        assert scheduler.storage.tasks["t4"]["title"] == "Gym"
+    finally:
+        set_storage(previous)
+
+
+@pytest.mark.asyncio
+async def test_other_workers_follow_through_the_invalidation_log(scheduler):
+    backend = scheduler.backend
+    other = ReminderScheduler(tick=1, horizon=600, storage=scheduler.storage, backend=backend, clock=Clock())
+    other.reset(NOW)
+    for sched in (scheduler, other):
+        await sched.load(NOW)
+        await sched.sync(NOW)
+
+    task = scheduler.storage.add("u1", "Standup", NOW + 120)
+    scheduler.task_saved(task)
+    await other.sync(NOW)
+    assert "t1" in other.wheel and "t1" in scheduler.wheel
+
+    scheduler.storage.tasks.pop("t1")
+    scheduler.task_removed("t1", "u1")
+    await other.sync(NOW)
+    await scheduler.sync(NOW)  # its own event is skipped, not re-read
+    assert "t1" not in other.wheel and not scheduler._published
+
+    scheduler.reload()
+    other.loaded_until = NOW + 600
+    await other.sync(NOW + 5)
+    assert other.loaded_until == NOW + 5
+
+
+@pytest.mark.asyncio
+async def test_failed_sync_lookup_is_not_lost(scheduler, monkeypatch):
+    other = ReminderScheduler(tick=1, horizon=600, storage=scheduler.storage, backend=scheduler.backend, clock=Clock())
+    other.reset(NOW)
+    await other.load(NOW)
+    await other.sync(NOW)
+
+    task = scheduler.storage.add("u1", "Standup", NOW + 120)
+    scheduler.task_saved(task)
+
+    async def unavailable(task_id, user_id):
+        raise ConnectionError("storage unavailable")
+
+    monkeypatch.setattr(scheduler.storage, "get_task", unavailable)
+    await other.sync(NOW + 1)
+    assert "t1" not in other.wheel and other._next_load == 0.0
+    # The next load re-reads the window and picks the task up
+    assert await other.load(NOW + 1) == 1 and "t1" in other.wheel
+
+
+def test_relative_due_dates_are_computed_not_extracted():
+    now = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    assert relative_due_date("call mom in 30 mins", now) == (now + timedelta(minutes=30)).isoformat()
+    assert relative_due_date("Pay rent in an hour", now) == (now + timedelta(hours=1)).isoformat()
+    assert relative_due_date("meeting in 1.5 hrs", now) == (now + timedelta(minutes=90)).isoformat()
+    assert relative_due_date("buy milk in Lahore", now) is None
+
+
+def test_batched_urdu_items_get_relative_due_dates(monkeypatch):
+    manager = SkillManager()
+    monkeypatch.setattr(manager, "_get_llm_json", lambda prompt, tier="standard", user_id=None: {"results": [
+        {"utterance_en": "call mom in 30 mins", "intent": "add_task", "slots": {"item": "Call mom"}, "detected_lang": "ur"},
+        {"intent": "add_task", "slots": {"item": "Pay rent in an hour"}, "detected_lang": "en"},
+    ]})
+    before = datetime.now(timezone.utc)
+    results = manager.execute_skill("intent_extractor_batch", {"utterances": ["امی کو 30 منٹ میں فون کرو", "pay rent in an hour"]})["results"]
+
+    assert results[0]["slots"]["item"] == "Call mom" and results[1]["slots"]["item"] == "Pay rent"
+    offsets = [(datetime.fromisoformat(r["slots"]["due_date"]) - before).total_seconds() for r in results]
+    assert 1800 <= offsets[0] < 1810 and 3600 <= offsets[1] < 3610
+
+
+@pytest.mark.asyncio
+async def test_reminder_stats_endpoint(scheduler, monkeypatch):
+    from app.api import agent
+    monkeypatch.setattr(agent, "reminder_scheduler", scheduler)
+    scheduler.subscribe("u1")
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "u1"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/api/agent/reminders/stats")
+    finally:
+        app.dependency_overrides.clear()
+    body = response.json()
+    assert body["sessions"] == 1 and body["pending"] == 0 and body["loaded_until"] == iso(NOW)
@@ -0,0 +1,121 @@
+import json
+from types import SimpleNamespace
+from app import replay
+from app.replay import Cassette, build_manager, build_report, load_interactions
+
+
+class FakeLiveCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        prompt = messages[-1]["content"]
+        slots = {"item": "Milk", "priority": "high"} if "milk" in prompt else {}
+        content = json.dumps({"intent": "add_task" if slots else "list_tasks", "slots": slots})
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def test_load_interactions_formats(tmp_path):
+    (tmp_path / "log.json").write_text(json.dumps({"history": [{"utterance": "buy milk", "action": "create"}, {"utterance": " "}]}))
+    (tmp_path / "log.jsonl").write_text('{"utterance": "show tasks"}\n\n')
+    (tmp_path / "export.csv").write_text("id,utterance,action\n1,hello,greeting\n")
+
+    assert load_interactions(str(tmp_path / "log.json")) == [{"utterance": "buy milk", "action": "create"}]
+    assert load_interactions(str(tmp_path / "log.jsonl")) == [{"utterance": "show tasks"}]
+    assert load_interactions(str(tmp_path / "export.csv"))[0]["action"] == "greeting"
+
+
+def test_stub_replay_scores_against_logged_actions():
+    rows = [
+        {"utterance": "buy milk", "action": "create"},
+        {"utterance": "show my tasks", "action": "list"},
+        {"utterance": "hello", "action": "clarify"},
+        {"utterance": "qwerty", "action": "unknown_action"},
+    ]
+    results = replay.replay([r["utterance"] for r in rows], workers=4, providers="stub")
+    report = build_report(rows, results)
+
+    assert [r["intent"] for r in results] == ["add_task", "list_tasks", "greeting", "clarify"]
+    assert report["compared"] == 3 and report["agreement"] == 0.6667
+    assert report["confusion"] == {"clarify -> greeting": 1}
+    assert report["latency"]["intent_extractor"]["count"] == 4
+
+
+def test_recorded_cassette_replays_live_answers(monkeypatch):
+    live = FakeLiveCompletions()
+    cassette = Cassette()
+    manager = build_manager("stub")
+    manager.clients = [{"name": "Live", "client": SimpleNamespace(chat=SimpleNamespace(completions=live)),
+                        "model": "m", "models": dict.fromkeys(("light", "standard", "heavy"), "m")}]
+    for provider in manager.clients:
+        provider["client"] = replay.RecordingClient(provider["client"], cassette)
+    utterances = ["buy milk urgently", "what is on my list"]
+    baseline = replay.replay(utterances, manager=manager, workers=2)
+    assert live.calls == 2 and len(cassette.entries) == 2
+
+    # Same prompts: answered from the cassette, no live calls, full agreement
+    recorded = replay.replay(utterances, workers=2, providers="recorded", cassette=cassette)
+    report = build_report([{}, {}], recorded, baseline)
+    assert live.calls == 2 and report["agreement"] == 1.0 and report["slot_diffs"] == []
+
+    # A changed fallback answer shows up as a slot diff against the baseline
+    baseline[0]["slots"]["priority"] = "low"
+    report = build_report([{}, {}], recorded, baseline)
+    assert report["slot_diffs"] == [{"index": 0, "utterance": "buy milk urgently", "diff": {"priority": ["low", "high"]}}]
+
+
+def test_cli_writes_report_usable_as_baseline(tmp_path, capsys):
+    log = tmp_path / "log.json"
+    log.write_text(json.dumps([{"utterance": "buy milk", "action": "create"}, {"utterance": "show tasks", "action": "list"}]))
+    out = tmp_path / "report.json"
+    replay.main([str(log), "--output", str(out), "--quiet"])
+    replay.main([str(log), "--baseline", str(out)])
+
+    printed = capsys.readouterr().out
+    assert "Intent agreement vs baseline: 100.0% of 2" in printed
+    assert json.loads(out.read_text())["results"][0]["slots"]["item"] == "Milk"
+
+
+def test_live_replay_bypasses_production_limits(monkeypatch):
+    from app.api import skills
+    from app.ratelimit import RateLimiter, provider_limiter
+    from app.state import MemoryStateBackend
+
+    live = FakeLiveCompletions()
+    manager = build_manager("live")
+    manager.clients = [{"name": "Live", "client": SimpleNamespace(chat=SimpleNamespace(completions=live)),
+                        "model": "m", "models": dict.fromkeys(("light", "standard", "heavy"), "m")}]
+    # The shared limiter is already empty and the shared budget spent: neither may apply
+    monkeypatch.setattr(provider_limiter, "acquire", lambda key, cost=1.0: (False, 60.0))
+    monkeypatch.setattr(skills.model_router.budget, "check", lambda user_id, estimate: "exhausted")
+    charged = []
+    monkeypatch.setattr(skills.model_router.budget, "charge", lambda user_id, tokens: charged.append(tokens))
+
+    results = replay.replay([f"buy milk {i}" for i in range(100)], manager=manager, workers=8)
+    assert live.calls == 100 and all(r["intent"] == "add_task" for r in results)
+    assert charged == [] and replay.fallback_summary(manager) == {"rate_limited": 0, "provider_errors": 0, "cassette_misses": 0}
+
+    # Rate-limit fallbacks are counted apart from cassette misses
+    manager.limiter = RateLimiter("replay-test", rate=0.001, burst=1, backend=MemoryStateBackend())
+    replay.replay(["buy milk", "show my list", "buy bread"], manager=manager, workers=1)
+    assert live.calls == 101 and replay.fallback_summary(manager)["rate_limited"] == 2
+
+
+
+def test_relative_due_dates_compare_by_offset():
+    def case(ran_at, due_date):
+        return {"utterance": "call mom in 30 mins", "intent": "add_task", "ran_at": ran_at,
+                "slots": {"item": "Call mom", "due_date": due_date},
+                "timings": {"translator_urdu": 0.001, "intent_extractor": 0.002}}
+
+    baseline = [case("2026-01-01T10:00:00+00:00", "2026-01-01T10:30:00+00:00")]
+    # Replayed months later: the due date moved with the clock, the offset did not
+    later = [case("2026-10-19T08:00:05+00:00", "2026-10-19T08:30:07+00:00")]
+    assert build_report([{}], later, baseline)["slot_diffs"] == []
+    # A recorded model answer is the same instant whenever it is replayed
+    assert build_report([{}], [case("2026-10-19T08:00:05+00:00", "2026-01-01T10:30:00+00:00")], baseline)["slot_diffs"] == []
+
+    wrong = [case("2026-10-19T08:00:05+00:00", "2026-10-19T09:00:05+00:00")]
+    assert list(build_report([{}], wrong, baseline)["slot_diffs"][0]["diff"]) == ["due_date"]
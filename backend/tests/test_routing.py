@@ -0,0 +1,102 @@
+import os
+import json
+import pytest
+import httpx
+from types import SimpleNamespace
+from httpx import ASGITransport
+from app.main import app
+from app.auth import verify_jwt
+from app import routing
+from app.api import skills
+from app.api.skills import SkillManager
+from app.routing import ModelRouter, TokenBudget, UsageStats, score_complexity
+from app.state import MemoryStateBackend
+
+MODELS = {"light": "small", "standard": "medium", "heavy": "large"}
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.models = []
+
+    def create(self, model, messages, **kwargs):
+        self.models.append(model)
+        content = json.dumps({"intent": "list_tasks", "slots": {}})
+        usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    completions = FakeCompletions()
+    router = ModelRouter(TokenBudget(user_budget=4000, global_budget=100000, backend=MemoryStateBackend()), UsageStats())
+    monkeypatch.setattr(skills, "model_router", router)
+    manager = SkillManager()
+    manager.clients = [{
+        "name": "Fake", "client": SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+        "model": "medium", "models": MODELS
+    }]
+    return manager, completions, router
+
+
+def test_score_complexity_tiers():
+    assert score_complexity("show tasks")["tier"] == "light"
+    assert score_complexity("call mom tomorrow at 5pm")["tier"] == "standard"
+    assert score_complexity("add milk, eggs and bread for tomorrow morning")["tier"] == "heavy"
+    urdu = score_complexity("امی کو کل شام پانچ بجے فون کرو")
+    assert urdu["tier"] == "standard" and "non_latin" in urdu["signals"]
+
+
+def test_extraction_picks_tier_and_records_usage(routed):
+    manager, completions, router = routed
+    manager.execute_skill("intent_extractor", {"utterance": "show tasks", "user_id": "u1"})
+    manager.execute_skill("intent_extractor", {"utterance": "pay rent, call mom and buy milk tomorrow", "user_id": "u1"})
+
+    assert completions.models == ["small", "large"]
+    stats = router.stats.report()
+    assert stats["Fake/small"]["prompt_tokens"] == 120 and stats["Fake/small"]["tiers"] == {"light": 1}
+    assert stats["Fake/large"]["completion_tokens"] == 30 and stats["Fake/large"]["latency_p50"] is not None
+    assert router.budget.usage("u1")["user"] == {"used": 300, "budget": 4000, "exhausted": False}
+
+
+def test_budget_downgrades_then_falls_back_to_keywords(routed):
+    manager, completions, router = routed
+    router.budget.charge("u2", 3000)
+    manager.execute_skill("intent_extractor", {"utterance": "call mom tomorrow at 5pm", "user_id": "u2"})
+    assert completions.models == ["small"]  # over 80% of the budget: light tier only
+
+    router.budget.charge("u2", 800)
+    result = manager.execute_skill("intent_extractor", {"utterance": "buy milk", "user_id": "u2"})
+    assert completions.models == ["small"]
+    assert result["intent"] == "add_task" and result["slots"]["item"] == "Milk"
+    assert router.budget.exhausted("u2") and router.budget.usage("u2")["user"]["exhausted"]
+    # Other users still get the LLM
+    manager.execute_skill("intent_extractor", {"utterance": "show tasks", "user_id": "u3"})
+    assert completions.models == ["small", "small"]
+    assert not router.budget.exhausted("u3")
+
+
+def test_budgets_are_off_by_default():
+    budget = TokenBudget(user_budget=0, global_budget=0, backend=MemoryStateBackend())
+    budget.charge("u5", 10 ** 9)
+    assert budget.check("u5", 1000) == "ok" and not budget.exhausted("u5")
+    assert routing.USER_TOKEN_BUDGET == int(os.getenv("USER_TOKEN_BUDGET", "0"))
+
+
+@pytest.mark.asyncio
+async def test_model_stats_endpoint(routed, monkeypatch):
+    _, _, router = routed
+    from app.api import agent
+    monkeypatch.setattr(agent, "model_router", router)
+    router.stats.record("Fake", "small", "light", 0.2, 100, 20)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "u4"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/api/agent/models/stats")
+    finally:
+        app.dependency_overrides.clear()
+
+    body = response.json()
+    assert body["models"]["Fake/small"]["calls"] == 1
+    assert body["budget"]["user"] == {"used": 0, "budget": 4000, "exhausted": False}
+    assert "prefetch_budget" in body
@@ -0,0 +1,71 @@
+import pytest
+import httpx
+from types import SimpleNamespace
+from httpx import ASGITransport
+from app import auth
+from app.main import app
+from app.auth import verify_jwt
+from app.api import agent
+
+ROWS = [
+    {"id": "t1", "title": "Book dentist appointment", "description": None, "status": "pending", "priority": "high",
+     "recurrence": "none", "due_date": None, "tags": ["health"], "created_at": "2026-10-19T09:00:00+00:00",
+     "rank": 1.2, "total": 3},
+    {"id": "t2", "title": "Pay dentist invoice", "description": None, "status": "pending", "priority": "medium",
+     "recurrence": "none", "due_date": None, "tags": [], "created_at": "2026-10-18T09:00:00+00:00",
+     "rank": 0.8, "total": 3},
+]
+
+
+@pytest.fixture
+def rpc_calls(monkeypatch):
+    calls = []
+
+    def fake_rpc(name, params):
+        calls.append((name, params))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=ROWS))
+
+    monkeypatch.setattr(auth.supabase_admin, "rpc", fake_rpc)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "search-user"}
+    yield calls
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_search_endpoint_pages_ranked_rpc_results(rpc_calls):
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get("/api/agent/tasks/search",
+                                params={"q": " dentist ", "status": "pending", "tag": ["health", "work"], "limit": 2})
+        bad = await ac.get("/api/agent/tasks/search", params={"q": "dentist", "status": "archived"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["id"] for item in body["items"]] == ["t1", "t2"]
+    assert "total" not in body["items"][0]
+    assert (body["total"], body["has_more"]) == (3, True)
+    assert rpc_calls == [("search_tasks", {
+        "p_user_id": "search-user", "p_query": "dentist", "p_status": "pending", "p_tags": ["health", "work"],
+        "p_limit": 2, "p_offset": 0
+    })]
+    assert bad.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_dispatch_routes_lookups_to_search(rpc_calls, monkeypatch):
+    def fake_execute_skill(name, inputs):
+        if name == "translator_urdu":
+            return {"utterance_en": inputs["utterance"], "detected_lang": "en"}
+        return {"intent": "search_tasks", "slots": {"query": "dentist"}}
+
+    async def fake_save_interaction(data):
+        return None
+
+    monkeypatch.setattr(agent.skill_manager, "execute_skill", fake_execute_skill)
+    monkeypatch.setattr(agent, "save_interaction", fake_save_interaction)
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/agent/dispatch", json={"utterance": "where is my dentist task"})
+
+    body = response.json()
+    assert body["action"] == "search"
+    assert "Book dentist appointment" in body["message"] and "1-2 of 3" in body["message"]
+    assert rpc_calls[0][1]["p_query"] == "dentist"
@@ -0,0 +1,138 @@
+import time
+import threading
+import pytest
+from app.state import (
+    MemoryStateBackend, SQLiteStateBackend, RedisStateBackend, NamespaceCache, create_state_backend, offload
+)
+
+
+class LocalRedis:
+    """Stand-in for a Redis server: implements the handful of commands the backend uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def _alive(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+        return key in self.data
+
+    def get(self, key):
+        return self.data[key][0] if self._alive(key) else None
+
+    def mget(self, keys):
+        return [self.get(k) for k in keys]
+
+    def set(self, key, value, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self.data[key] = (str(value), time.time() + px / 1000 if px else None)
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incrby(self, key, amount):
+        value = int(self.get(key) or 0) + amount
+        expires_at = self.data[key][1] if self._alive(key) else None
+        self.data[key] = (str(value), expires_at)
+        return value
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    """Queues commands and runs them back to back, like MULTI/EXEC."""
+
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.queued.append((getattr(self.client, name), args, kwargs))
+
+    def execute(self):
+        self.client.transactions = getattr(self.client, "transactions", 0) + 1
+        return [fn(*args, **kwargs) for fn, args, kwargs in self.queued]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "sqlite":
+        return SQLiteStateBackend(str(tmp_path / "state.db"))
+    return RedisStateBackend(client=LocalRedis())
+
+
+def test_backend_kv_roundtrip(backend):
+    backend.set("a", {"user_id": "u1"})
+    assert backend.get("a") == {"user_id": "u1"}
+    assert backend.add("a", 1) is False
+    assert backend.add("b", 1) is True
+    assert backend.incr("n") == 1
+    assert backend.incr("n", 4) == 5
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_backend_ttl_expiry(backend):
+    backend.set("short", "x", ttl=1)
+    assert backend.get("short") == "x"
+    time.sleep(1.1)
+    assert backend.get("short") is None
+    assert backend.add("short", "y", ttl=1) is True
+
+
+def test_backend_subsecond_ttl(backend):
+    backend.set("blink", "x", ttl=0.2)
+    assert backend.incr("count", 2, ttl=0.2) == 2
+    assert backend.incr("count", 3, ttl=60) == 5  # an existing counter keeps its first TTL
+    time.sleep(0.3)
+    assert backend.get("blink") is None and backend.get("count") is None
+
+
+def test_redis_counter_and_expiry_are_one_transaction():
+    client = LocalRedis()
+    backend = RedisStateBackend(client=client)
+    backend.incr("budget", 10, ttl=60)
+    assert client.transactions == 1 and client.data["todo:budget"][1] is not None
+
+
+@pytest.mark.asyncio
+async def test_offload_keeps_blocking_backends_off_the_loop(tmp_path):
+    threads = []
+    for backend in (MemoryStateBackend(), SQLiteStateBackend(str(tmp_path / "s.db"))):
+        await offload(backend, backend.set, "k", 1)
+        threads.append(await offload(backend, threading.get_ident))
+    assert threads[0] == threading.get_ident() and threads[1] != threading.get_ident()
+
+
+def test_memory_backend_is_bounded():
+    backend = MemoryStateBackend(max_entries=3)
+    for i in range(10):
+        backend.set(f"k{i}", i)
+    assert backend.get("k0") is None
+    assert backend.get("k9") == 9
+
+
+def test_invalidation_is_broadcast_across_workers(tmp_path):
+    path = str(tmp_path / "shared.db")
+    # Two backend instances on one file behave like two worker processes
+    worker_a = NamespaceCache("tasks", ttl=60, backend=SQLiteStateBackend(path), poll_interval=0)
+    worker_b = NamespaceCache("tasks", ttl=60, backend=SQLiteStateBackend(path), poll_interval=0)
+
+    worker_a.set("u1", ["old"])
+    assert worker_b.get("u1") == ["old"]
+
+    worker_a.invalidate("u1")
+    assert worker_b.get("u1") is None
+
+
+def test_create_state_backend_from_spec(tmp_path):
+    assert isinstance(create_state_backend("memory"), MemoryStateBackend)
+    assert isinstance(create_state_backend(f"sqlite:///{tmp_path}/s.db"), SQLiteStateBackend)
+    with pytest.raises(ValueError):
+        create_state_backend("memcached://nope")
@@ -0,0 +1,33 @@
+import pytest
+import httpx
+from types import SimpleNamespace
+from httpx import ASGITransport
+from app import auth
+from app.main import app
+from app.auth import verify_jwt
+
+
+@pytest.mark.asyncio
+async def test_tag_facets_endpoint_passes_drill_down_filter(monkeypatch):
+    calls = []
+    rows = [{"tag": "work", "pending": 3, "completed": 1, "total": 4}]
+
+    def fake_rpc(name, params):
+        calls.append((name, params))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=rows))
+
+    monkeypatch.setattr(auth.supabase_admin, "rpc", fake_rpc)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "tag-user"}
+    try:
+        async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            everything = await ac.get("/api/agent/tasks/tags")
+            drill_down = await ac.get("/api/agent/tasks/tags", params={"tag": ["work", "q4"]})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert everything.json() == {"tags": rows, "filter": []}
+    assert drill_down.json()["filter"] == ["work", "q4"]
+    assert calls == [
+        ("tag_facets", {"p_user_id": "tag-user", "p_tags": None}),
+        ("tag_facets", {"p_user_id": "tag-user", "p_tags": ["work", "q4"]}),
+    ]
@@ -0,0 +1,134 @@
+import io
+import csv
+import json
+import pytest
+import httpx
+from httpx import ASGITransport
+from app import storage as storage_module
+from app import transfer
+from app.main import app
+from app.auth import verify_jwt
+from app.storage import TaskStorage, set_storage
+from app.transfer import iter_csv_records, iter_lines, validate_task
+
+
+class MemoryTaskStorage(TaskStorage):
+    def __init__(self):
+        self.tasks = []
+        self.batches = []
+
+    async def insert_tasks(self, rows):
+        self.batches.append(len(rows))
+        for row in rows:
+            n = len(self.tasks)
+            self.tasks.append({"id": f"t-{n:06d}", "created_at": f"2026-10-19T10:00:{n % 60:02d}+00:00",
+                               "total_time_spent": 0, **row})
+        return len(rows)
+
+    async def list_tasks_page(self, user_id, limit, after=None):
+        rows = sorted((t for t in self.tasks if t["user_id"] == user_id), key=lambda t: (t["created_at"], t["id"]))
+        if after:
+            rows = [t for t in rows if (t["created_at"], t["id"]) > tuple(after)]
+        return rows[:limit]
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def from_list(items):
+    for item in items:
+        yield item
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+@pytest.fixture
+def memory_storage():
+    previous = storage_module._storage
+    store = MemoryTaskStorage()
+    set_storage(store)
+    app.dependency_overrides[verify_jwt] = lambda: {"user_id": "transfer-user"}
+    yield store
+    app.dependency_overrides.clear()
+    set_storage(previous)
+
+
+@pytest.mark.asyncio
+async def test_lines_survive_split_multibyte_and_quoted_newlines():
+    data = '\ufefftitle,description\r\n"ودھ","two\nlines"\r\nplain,\n'.encode()
+    lines = await collect(iter_lines(chunked(data, 3)))
+    assert lines == ["title,description", '"ودھ","two', 'lines"', "plain,"]
+
+    records = await collect(iter_csv_records(from_list(lines)))
+    assert records == [(2, {"title": "ودھ", "description": "two\nlines"}, None),
+                       (4, {"title": "plain", "description": ""}, None)]
+
+
+@pytest.mark.asyncio
+async def test_csv_quotes_open_only_at_field_start(monkeypatch):
+    text = 'title,description\nBuy 12" pipe,for the sink\n"Say ""hi""","a ""quoted"", two\nline note"\nGym,\n'
+    records = await collect(iter_csv_records(from_list(text.split("\n"))))
+    assert [r for _, r, _ in records] == list(csv.DictReader(io.StringIO(text)))
+    assert [line for line, _, _ in records] == [2, 3, 5]
+
+    # A quote that never closes costs one error, then parsing carries on
+    monkeypatch.setattr(transfer, "IMPORT_MAX_LINE", 40)
+    lines = ["title", '"Broken', "still inside", "x" * 40, "Milk", "Eggs"]
+    records = await collect(iter_csv_records(from_list(lines)))
+    assert records == [(2, None, "Unterminated quoted field"), (5, {"title": "Milk"}, None), (6, {"title": "Eggs"}, None)]
+
+
+def test_validate_task_normalizes_and_rejects():
+    row = validate_task({"title": " Pay rent ", "priority": "HIGH", "tags": "bills, home", "due_date": "2026-11-01T09:30:00Z"}, "u1")
+    assert row["priority"] == "high" and row["tags"] == ["bills", "home"]
+    assert row["due_date"] == "2026-11-01T09:30:00+00:00" and row["status"] == "pending"
+    assert validate_task({"title": "x", "tags": '["a"]'}, "u1")["tags"] == ["a"]
+    for record, error in [({"title": ""}, "title is required"),
+                          ({"title": "x", "priority": "asap"}, "priority must be one of"),
+                          ({"title": "x", "due_date": "soon"}, "due_date is not an ISO 8601 date")]:
+        with pytest.raises(ValueError, match=error):
+            validate_task(record, "u1")
+
+
+@pytest.mark.asyncio
+async def test_import_batches_and_reports_line_errors(memory_storage, monkeypatch):
+    monkeypatch.setattr(transfer, "IMPORT_BATCH_SIZE", 2)
+    body = "title,priority,tags\nA,low,\nB,bogus,\n,high,\nC,,x\nD,urgent,\"[\"\"a\"\", \"\"b\"\"]\"\n"
+    summary = await transfer.import_tasks(memory_storage, "u1", chunked(body.encode(), 7), "csv")
+
+    assert summary["imported"] == 3 and memory_storage.batches == [2, 1]
+    assert summary["errors"] == [{"line": 3, "error": "priority must be one of low, medium, high, urgent, not 'bogus'"},
+                                 {"line": 4, "error": "title is required"}]
+    assert memory_storage.tasks[-1]["tags"] == ["a", "b"]
+
+    jsonl = b'{"title": "E"}\nnot json\n[1]\n'
+    summary = await transfer.import_tasks(memory_storage, "u1", chunked(jsonl, 5), "jsonl", dry_run=True)
+    assert summary["imported"] == 1 and [e["line"] for e in summary["errors"]] == [2, 3]
+    assert len(memory_storage.tasks) == 3
+
+
+@pytest.mark.asyncio
+async def test_import_export_round_trip_over_http(memory_storage, monkeypatch):
+    monkeypatch.setattr(transfer, "EXPORT_PAGE_SIZE", 4)
+    body = "".join(json.dumps({"title": f"Task {i}", "tags": ["bulk", "a,b"], "priority": "high"}) + "\n" for i in range(10))
+    async with httpx.AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        imported = await ac.post("/api/agent/tasks/import", content=body.encode(),
+                                 headers={"Content-Type": "application/x-ndjson"})
+        exported = await ac.get("/api/agent/tasks/export?format=csv")
+        jsonl = await ac.get("/api/agent/tasks/export", params={"format": "jsonl"})
+        bad = await ac.get("/api/agent/tasks/export?format=xml")
+
+    assert imported.json()["imported"] == 10 and imported.json()["errors"] == []
+    assert exported.headers["content-disposition"] == 'attachment; filename="tasks.csv"'
+    assert [json.loads(line)["title"] for line in jsonl.text.splitlines()] == [f"Task {i}" for i in range(10)]
+    assert bad.status_code == 422
+
+    # The CSV export imports back unchanged
+    copy = MemoryTaskStorage()
+    summary = await transfer.import_tasks(copy, "transfer-user", chunked(exported.content, 64), "csv")
+    assert summary == {"imported": 10, "failed": 0, "errors": [], "dry_run": False}
+    assert [t["tags"] for t in copy.tasks] == [["bulk", "a,b"]] * 10
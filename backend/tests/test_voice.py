@@ -0,0 +1,217 @@
+import math
+import asyncio
+import struct
+import hashlib
+import pytest
+from starlette.testclient import TestClient
+from app import auth
+from app.main import app
+from app.api import voice
+from app.api.agent import AgentResponse
+from app.audio import AudioRingBuffer, EnergyVAD, SpeechToText, VoiceSession, set_stt_backend
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=8000, freq=220):
+    n = int(RATE * seconds)
+    return struct.pack(f"<{n}h", *(int(amplitude * math.sin(2 * math.pi * freq * i / RATE)) for i in range(n)))
+
+
+def silence(seconds):
+    return bytes(int(RATE * seconds) * 2)
+
+
+class StubSTT(SpeechToText):
+    """Reports how much audio it was given, so tests can see what the VAD cut."""
+    name = "stub"
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, pcm, sample_rate, final=False):
+        self.calls.append((len(pcm), final))
+        return f"buy milk {len(pcm) // (sample_rate * 2 // 10)}" if final else "buy"
+
+
+def test_ring_buffer_wraps_and_reads_contiguous_views():
+    ring = AudioRingBuffer(10)
+    ring.write(b"abcdef")
+    view = ring.read(1, 4)
+    assert isinstance(view, memoryview) and bytes(view) == b"bcd"
+
+    ring.write(b"ghijkl")  # wraps: the ring now holds positions 2-11
+    assert ring.oldest == 2
+    assert bytes(ring.read(8, 12)) == b"ijkl"
+    assert bytes(ring.read(2, 12)) == b"cdefghijkl"
+    with pytest.raises(ValueError):
+        ring.read(0, 4)
+
+    ring.write(b"0123456789ABC")  # larger than the ring: only the tail is kept
+    assert ring.written == 25 and bytes(ring.read(15, 25)) == b"3456789ABC"
+
+
+def test_vad_finds_speech_between_silences():
+    vad = EnergyVAD(RATE)
+    audio = silence(0.5) + tone(1.0) + silence(1.0)
+    events = []
+    for pos in range(0, len(audio) - vad.frame_bytes + 1, vad.frame_bytes):
+        event = vad.process(audio[pos:pos + vad.frame_bytes], pos)
+        if event:
+            events.append(event)
+
+    assert [kind for kind, _ in events] == ["start", "end"]
+    start, end = events[0][1], events[1][1]
+    # Start includes the pre-roll, end follows the hangover
+    assert start == RATE * 2 * 3 // 10
+    assert RATE * 2 * 1.5 < end <= RATE * 2 * 2.2
+
+
+@pytest.mark.asyncio
+async def test_session_emits_partials_then_one_final():
+    stt = StubSTT()
+    partials, finals = [], []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    async def on_final(text):
+        finals.append(text)
+
+    session = VoiceSession(stt, RATE, on_partial=on_partial, on_final=on_final)
+    audio = silence(0.3) + tone(2.0) + silence(1.0)
+    for pos in range(0, len(audio), 640):  # 20 ms chunks, as a browser would send
+        await session.feed(audio[pos:pos + 640])
+        await asyncio.sleep(0.002)  # let the partial pass run between frames
+    await session.flush()
+
+    assert len(finals) == 1 and finals[0].startswith("buy milk")
+    assert partials and all(p == "buy" for p in partials)
+    assert [final for _, final in stt.calls].count(True) == 1
+
+
+@pytest.mark.asyncio
+async def test_session_survives_a_write_larger_than_its_buffer():
+    stt = StubSTT()
+    finals = []
+
+    async def on_final(text):
+        finals.append(text)
+
+    session = VoiceSession(stt, RATE, on_final=on_final)
+    session.buffer = AudioRingBuffer(RATE * 2)  # one second
+    await session.feed(silence(0.3) + tone(2.0) + silence(1.0))
+    assert session._vad_pos >= session.buffer.oldest
+    audio = tone(0.5) + silence(1.0)
+    for pos in range(0, len(audio), 640):
+        await session.feed(audio[pos:pos + 640])
+    await session.flush()
+    assert len(finals) == 1
+
+
+@pytest.fixture
+def voice_client(monkeypatch):
+    stt = StubSTT()
+    set_stt_backend(stt)
+    auth.token_claims.set(hashlib.sha256(b"voice-token").hexdigest(), {"user_id": "voice-user"})
+    dispatched = []
+
+    async def fake_dispatch(utterance, user_id):
+        dispatched.append((utterance, user_id))
+        return AgentResponse(action="create", result={"task": "Milk"}, message="Got it!")
+
+    async def fake_prefetch(text, user_id):
+        dispatched.append(("prefetch:" + text, user_id))
+
+    monkeypatch.setattr(voice, "dispatch_utterance", fake_dispatch)
+    monkeypatch.setattr(voice, "start_prefetch", fake_prefetch)
+    yield TestClient(app), dispatched
+    auth.token_claims.invalidate(hashlib.sha256(b"voice-token").hexdigest())
+    set_stt_backend(None)
+
+
+def test_websocket_streams_transcripts_and_dispatches(voice_client):
+    client, dispatched = voice_client
+    audio = silence(0.3) + tone(1.5) + silence(1.0)
+    with client.websocket_connect("/api/voice/ws") as ws:
+        ws.send_json({"type": "start", "token": "voice-token", "codec": "pcm_s16le", "sample_rate": RATE})
+        assert ws.receive_json() == {"type": "ready"}
+        for pos in range(0, len(audio), 3200):
+            ws.send_bytes(audio[pos:pos + 3200])
+        ws.send_json({"type": "stop"})
+        events = []
+        while not events or events[-1]["type"] != "done":
+            events.append(ws.receive_json())
+
+    types = [e["type"] for e in events]
+    assert types[0] == "vad" and "final" in types
+    assert types.index("final") < types.index("result") < types.index("done")
+    final = next(e for e in events if e["type"] == "final")["text"]
+    # Partials start speculative understanding before the final transcript is dispatched
+    assert dispatched[0] == ("prefetch:buy", "voice-user")
+    assert dispatched[-1] == (final, "voice-user")
+    assert events[-1]["transcripts"] == [final]
+
+
+def test_websocket_rejects_bad_token(voice_client, monkeypatch):
+    client, _ = voice_client
+
+    async def reject(token):
+        raise auth.HTTPException(status_code=401, detail="Invalid token")
+
+    monkeypatch.setattr(voice, "verify_token", reject)
+    with client.websocket_connect("/api/voice/ws") as ws:
+        ws.send_json({"type": "start", "token": "nope"})
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive()["code"] == 1008
+
+
+class CorruptOpus:
+    def __init__(self, sample_rate):
+        pass
+
+    def decode(self, packet):
+        raise ValueError("Corrupt Opus frame: invalid packet")
+
+
+@pytest.mark.parametrize("start, code", [
+    ("not json", 1007),
+    ([1, 2], 1007),
+    ({"type": "start", "token": ["voice-token"]}, 1008),
+    ({"type": "start", "token": "voice-token", "sample_rate": "fast"}, 1003),
+    ({"type": "start", "token": "voice-token", "codec": ["opus"]}, 1003),
+])
+def test_websocket_rejects_malformed_start(voice_client, start, code):
+    client, _ = voice_client
+    with client.websocket_connect("/api/voice/ws") as ws:
+        if isinstance(start, str):
+            ws.send_text(start)
+        else:
+            ws.send_json(start)
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive()["code"] == code
+
+
+@pytest.mark.parametrize("frame", ["not json", "[1]", b"\x00\x01"])
+def test_websocket_closes_on_bad_frames(voice_client, monkeypatch, frame):
+    client, _ = voice_client
+    monkeypatch.setattr(voice, "OpusDecoder", CorruptOpus)
+    with client.websocket_connect("/api/voice/ws") as ws:
+        ws.send_json({"type": "start", "token": "voice-token", "codec": "opus", "sample_rate": RATE})
+        assert ws.receive_json() == {"type": "ready"}
+        if isinstance(frame, bytes):
+            ws.send_bytes(frame)
+        else:
+            ws.send_text(frame)
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive()["code"] == 1007
+
+
+def test_websocket_rejects_oversized_frames(voice_client):
+    client, _ = voice_client
+    with client.websocket_connect("/api/voice/ws") as ws:
+        ws.send_json({"type": "start", "token": "voice-token", "sample_rate": RATE})
+        assert ws.receive_json() == {"type": "ready"}
+        ws.send_bytes(bytes(voice.MAX_FRAME_BYTES + 2))
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive()["code"] == 1009
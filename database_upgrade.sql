@@ -25,3 +25,279 @@ CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(priority);
 CREATE INDEX IF NOT EXISTS idx_tasks_recurrence ON tasks(recurrence);
 CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
 CREATE INDEX IF NOT EXISTS idx_tasks_user_status ON tasks(user_id, status);
+-- Tag containment (tags @> '["work"]') for list, search and facet queries
+CREATE INDEX IF NOT EXISTS idx_tasks_tags ON tasks USING gin (tags jsonb_path_ops);
+-- Keyset paging for streaming export: ORDER BY created_at, id after a (created_at, id) cursor
+CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks(user_id, created_at, id);
+-- Reminder loader: pending tasks of all users due in a time window, keyset on (due_date, id)
+CREATE INDEX IF NOT EXISTS idx_tasks_pending_due ON tasks(due_date, id) WHERE status = 'pending' AND due_date IS NOT NULL;
+
+-- Mission Clock time tracking (time_entries, atomic start/stop RPCs, analytics)
+CREATE TABLE IF NOT EXISTS time_entries (
+  id bigserial PRIMARY KEY,
+  task_id uuid REFERENCES tasks(id) ON DELETE CASCADE NOT NULL,
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+  started_at timestamp with time zone DEFAULT now() NOT NULL,
+  stopped_at timestamp with time zone,
+  duration_seconds integer,
+  CHECK (stopped_at IS NULL OR stopped_at >= started_at)
+);
+
+-- At most one running clock per task; this is what makes concurrent starts safe
+CREATE UNIQUE INDEX IF NOT EXISTS idx_time_entries_running ON time_entries(task_id) WHERE stopped_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_time_entries_user_started ON time_entries(user_id, started_at);
+
+-- Clocks running when this upgrade is applied become open entries, so stop_task_timer can close them
+INSERT INTO time_entries (task_id, user_id, started_at)
+SELECT id, user_id, timer_started_at FROM tasks WHERE timer_started_at IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+-- Per-day rollup maintained incrementally by stop_task_timer, so analytics never scan raw entries
+CREATE TABLE IF NOT EXISTS time_rollup_daily (
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+  task_id uuid REFERENCES tasks(id) ON DELETE CASCADE NOT NULL,
+  day date NOT NULL,
+  seconds bigint DEFAULT 0 NOT NULL,
+  PRIMARY KEY (user_id, day, task_id)
+);
+
+ALTER TABLE time_entries ENABLE ROW LEVEL SECURITY;
+ALTER TABLE time_rollup_daily ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own time entries" ON time_entries;
+CREATE POLICY "Users can view their own time entries"
+  ON time_entries FOR SELECT
+  USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can view their own time rollups" ON time_rollup_daily;
+CREATE POLICY "Users can view their own time rollups"
+  ON time_rollup_daily FOR SELECT
+  USING (auth.uid() = user_id);
+
+CREATE OR REPLACE FUNCTION start_task_timer(p_task_id uuid, p_user_id uuid)
+RETURNS TABLE (title text, started_at timestamp with time zone, already_running boolean)
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+#variable_conflict use_column
+DECLARE
+  v_title text;
+  v_started timestamp with time zone;
+BEGIN
+  SELECT t.title INTO v_title FROM tasks t WHERE t.id = p_task_id AND t.user_id = p_user_id;
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO time_entries (task_id, user_id) VALUES (p_task_id, p_user_id)
+  ON CONFLICT (task_id) WHERE stopped_at IS NULL DO NOTHING
+  RETURNING time_entries.started_at INTO v_started;
+
+  IF v_started IS NULL THEN
+    SELECT e.started_at INTO v_started FROM time_entries e WHERE e.task_id = p_task_id AND e.stopped_at IS NULL;
+    RETURN QUERY SELECT v_title, v_started, true;
+    RETURN;
+  END IF;
+
+  UPDATE tasks t SET timer_started_at = v_started WHERE t.id = p_task_id;
+  RETURN QUERY SELECT v_title, v_started, false;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION stop_task_timer(p_task_id uuid, p_user_id uuid)
+RETURNS TABLE (title text, elapsed_seconds integer, total_time_spent integer)
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+#variable_conflict use_column
+DECLARE
+  v_entry time_entries%ROWTYPE;
+  v_now timestamp with time zone := now();
+BEGIN
+  -- Closing the running row under its row lock means concurrent stops cannot both count the same time
+  UPDATE time_entries e
+  SET stopped_at = v_now,
+      duration_seconds = GREATEST(0, EXTRACT(EPOCH FROM (v_now - e.started_at)))::integer
+  WHERE e.task_id = p_task_id AND e.user_id = p_user_id AND e.stopped_at IS NULL
+  RETURNING e.* INTO v_entry;
+
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  -- Credit every calendar day the entry overlapped
+  INSERT INTO time_rollup_daily (user_id, task_id, day, seconds)
+  SELECT p_user_id, p_task_id, d::date,
+         GREATEST(0, EXTRACT(EPOCH FROM (LEAST(v_now, d + interval '1 day') - GREATEST(v_entry.started_at, d))))::bigint
+  FROM generate_series(date_trunc('day', v_entry.started_at), date_trunc('day', v_now), interval '1 day') AS d
+  ON CONFLICT (user_id, day, task_id) DO UPDATE SET seconds = time_rollup_daily.seconds + EXCLUDED.seconds;
+
+  RETURN QUERY
+  UPDATE tasks t
+  SET total_time_spent = COALESCE(t.total_time_spent, 0) + v_entry.duration_seconds,
+      timer_started_at = NULL
+  WHERE t.id = p_task_id AND t.user_id = p_user_id
+  RETURNING t.title, v_entry.duration_seconds, t.total_time_spent;
+END;
+$$;
+
+-- Time totals per day, priority and tag, with each bucket's share of its dimension
+CREATE OR REPLACE FUNCTION time_analytics(p_user_id uuid, p_from date, p_to date)
+RETURNS TABLE (dimension text, bucket text, seconds bigint, share numeric)
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public AS $$
+  WITH base AS (
+    SELECT r.day, r.seconds, t.priority, t.tags
+    FROM time_rollup_daily r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE r.user_id = p_user_id AND r.day BETWEEN p_from AND p_to
+  ), grouped AS (
+    SELECT 'day' AS dimension, day::text AS bucket, sum(seconds)::bigint AS seconds FROM base GROUP BY day
+    UNION ALL
+    SELECT 'priority', priority, sum(seconds)::bigint FROM base GROUP BY priority
+    UNION ALL
+    SELECT 'tag', tag, sum(seconds)::bigint
+    FROM base, jsonb_array_elements_text(CASE WHEN jsonb_typeof(base.tags) = 'array' THEN base.tags ELSE '[]'::jsonb END) AS tag
+    GROUP BY tag
+  )
+  SELECT dimension, bucket, seconds,
+         round(seconds * 100.0 / NULLIF(sum(seconds) OVER (PARTITION BY dimension), 0), 2) AS share
+  FROM grouped
+  ORDER BY dimension, bucket;
+$$;
+
+-- The RPCs take a user id, so only the backend (service role) may call them
+REVOKE EXECUTE ON FUNCTION start_task_timer(uuid, uuid) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION stop_task_timer(uuid, uuid) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION time_analytics(uuid, date, date) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION start_task_timer(uuid, uuid) TO service_role;
+GRANT EXECUTE ON FUNCTION stop_task_timer(uuid, uuid) TO service_role;
+GRANT EXECUTE ON FUNCTION time_analytics(uuid, date, date) TO service_role;
+
+-- Conversation history (older deployments logged a "timestamp" column and had no index)
+CREATE TABLE IF NOT EXISTS interactions (
+  id bigserial PRIMARY KEY,
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+  utterance text NOT NULL,
+  action text,
+  agent_response text,
+  created_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+ALTER TABLE interactions ADD COLUMN IF NOT EXISTS created_at timestamp with time zone DEFAULT now() NOT NULL;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'interactions' AND column_name = 'timestamp') THEN
+    UPDATE interactions SET created_at = "timestamp"::timestamp with time zone WHERE "timestamp" IS NOT NULL;
+  END IF;
+END $$;
+
+-- Keyset pagination: (user_id, created_at, id) serves latest-page, "before" and "since" queries from the index
+CREATE INDEX IF NOT EXISTS idx_interactions_user_created ON interactions(user_id, created_at DESC, id DESC);
+
+ALTER TABLE interactions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own interactions" ON interactions;
+CREATE POLICY "Users can view their own interactions"
+  ON interactions FOR SELECT
+  USING (auth.uid() = user_id);
+
+-- Task search: ranked full-text over title/description plus trigram matching for typos and partial words
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- The indexes below are on these expressions; queries must use the same calls to hit them
+CREATE OR REPLACE FUNCTION task_search_vector(p_title text, p_description text)
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+  SELECT setweight(to_tsvector('english'::regconfig, coalesce(p_title, '')), 'A') ||
+         setweight(to_tsvector('english'::regconfig, coalesce(p_description, '')), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION task_search_text(p_title text, p_description text)
+RETURNS text LANGUAGE sql IMMUTABLE AS $$
+  SELECT coalesce(p_title, '') || ' ' || coalesce(p_description, '')
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_tasks_search_vector ON tasks USING gin (task_search_vector(title, description));
+CREATE INDEX IF NOT EXISTS idx_tasks_search_trgm ON tasks USING gin (task_search_text(title, description) gin_trgm_ops);
+
+-- Matches on either index, ranked by full-text relevance plus word similarity; total is the match count before paging
+CREATE OR REPLACE FUNCTION search_tasks(
+  p_user_id uuid, p_query text, p_status text DEFAULT NULL, p_tags jsonb DEFAULT NULL,
+  p_limit integer DEFAULT 20, p_offset integer DEFAULT 0
+)
+RETURNS TABLE (
+  id uuid, title text, description text, status text, priority text, recurrence text,
+  due_date timestamp with time zone, tags jsonb, created_at timestamp with time zone, rank real, total bigint
+)
+LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public, extensions AS $$
+  WITH q AS (SELECT websearch_to_tsquery('english'::regconfig, p_query) AS tsq)
+  SELECT t.id, t.title, t.description, t.status, t.priority, t.recurrence, t.due_date, t.tags, t.created_at,
+         (ts_rank_cd(task_search_vector(t.title, t.description), q.tsq)
+          + word_similarity(p_query, task_search_text(t.title, t.description)))::real AS rank,
+         count(*) OVER () AS total
+  FROM tasks t, q
+  WHERE t.user_id = p_user_id
+    AND (task_search_vector(t.title, t.description) @@ q.tsq
+         OR p_query <% task_search_text(t.title, t.description))
+    AND (p_status IS NULL OR t.status = p_status)
+    AND (p_tags IS NULL OR t.tags @> p_tags)
+  ORDER BY rank DESC, t.created_at DESC
+  LIMIT p_limit OFFSET p_offset;
+$$;
+
+REVOKE EXECUTE ON FUNCTION search_tasks(uuid, text, text, jsonb, integer, integer) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION search_tasks(uuid, text, text, jsonb, integer, integer) TO service_role;
+
+-- Per-tag task counts by status in one pass; p_tags narrows to tasks carrying all of those tags.
+-- Two statements, because "p_tags IS NULL OR tags @> p_tags" keeps the planner off idx_tasks_tags
+CREATE OR REPLACE FUNCTION tag_facets(p_user_id uuid, p_tags jsonb DEFAULT NULL)
+RETURNS TABLE (tag text, pending bigint, completed bigint, total bigint)
+LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+  IF p_tags IS NULL THEN
+    RETURN QUERY
+    SELECT e.tag,
+           count(*) FILTER (WHERE t.status = 'pending'),
+           count(*) FILTER (WHERE t.status = 'completed'),
+           count(*)
+    FROM tasks t, jsonb_array_elements_text(t.tags) AS e(tag)
+    WHERE t.user_id = p_user_id AND jsonb_typeof(t.tags) = 'array'
+    GROUP BY e.tag
+    ORDER BY count(*) DESC, e.tag;
+  ELSE
+    RETURN QUERY
+    SELECT e.tag,
+           count(*) FILTER (WHERE t.status = 'pending'),
+           count(*) FILTER (WHERE t.status = 'completed'),
+           count(*)
+    FROM tasks t, jsonb_array_elements_text(t.tags) AS e(tag)
+    WHERE t.user_id = p_user_id AND jsonb_typeof(t.tags) = 'array' AND t.tags @> p_tags
+    GROUP BY e.tag
+    ORDER BY count(*) DESC, e.tag;
+  END IF;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION tag_facets(uuid, jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION tag_facets(uuid, jsonb) TO service_role;
+
+-- Net effect of a batched dispatch (/dispatch/batch) in one transaction: inserts, completions and deletes land together or not at all
+CREATE OR REPLACE FUNCTION apply_task_batch(
+  p_user_id uuid, p_rows jsonb, p_complete_ids uuid[], p_completed_at timestamp with time zone, p_delete_ids uuid[]
+)
+RETURNS void
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+  INSERT INTO tasks (title, user_id, description, priority, recurrence, due_date, tags, status, last_completed_at)
+  SELECT r.title, p_user_id, r.description, COALESCE(r.priority, 'medium'), COALESCE(r.recurrence, 'none'), r.due_date,
+         COALESCE(r.tags, '[]'::jsonb), COALESCE(r.status, 'pending'), r.last_completed_at
+  FROM jsonb_to_recordset(COALESCE(p_rows, '[]'::jsonb)) AS r(
+    title text, description text, priority text, recurrence text, due_date timestamp with time zone,
+    tags jsonb, status text, last_completed_at timestamp with time zone
+  );
+
+  UPDATE tasks SET status = 'completed', last_completed_at = p_completed_at
+  WHERE user_id = p_user_id AND id = ANY(p_complete_ids);
+
+  DELETE FROM tasks WHERE user_id = p_user_id AND id = ANY(p_delete_ids);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION apply_task_batch(uuid, jsonb, uuid[], timestamp with time zone, uuid[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_task_batch(uuid, jsonb, uuid[], timestamp with time zone, uuid[]) TO service_role;
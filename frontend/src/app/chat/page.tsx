@@ -195,6 +195,37 @@ const TaskStats = ({ tasks }: { tasks: Task[] }) => {
     );
 };
 
+// Retries reuse one Idempotency-Key, so the backend replays the first result instead of repeating the mutation.
+// A 409 means the first attempt is still running on the server: keep polling with the same key until it
+// finishes, for as long as the backend holds the pending marker (PENDING_TTL, 120 s)
+const PENDING_POLL_MS = 120000;
+// Worst case for dispatch is a fallback through four LLM providers at 10 s each
+const DISPATCH_TIMEOUT_MS = 45000;
+
+const postWithRetry = async (url: string, init: RequestInit, timeoutMs = 15000, retries = 2): Promise<Response> => {
+    const idempotencyKey = crypto.randomUUID();
+    const pollUntil = Date.now() + PENDING_POLL_MS;
+    let failures = 0;
+    for (let attempt = 0; ; attempt++) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), timeoutMs);
+        try {
+            const response = await fetch(url, {
+                ...init,
+                method: "POST",
+                signal: controller.signal,
+                headers: { ...(init.headers as Record<string, string>), "Idempotency-Key": idempotencyKey }
+            });
+            if (response.status !== 409 || Date.now() >= pollUntil) return response;
+        } catch (error) {
+            if (++failures > retries) throw error;
+        } finally {
+            clearTimeout(timer);
+        }
+        await new Promise(resolve => setTimeout(resolve, Math.min(500 * (attempt + 1), 3000)));
+    }
+};
+
 export default function ChatPage() {
     const [user, setUser] = useState<any>(null);
     const [isPending, setIsPending] = useState(true);
@@ -215,6 +246,10 @@ export default function ChatPage() {
     const [input, setInput] = useState("");
     const [isLoading, setIsLoading] = useState(false);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    // Newest conversation turn we already hold; reconnects only fetch turns after it
+    const historyCursorRef = useRef<string | null>(null);
+    // Debounced drafts let the backend start understanding a command before it is sent
+    const prefetchTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
 
     const addToast = (message: string, type: 'success' | 'error' | 'info' = 'success') => {
         const id = Math.random().toString(36).substr(2, 9);
@@ -231,8 +266,7 @@ export default function ChatPage() {
 
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
         try {
-            const response = await fetch(`${apiUrl}/api/agent/tool`, {
-                method: "POST",
+            const response = await postWithRetry(`${apiUrl}/api/agent/tool`, {
                 headers: {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${session.access_token}`
@@ -327,6 +361,7 @@ export default function ChatPage() {
             } else {
                 setUser(session.user);
                 fetchTasks();
+                syncHistory();
             }
             setIsPending(false);
         };
@@ -344,6 +379,98 @@ export default function ChatPage() {
         return () => subscription.unsubscribe();
     }, [router]);
 
+    const syncHistory = async () => {
+        const { data: { session } } = await supabase.auth.getSession();
+        if (!session) return;
+
+        const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+        try {
+            let hasMore = true;
+            while (hasMore) {
+                const cursor = historyCursorRef.current;
+                const query = cursor ? `?since=${encodeURIComponent(cursor)}&limit=100` : "?limit=50";
+                const response = await fetch(`${apiUrl}/api/agent/history${query}`, {
+                    headers: { "Authorization": `Bearer ${session.access_token}` }
+                });
+                if (!response.ok) return;
+
+                const page = await response.json();
+                const turns: Message[] = page.items.flatMap((item: any) => [
+                    { role: "user", content: item.utterance, timestamp: new Date(item.created_at), id: `${item.id}-u` },
+                    { role: "assistant", content: item.agent_response, timestamp: new Date(item.created_at), id: `${item.id}-a` }
+                ]);
+                if (turns.length) {
+                    setMessages(prev => {
+                        const seen = new Set(prev.map(m => m.id));
+                        return [...prev, ...turns.filter(t => !seen.has(t.id))];
+                    });
+                }
+                if (page.since) historyCursorRef.current = page.since;
+                // The first load only needs the latest page; catch-up syncs drain everything new
+                hasMore = Boolean(cursor) && page.has_more;
+            }
+        } catch (error) {
+            console.error("History sync failed", error);
+        }
+    };
+
+    useEffect(() => {
+        const onReconnect = () => {
+            if (document.visibilityState === "visible") syncHistory();
+        };
+        window.addEventListener("online", onReconnect);
+        document.addEventListener("visibilitychange", onReconnect);
+        return () => {
+            window.removeEventListener("online", onReconnect);
+            document.removeEventListener("visibilitychange", onReconnect);
+        };
+    }, []);
+
+    // Due-date reminders pushed by the backend while the page is open
+    useEffect(() => {
+        if (!user) return;
+        const controller = new AbortController();
+        let retry: ReturnType<typeof setTimeout> | null = null;
+
+        const listen = async () => {
+            const { data: { session } } = await supabase.auth.getSession();
+            if (!session || controller.signal.aborted) return;
+            const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+            try {
+                const response = await fetch(`${apiUrl}/api/agent/reminders/stream`, {
+                    headers: { "Authorization": `Bearer ${session.access_token}` },
+                    signal: controller.signal
+                });
+                if (!response.ok || !response.body) throw new Error(`Reminder stream ${response.status}`);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = "";
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split("\n\n");
+                    buffer = events.pop() || "";
+                    for (const block of events) {
+                        const data = block.split("\n").find(line => line.startsWith("data: "));
+                        if (data) addToast(`⏰ Due now: ${JSON.parse(data.slice(6)).title}`, "info");
+                    }
+                }
+            } catch (error) {
+                if (controller.signal.aborted) return;
+                console.error("Reminder stream failed", error);
+            }
+            // Reconnect after a dropped stream (server restart, network change)
+            if (!controller.signal.aborted) retry = setTimeout(listen, 5000);
+        };
+
+        listen();
+        return () => {
+            controller.abort();
+            if (retry) clearTimeout(retry);
+        };
+    }, [user]);
+
     const fetchTasks = async () => {
         const { data, error } = await supabase
             .from('tasks')
@@ -361,8 +488,28 @@ export default function ChatPage() {
         scrollToBottom();
     }, [messages]);
 
+    const schedulePrefetch = (draft: string) => {
+        if (prefetchTimerRef.current) clearTimeout(prefetchTimerRef.current);
+        if (draft.trim().length < 3) return;
+        prefetchTimerRef.current = setTimeout(async () => {
+            const { data: { session } } = await supabase.auth.getSession();
+            if (!session) return;
+            const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+            // Best effort: a failed prefetch only means the send runs the pipeline cold
+            fetch(`${apiUrl}/api/agent/prefetch`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json",
+                    "Authorization": `Bearer ${session.access_token}`
+                },
+                body: JSON.stringify({ utterance: draft })
+            }).catch(() => {});
+        }, 350);
+    };
+
     const sendMessage = async (text: string) => {
         if (!text.trim()) return;
+        if (prefetchTimerRef.current) clearTimeout(prefetchTimerRef.current);
 
         const userMessage: Message = { role: "user", content: text, timestamp: new Date(), id: Date.now().toString() };
         setMessages((prev) => [...prev, userMessage]);
@@ -384,14 +531,13 @@ export default function ChatPage() {
             }
 
             const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-            const response = await fetch(`${apiUrl}/api/agent/dispatch`, {
-                method: "POST",
+            const response = await postWithRetry(`${apiUrl}/api/agent/dispatch`, {
                 headers: {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${session.access_token}`
                 },
                 body: JSON.stringify({ utterance: text })
-            });
+            }, DISPATCH_TIMEOUT_MS);
 
             if (response.status === 401) {
                 setMessages((prev) => [...prev, {
@@ -404,6 +550,18 @@ export default function ChatPage() {
                 return;
             }
 
+            if (response.status === 429) {
+                const retryAfter = response.headers.get("Retry-After") || "a few";
+                setMessages((prev) => [...prev, {
+                    role: "assistant",
+                    content: `Easy, Commander! Too many commands at once. Try again in ${retryAfter} seconds. ⏳`,
+                    timestamp: new Date(),
+                    id: (Date.now() + 1).toString()
+                }]);
+                setIsLoading(false);
+                return;
+            }
+
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({}));
                 throw new Error(errorData.detail || "API call failed");
@@ -412,6 +570,7 @@ export default function ChatPage() {
             const data = await response.json();
 
             if (response.ok) {
+                if (data.history_cursor) historyCursorRef.current = data.history_cursor;
                 setMessages((prev) => [...prev, {
                     role: "assistant",
                     content: data.message,
@@ -450,8 +609,7 @@ export default function ChatPage() {
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
         try {
-            const response = await fetch(`${apiUrl}/api/agent/tool`, {
-                method: "POST",
+            const response = await postWithRetry(`${apiUrl}/api/agent/tool`, {
                 headers: {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${session.access_token}`
@@ -481,8 +639,7 @@ export default function ChatPage() {
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
         try {
-            const response = await fetch(`${apiUrl}/api/agent/tool`, {
-                method: "POST",
+            const response = await postWithRetry(`${apiUrl}/api/agent/tool`, {
                 headers: {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${session.access_token}`
@@ -760,7 +917,7 @@ export default function ChatPage() {
                             <input
                                 type="text"
                                 value={input}
-                                onChange={(e) => setInput(e.target.value)}
+                                onChange={(e) => { setInput(e.target.value); schedulePrefetch(e.target.value); }}
                                 onKeyPress={(e) => e.key === 'Enter' && !e.shiftKey && sendMessage(input)}
                                 placeholder="Type your mission objective..."
                                 disabled={isLoading}